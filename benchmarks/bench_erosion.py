@@ -0,0 +1,76 @@
+"""
+Benchmark for the white matter erosion in checkSNR
+
+Compares skimage's binary_erosion with a dense cubic footprint on the full
+image grid (the previous implementation) to fsqcUtils.binaryErosion, which
+restricts the erosion to the bounding box of the mask and uses a separable
+structuring element. Usage:
+
+    python benchmarks/bench_erosion.py [aparc+aseg.mgz]
+
+If no segmentation is given, a synthetic 256^3 white matter mask is used.
+
+"""
+
+# ------------------------------------------------------------------------------
+# imports
+
+import sys
+import timeit
+import warnings
+
+import numpy as np
+from skimage.morphology import binary_erosion
+
+from fsqc.fsqcUtils import binaryErosion, importLabels
+
+# ------------------------------------------------------------------------------
+# settings
+
+WM_LABELS = [2, 41, 7, 46, 251, 252, 253, 254, 255, 77, 78, 79]
+SIZES = [1, 2, 3, 4, 5]
+REPEATS = 5
+
+# ------------------------------------------------------------------------------
+# main
+
+
+def _syntheticMask():
+    """
+    Create an ellipsoidal 256^3 mask of roughly the extent of a white matter mask.
+    """
+    x, y, z = np.ogrid[:256, :256, :256]
+    return ((x - 128) / 50) ** 2 + ((y - 120) / 45) ** 2 + ((z - 130) / 62) ** 2 < 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        mask = np.isin(importLabels(sys.argv[1]), WM_LABELS)
+    else:
+        mask = _syntheticMask()
+
+    print(f"mask shape: {mask.shape}, voxels: {mask.sum()}")
+    print(f"{'size':>4} {'skimage [s]':>12} {'fsqc [s]':>12} {'speedup':>8}")
+
+    warnings.filterwarnings("ignore", category=FutureWarning)
+
+    for size in SIZES:
+        footprint = np.ones((size, size, size))
+        expected = binary_erosion(mask, footprint)
+        assert np.array_equal(binaryErosion(mask, size), expected)
+
+        t_ref = min(
+            timeit.repeat(
+                lambda: binary_erosion(mask, footprint),  # noqa: B023
+                number=1,
+                repeat=REPEATS,
+            )
+        )
+        t_new = min(
+            timeit.repeat(
+                lambda: binaryErosion(mask, size),  # noqa: B023
+                number=1,
+                repeat=REPEATS,
+            )
+        )
+        print(f"{size:>4} {t_ref:>12.4f} {t_new:>12.4f} {t_ref / t_new:>7.1f}x")
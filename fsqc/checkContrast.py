@@ -86,9 +86,11 @@ def checkContrast(subjects_dir, subject):
     label_array_lh = nibabel.freesurfer.io.read_label(path_label_cortex_lh)
     label_array_rh = nibabel.freesurfer.io.read_label(path_label_cortex_rh)
 
-    # Only take the values of the cortex to compute the contrast control
-    con_lh = numpy.take(con_lh, label_array_lh)
-    con_rh = numpy.take(con_rh, label_array_rh)
+    # Only take the values of the cortex to compute the contrast control; the
+    # mgh files are memory-mapped, so only these values are read and converted
+    # to native byte order
+    con_lh = numpy.take(con_lh, label_array_lh).astype(numpy.float32)
+    con_rh = numpy.take(con_rh, label_array_rh).astype(numpy.float32)
 
     # Compute the Contrast to noise ratio
     con_lh_mean = numpy.mean(con_lh)
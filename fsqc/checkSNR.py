@@ -12,6 +12,7 @@ def checkSNR(
     nb_erode=3,
     ref_image="norm.mgz",
     aparc_image="aparc+aseg.mgz",
+    ref_images=None,
 ):
     """
     A function to check the SNR of the white and gray matter.
@@ -33,9 +34,14 @@ def checkSNR(
         The number of erosions, default is 3.
     ref_image : str, optional
         The reference image, default is "norm.mgz", can be changed to "orig.mgz".
+        Ignored if `ref_images` is given.
     aparc_image : str, optional
         The aparc+aseg image, default is "aparc+aseg.mgz", can
         be changed to "aparc+aseg.orig.mgz" for FastSurfer output.
+    ref_images : list of str, optional
+        A list of reference images, e.g. ["orig.mgz", "norm.mgz"]. If given,
+        the white and gray matter masks are computed only once and are used
+        for all reference images. Default is None.
 
     Returns
     -------
@@ -43,13 +49,17 @@ def checkSNR(
         The signal-to-noise ratio of the white matter.
     gm_snr : float
         The signal-to-noise ratio of the gray matter.
+    snr : list of tuple
+        Only if `ref_images` is given, instead of `wm_snr` and `gm_snr`: a
+        list of (wm_snr, gm_snr) tuples, one for each reference image.
 
     Notes
     -----
     It requires valid mri/norm.mgz, mri/aseg.mgz, and mri/aparc+aseg.mgz files for
     FreeSurfer output, and valid mri/norm.mgz, mri/aseg.mgz, and
     mri/aparc+aseg.orig.mgz files for FastSurfer output.
-    If not found, NaNs will be returned.
+    If not found, NaNs will be returned. If one of several reference images is
+    not found, NaNs will be returned for this image only.
     """
     # Imports
 
@@ -57,96 +67,129 @@ def checkSNR(
     import os
     import warnings
 
-    import nibabel as nib
     import numpy as np
-    from skimage.morphology import binary_erosion
+
+    from fsqc.fsqcCache import importImage
+    from fsqc.fsqcUtils import binaryErosion, importLabels, labelStats
 
     # Settings
 
     logging.captureWarnings(True)
 
-    # Message
-
-    logging.info("Computing white and gray matter SNR for " + ref_image + " ...")
+    if ref_images is None:
+        images = [ref_image]
+    else:
+        images = list(ref_images)
 
     # Get data
 
-    path_reference_image = os.path.join(subjects_dir, subject, "mri", ref_image)
-    if os.path.exists(path_reference_image):
-        norm = nib.load(path_reference_image)
-        norm_data = norm.get_fdata()
-    else:
-        warnings.warn(
-            "WARNING: could not open " + path_reference_image + ", returning NaNs.",
-            stacklevel = 2
-        )
-        return np.nan, np.nan
-
     path_aseg = os.path.join(subjects_dir, subject, "mri", "aseg.mgz")
     if os.path.exists(path_aseg):
-        aseg = nib.load(path_aseg)
-        data_aseg = aseg.get_fdata()
+        data_aseg = importLabels(path_aseg)
     else:
         warnings.warn("WARNING: could not open " + path_aseg + ", returning NaNs.",
             stacklevel = 2)
-        return np.nan, np.nan
+        return _returnSNR([(np.nan, np.nan)] * len(images), ref_images)
 
     path_aparc_aseg = os.path.join(subjects_dir, subject, "mri", aparc_image)
     if os.path.exists(path_aparc_aseg):
-        inseg = nib.load(path_aparc_aseg)
-        data_aparc_aseg = inseg.get_fdata()
+        data_aparc_aseg = importLabels(path_aparc_aseg)
     else:
         warnings.warn(
             "WARNING: could not open " + path_aparc_aseg + ", returning NaNs.",
             stacklevel = 2
         )
-        return np.nan, np.nan
+        return _returnSNR([(np.nan, np.nan)] * len(images), ref_images)
 
     # Process white matter image
 
-    # Create 3D binary data where the white matter locations are encoded with 1, all the others with zero
-    b_wm_data = np.zeros(norm.shape)
-
     # The following keys represent the white matter labels in the aparc+aseg image
     wm_labels = [2, 41, 7, 46, 251, 252, 253, 254, 255, 77, 78, 79]
 
-    # Find the wm labels in the aparc+aseg image and set the locations in the binary image to one
-    for i in wm_labels:
-        x, y, z = np.where(data_aparc_aseg == i)
-        b_wm_data[x, y, z] = 1
-
-    # Erode white matter image
-    nb_erode = nb_erode
-    b_wm_data = binary_erosion(b_wm_data, np.ones((nb_erode, nb_erode, nb_erode)))
+    # Create 3D binary mask of the white matter locations
+    b_wm_data = np.isin(data_aparc_aseg, wm_labels)
 
-    # Computation of the SNR of the white matter
-    x, y, z = np.where(b_wm_data == 1)
-    signal_wm = norm_data[x, y, z]
-    signal_wm_mean = np.mean(signal_wm)
-    signal_wm_std = np.std(signal_wm)
-    wm_snr = signal_wm_mean / signal_wm_std
-    logging.info("White matter signal to noise ratio: " + f"{wm_snr:.4}")
+    # Erode white matter image; the erosion is restricted to the bounding box of
+    # the white matter and uses a separable structuring element
+    b_wm_data = binaryErosion(b_wm_data, nb_erode)
 
     # Process gray matter image
 
-    # Create 3D binary data where the gray matter locations are encoded with 1, all the others with zero
-    b_gm_data = np.zeros(norm.shape)
-
     # The following keys represent the gray matter labels in the aseg image
     gm_labels = [3, 42]
 
-    # Find the gm labels in the aseg image and set the locations in the binary image to one
-    for i in gm_labels:
-        x, y, z = np.where(data_aseg == i)
-        b_gm_data[x, y, z] = 1
+    # Create 3D binary mask of the gray matter locations
+    b_gm_data = np.isin(data_aseg, gm_labels)
+
+    # Combine both masks into a single label volume, such that the statistics
+    # of both tissues are computed in a single pass over each reference image;
+    # voxels that are within both masks get label 3
+    tissue_data = b_wm_data.astype(np.uint8) + 2 * b_gm_data.astype(np.uint8)
+
+    # Compute SNR for each reference image
+
+    snr = list()
+
+    for image in images:
+        # Message
+
+        logging.info("Computing white and gray matter SNR for " + image + " ...")
+
+        path_reference_image = os.path.join(subjects_dir, subject, "mri", image)
+        if os.path.exists(path_reference_image):
+            norm_data = np.asanyarray(importImage(path_reference_image).dataobj)
+        else:
+            warnings.warn(
+                "WARNING: could not open " + path_reference_image + ", returning NaNs.",
+                stacklevel = 2
+            )
+            snr.append((np.nan, np.nan))
+            continue
+
+        stats = labelStats(tissue_data, norm_data, centroids=False, bboxes=False)
+
+        # Computation of the SNR of the white matter
+        wm_snr = _computeSNR(stats, [1, 3])
+        logging.info("White matter signal to noise ratio: " + f"{wm_snr:.4}")
+
+        # Computation of the SNR of the gray matter
+        gm_snr = _computeSNR(stats, [2, 3])
+        logging.info("Gray matter signal to noise ratio: " + f"{gm_snr:.4}")
 
-    # Computation of the SNR of the gray matter
-    x, y, z = np.where(b_gm_data == 1)
-    signal_gm = norm_data[x, y, z]
-    signal_gm_mean = np.mean(signal_gm)
-    signal_gm_std = np.std(signal_gm)
-    gm_snr = signal_gm_mean / signal_gm_std
-    logging.info("Gray matter signal to noise ratio: " + f"{gm_snr:.4}")
+        snr.append((wm_snr, gm_snr))
 
     # Return
-    return wm_snr, gm_snr
+    return _returnSNR(snr, ref_images)
+
+
+# -----------------------------------------------------------------------------
+
+
+def _computeSNR(stats, labels):
+    """
+    Compute the ratio of mean and standard deviation of the intensities within
+    a set of labels from their counts, sums and sums of squares.
+    """
+    import numpy as np
+
+    # labels above the maximum label of the volume are not present
+    labels = [x for x in labels if x < len(stats["count"])]
+
+    count = np.sum(stats["count"][labels])
+    mean = np.sum(stats["sum"][labels]) / count
+    std = np.sqrt(max(np.sum(stats["sumsq"][labels]) / count - mean**2, 0))
+
+    return mean / std
+
+
+# -----------------------------------------------------------------------------
+
+
+def _returnSNR(snr, ref_images):
+    """
+    Return a list of SNR tuples, or a single tuple if called for a single image.
+    """
+    if ref_images is None:
+        return snr[0]
+    else:
+        return snr
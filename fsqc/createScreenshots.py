@@ -3,6 +3,18 @@ This module provides a function to create screenshots
 
 """
 
+# -----------------------------------------------------------------------------
+# imports
+
+import threading
+
+# -----------------------------------------------------------------------------
+# figure templates, which are re-used for screenshots with the same layout,
+# number of panels, figure size, and resolution
+
+_FIGURE_TEMPLATES = dict()
+_FIGURE_TEMPLATES_LOCK = threading.Lock()
+
 # -----------------------------------------------------------------------------
 
 
@@ -22,6 +34,7 @@ def createScreenshots(
     YLIM=None,
     BINARIZE=False,
     ORIENTATION="radiological",
+    ENGINE="matplotlib",
 ):
     """
     Function to create screenshots.
@@ -38,13 +51,14 @@ def createScreenshots(
         Flag for interactive mode, default is True.
     LAYOUT : list, optional
         The layout, default is "default".
-    BASE : str, optional
+    BASE : str or nibabel image, optional
         The base, default is "default".
         Load norm.mgz as default.
-    OVERLAY : str, optional
+        Can be an in-memory image.
+    OVERLAY : str or nibabel image, optional
         The overlay, default is "default".
         Load aseg.mgz as default.
-        Can be None.
+        Can be None or an in-memory image.
     LABELS : None or str, optional
         The labels, default is None.
     SURF : list, optional
@@ -63,6 +77,9 @@ def createScreenshots(
         Flag for binarization, default is False.
     ORIENTATION : str, optional
         The orientation, default is "radiological".
+    ENGINE : str, optional
+        The engine, default is "matplotlib".
+        Can be "matplotlib" or "raster".
 
     Notes
     -----
@@ -73,6 +90,13 @@ def createScreenshots(
     XLIM, YLIM can be lists of list two-element numeric lists or None; if given,
     length must match length of VIEWS. x and y refer to final image dimensions,
     not MR volume dimensions.
+
+    The "raster" engine composites the panels in numpy and writes the image
+    with PIL, without using matplotlib. It supports the same VIEWS, LAYOUT,
+    ORIENTATION, XLIM, and YLIM, but images are sampled by nearest neighbor
+    interpolation, and SURFCOLOR must be given as color names or hex strings
+    that PIL understands. In interactive mode, the image is shown with the
+    default image viewer.
     """
     # -----------------------------------------------------------------------------
     # auxiliary functions
@@ -89,20 +113,20 @@ def createScreenshots(
     # -----------------------------------------------------------------------------
     # imports
 
+    import contextlib
     import logging
     import os
     import warnings
 
-    import matplotlib
     import nibabel as nb
     import numpy as np
 
-    if not INTERACTIVE:
-        matplotlib.use("Agg")
-
-    from matplotlib import pyplot as plt
-
-    from fsqc.fsqcUtils import levelsetsTria, returnFreeSurferColorLUT
+    from fsqc.fsqcCache import importHeader, importRegion
+    from fsqc.fsqcUtils import (
+        chainLevelsets,
+        levelsetsTriaMulti,
+        returnColorLUT,
+    )
 
     # -----------------------------------------------------------------------------
     # settings
@@ -115,22 +139,28 @@ def createScreenshots(
 
     ALPHA = 0.5
 
-    tol = 1e-16
+    if ENGINE != "matplotlib" and ENGINE != "raster":
+        raise ValueError(
+            "ERROR: screenshot engine must be either 'matplotlib' or 'raster'."
+        )
 
     # -----------------------------------------------------------------------------
-    # import image data
+    # import image headers; image data is only read for the slices that are
+    # shown (see below)
 
     if BASE == "default":
-        norm = nb.load(os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "norm.mgz"))
+        normFile = os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "norm.mgz")
     else:
-        norm = nb.load(BASE)
+        normFile = BASE
+
+    normHeader = importHeader(normFile)
 
     if OVERLAY is None:
-        aseg = None
+        asegFile = None
     elif OVERLAY == "default":
-        aseg = nb.load(os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "aseg.mgz"))
+        asegFile = os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "aseg.mgz")
     else:
-        aseg = nb.load(OVERLAY)
+        asegFile = OVERLAY
 
     # -----------------------------------------------------------------------------
     # import surface data
@@ -161,59 +191,14 @@ def createScreenshots(
             surf.append(nb.freesurfer.io.read_geometry(surflist[i], read_metadata=True))
 
     # -----------------------------------------------------------------------------
-    # import colortable, compute auxiliary variables, and transform to matplotlib
-    # colortable
-
-    lut = returnFreeSurferColorLUT()
-
-    # some fs7 labels are not present in fs6 LUT, check and add if necessary
-
-    if not (
-        np.isin(
-            list(range(231, 247)) + [801, 802, 803, 804, 805, 806, 807, 808, 809, 810],
-            lut[:, 0],
-        ).all()
-    ):
-        lutAdd = np.array(
-            (
-                [801, "L_hypothalamus_anterior_inferior", 250, 255, 50, 0],
-                [802, "L_hypothalamus_anterior_superior", 80, 200, 255, 0],
-                [803, "L_hypothalamus_posterior", 255, 160, 0, 0],
-                [804, "L_hypothalamus_tubular_inferior", 255, 160, 200, 0],
-                [805, "L_hypothalamus_tubular_superior", 20, 180, 130, 0],
-                [806, "R_hypothalamus_anterior_inferior", 250, 255, 50, 0],
-                [807, "R_hypothalamus_anterior_superior", 80, 200, 255, 0],
-                [808, "R_hypothalamus_posterior", 255, 160, 0, 0],
-                [809, "R_hypothalamus_tubular_inferior", 255, 160, 200, 0],
-                [810, "R_hypothalamus_tubular_superior", 20, 180, 130, 0],
-                [231, "HP_body", 0, 255, 0, 0],
-                [232, "HP_head", 255, 0, 0, 0],
-                [233, "presubiculum-head", 32, 0, 32, 0],
-                [234, "presubiculum-body", 64, 0, 64, 0],
-                [235, "subiculum-head", 0, 0, 175, 0],
-                [236, "subiculum-body", 0, 0, 255, 0],
-                [237, "CA1-head", 175, 75, 75, 0],
-                [238, "CA1-body", 255, 0, 0, 0],
-                [239, "CA3-head", 0, 80, 0, 0],
-                [240, "CA3-body", 0, 128, 0, 0],
-                [241, "CA4-head", 120, 90, 50, 0],
-                [242, "CA4-body", 196, 160, 128, 0],
-                [243, "GC-ML-DG-head", 75, 125, 175, 0],
-                [244, "GC-ML-DG-body", 32, 200, 255, 0],
-                [245, "molecular_layer_HP-head", 100, 25, 25, 0],
-                [246, "molecular_layer_HP-body", 128, 0, 0, 0],
-            ),
-            dtype=object,
-        )
-
-        lut = np.concatenate((lut, lutAdd), axis=0)
+    # get colortable, which is shared across calls: a table of label ids and
+    # RGBA colors, and a dense index from label values to rows of the table
 
-    lutEnum = dict(zip(lut[:, 0], range(len(lut[:, 0]))))
+    lut = returnColorLUT()
 
-    lutTab = np.array(lut[:, (2, 3, 4, 5)] / 255, dtype="float32")
-    lutTab[:, 3] = 1
+    lutIndex = lut["index"]
 
-    lutMap = matplotlib.colors.ListedColormap(lutTab)
+    lutTab = lut["table"]["rgba"]
 
     # -----------------------------------------------------------------------------
     # determine VIEWS
@@ -221,24 +206,26 @@ def createScreenshots(
     if VIEWS == "default":
         CutsRRAS = [("x", -10), ("x", 10), ("y", 0), ("z", 0)]
     else:
-        CutsRRAS = VIEWS
+        # copy, since views are moved to the nearest slice below, and the
+        # list may be shared with concurrent calls
+        CutsRRAS = list(VIEWS)
 
     # -----------------------------------------------------------------------------
     # check if the chosen VIEWS are feasible. If not feasible changing to the nearest feasible values
 
-    m = norm.header.get_vox2ras_tkr()
-    n = norm.header.get_data_shape()
+    m = normHeader.get_vox2ras_tkr()
+    n = normHeader.get_data_shape()
 
-    xyzIdx = np.array(
-        np.meshgrid(
-            np.linspace(0, n[0] - 1, n[0]),
-            np.linspace(0, n[1] - 1, n[1]),
-            np.linspace(0, n[2] - 1, n[2]),
-        )
-    )
-    xyzIdxFlat3 = np.reshape(xyzIdx, (3, np.prod(n))).transpose()
-    xyzIdxFlat4 = np.hstack((xyzIdxFlat3, np.ones((np.prod(n), 1))))
-    rasIdxFlat3 = np.matmul(m, xyzIdxFlat4.transpose()).transpose()[:, 0:3]
+    # tkr RAS coordinates of the first and the last voxel, which determine the
+    # extent of the panels
+    rasCorners = np.matmul(
+        m, np.array([[0, 0, 0, 1], [n[0] - 1, n[1] - 1, n[2] - 1, 1]]).transpose()
+    ).transpose()[:, 0:3]
+
+    # for each view, determine the voxel dimension and the index of the slice;
+    # since the (TkReg) RAS system is solely based on switching dimensions,
+    # each RAS axis corresponds to exactly one voxel dimension
+    CutsIdx = list()
 
     for i, icr in enumerate(CutsRRAS):
         if icr[0] == "x":
@@ -248,16 +235,26 @@ def createScreenshots(
         elif icr[0] == "z":
             iDim = 2
 
-        if not np.any(rasIdxFlat3[:, iDim] == icr[1]):
-            closestCutValue = rasIdxFlat3[
-                np.abs(rasIdxFlat3[:, iDim] - icr[1]).argmin(), iDim
-            ]
+        vDim = np.flatnonzero(m[iDim, 0:3])
+        if len(vDim) != 1:
+            raise ValueError(
+                "ERROR: the voxel axes of the base image are not aligned with the RAS axes"
+            )
+        vDim = vDim[0]
+
+        # RAS coordinates of all slices along this dimension
+        rasCuts = m[iDim, vDim] * np.arange(n[vDim]) + m[iDim, 3]
+
+        if not np.any(rasCuts == icr[1]):
+            closestCutValue = rasCuts[np.abs(rasCuts - icr[1]).argmin()]
             logging.info(
                 f"INFO: the VIEW {icr} will be changed to ('{icr[0]}', {closestCutValue:.2f}) so it is not"
                 " necessary to interpolate volumetric data"
             )
             CutsRRAS[i] = (icr[0], closestCutValue)
 
+        CutsIdx.append((vDim, np.flatnonzero(rasCuts == CutsRRAS[i][1])[0]))
+
     # -----------------------------------------------------------------------------
     # compute levelsets
 
@@ -265,51 +262,27 @@ def createScreenshots(
 
     # will not run if surf is empty (intended)
     for s in range(len(surf)):
-        sLVL = list()
+        sLVL = [None] * len(CutsRRAS)
+
+        # compute the levelsets of all views along the same dimension at once
+        for iDim, iDimName in enumerate(["x", "y", "z"]):
+            iViews = [i for i in range(len(CutsRRAS)) if CutsRRAS[i][0] == iDimName]
 
-        for i in range(len(CutsRRAS)):
-            # determine dimension
-            if CutsRRAS[i][0] == "x":
-                iDim = 0
-            elif CutsRRAS[i][0] == "y":
-                iDim = 1
-            elif CutsRRAS[i][0] == "z":
-                iDim = 2
+            if len(iViews) == 0:
+                continue
 
             # compute levelsets: e.g., LVL[SURF][VIEWS][vLVL|tLVL|iLVL][0][elementDim1][elementDim2]
-            sLVL.append(
-                levelsetsTria(
-                    surf[s][0], surf[s][1], surf[s][0][:, iDim], CutsRRAS[i][1]
-                )
+            iLVL = levelsetsTriaMulti(
+                surf[s][0],
+                surf[s][1],
+                surf[s][0][:, iDim],
+                [CutsRRAS[i][1] for i in iViews],
             )
 
-        LVL.append(sLVL)
-
-    # -----------------------------------------------------------------------------
-    # get data for norm
-
-    normData = norm.get_fdata()
+            for i, lvl in zip(iViews, iLVL):
+                sLVL[i] = lvl
 
-    normVals = normData
-
-    # -----------------------------------------------------------------------------
-    # get data for aseg and change to enumerated aseg so that it can be used as
-    # index to lutMap
-
-    if aseg is not None:
-        asegData = aseg.get_fdata()
-
-        if LABELS is not None:
-            asegData = asegData * np.isin(asegData, LABELS)
-
-        if BINARIZE is True:
-            asegData = (asegData > 0).astype(int)
-
-        asegUnique, asegIdx = np.unique(asegData, return_inverse=True)
-
-        asegEnum = np.array([lutEnum[x] for x in asegUnique])
-
-        asegVals = np.reshape(asegEnum[asegIdx], (aseg.shape))
+        LVL.append(sLVL)
 
     # -----------------------------------------------------------------------------
     # compile image data for plotting
@@ -326,59 +299,53 @@ def createScreenshots(
     # x_S y_S z_S c_S
     #   0   0   0   1
 
-    # m = norm.header.get_vox2ras_tkr()
-    # n = norm.header.get_data_shape()
-
-    # xyzIdx = np.array(np.meshgrid(np.linspace(0, n[0] - 1, n[0]), np.linspace(0, n[1] - 1, n[1]), np.linspace(0, n[2] - 1, n[2])))
-    # xyzIdxFlat3 = np.reshape(xyzIdx, (3, np.prod(n))).transpose()
-    # xyzIdxFlat4 = np.hstack((xyzIdxFlat3, np.ones((np.prod(n), 1))))
-    # rasIdxFlat3 = np.matmul(m, xyzIdxFlat4.transpose()).transpose()[:, 0:3]
-
     normValsRAS = list()
-    if aseg is not None:
+    if asegFile is not None:
         asegValsRAS = list()
 
     for i in range(len(CutsRRAS)):
-        # determine dimension
-        if CutsRRAS[i][0] == "x":
-            iDim = 0
-        elif CutsRRAS[i][0] == "y":
-            iDim = 1
-        elif CutsRRAS[i][0] == "z":
-            iDim = 2
+        # get region of the slice
+        region = [slice(0, n[0]), slice(0, n[1]), slice(0, n[2])]
+        region[CutsIdx[i][0]] = slice(CutsIdx[i][1], CutsIdx[i][1] + 1)
+        region = tuple(region)
 
-        sel = np.array(
-            xyzIdxFlat3[rasIdxFlat3[:, iDim] == CutsRRAS[i][1], :], dtype="int"
-        )
+        # get data for norm
         normValsRAS.append(
-            np.squeeze(
-                normVals[
-                    np.min(sel[:, 0]) : np.max(sel[:, 0]) + 1,
-                    np.min(sel[:, 1]) : np.max(sel[:, 1]) + 1,
-                    np.min(sel[:, 2]) : np.max(sel[:, 2]) + 1,
-                ]
-            )
+            np.squeeze(importRegion(normFile, region).astype(np.float64))
         )
-        if aseg is not None:
-            asegValsRAS.append(
-                np.squeeze(
-                    asegVals[
-                        np.min(sel[:, 0]) : np.max(sel[:, 0]) + 1,
-                        np.min(sel[:, 1]) : np.max(sel[:, 1]) + 1,
-                        np.min(sel[:, 2]) : np.max(sel[:, 2]) + 1,
-                    ]
-                )
+
+        # get data for aseg and map label values of the slice to rows of the
+        # colortable, so that it can be used as index to lutMap; overlays are
+        # label volumes, which we keep in their native data type
+        if asegFile is not None:
+            asegData = np.squeeze(importRegion(asegFile, region))
+
+            if LABELS is not None:
+                asegData = asegData * np.isin(asegData, LABELS)
+
+            if BINARIZE is True:
+                asegData = (asegData > 0).astype(int)
+
+            asegLabels = asegData.astype(np.int64)
+            asegValid = (
+                (asegLabels == asegData)
+                & (asegLabels >= 0)
+                & (asegLabels < len(lutIndex))
             )
+            asegEnum = lutIndex[np.where(asegValid, asegLabels, 0)]
 
-    # -----------------------------------------------------------------------------
-    # plotting: create a new figure, plot into it, then close it so it never gets
-    # displayed
+            if not np.all(asegValid & (asegEnum >= 0)):
+                raise ValueError(
+                    "ERROR: the overlay image contains values that are not in the "
+                    + "colortable: "
+                    + str(np.unique(asegData[~(asegValid & (asegEnum >= 0))]))
+                )
 
-    # turn interactive plotting off unless interactive
-    if not INTERACTIVE:
-        plt.ioff()
+            asegValsRAS.append(asegEnum)
 
+    # -----------------------------------------------------------------------------
     # compute layout
+
     if LAYOUT == "default":
         myLayout = computeLayout(len(CutsRRAS))
     else:
@@ -390,318 +357,387 @@ def createScreenshots(
         for axsy in range(myLayout[1]):
             myLayoutList.append((axsx, axsy))
 
-    # create subplots
-    fig, axs = plt.subplots(myLayout[0], myLayout[1])
-    axs = np.reshape(axs, myLayout)
-
-    # adjust layout
-    fig.set_size_inches([FIGSIZE * myLayout[1], FIGSIZE * myLayout[0]])
-    fig.set_dpi(FIGDPI)
-    fig.set_facecolor("black")
-    fig.set_tight_layout({"pad": 0})
-    fig.subplots_adjust(wspace=0)
-
     # -----------------------------------------------------------------------------
-    # plot each panel
+    # compile panels: images, extent, axis limits, and surface lines in TkReg
+    # RAS coordinates
 
-    for p in range(len(CutsRRAS)):
-        logging.info("Panel " + str(p))
-
-        axsx = myLayoutList[p][0]
-        axsy = myLayoutList[p][1]
+    panels = list()
 
+    for p in range(len(CutsRRAS)):
         # determine dimensions
         if CutsRRAS[p][0] == "x":
             # x axis of the image should be towards anterior, y axis should be towards superior in RAS image
             dims = (1, 2)
-            # determine extent
-            extent = (
-                rasIdxFlat3[0, dims[0]],
-                rasIdxFlat3[-1, dims[0]],
-                rasIdxFlat3[0, dims[1]],
-                rasIdxFlat3[-1, dims[1]],
-            )
-            # imshow puts the first dimension (rows) of the data on the y axis, and the second (columns) on the x axis
-            cor = np.where(m[dims[0], 0:3])[0]
-            axi = np.where(m[dims[1], 0:3])[0]
-            #
-            if axi < cor:
-                axs[axsx, axsy].imshow(
-                    normValsRAS[p], cmap="gray", origin="lower", extent=extent
-                )
-                if aseg is not None:
-                    axs[axsx, axsy].imshow(
-                        asegValsRAS[p] + 0.5,
-                        cmap=lutMap,
-                        origin="lower",
-                        extent=extent,
-                        vmin=0,
-                        vmax=len(lutTab),
-                        alpha=ALPHA,
-                    )
-            else:
-                axs[axsx, axsy].imshow(
-                    normValsRAS[p].transpose(),
-                    cmap="gray",
-                    origin="lower",
-                    extent=extent,
-                )
-                if aseg is not None:
-                    axs[axsx, axsy].imshow(
-                        asegValsRAS[p].transpose() + 0.5,
-                        cmap=lutMap,
-                        origin="lower",
-                        extent=extent,
-                        vmin=0,
-                        vmax=len(lutTab),
-                        alpha=ALPHA,
-                    )
         elif CutsRRAS[p][0] == "y":
             # x axis of the image should be towards right, y axis should be towards superior in RAS image
             dims = (0, 2)
-            # determine extent
-            extent = (
-                rasIdxFlat3[0, dims[0]],
-                rasIdxFlat3[-1, dims[0]],
-                rasIdxFlat3[0, dims[1]],
-                rasIdxFlat3[-1, dims[1]],
-            )
-            # imshow puts the first dimension (rows) of the data on the y axis, and the second (columns) on the x axis
-            sag = np.where(m[dims[0], 0:3])[0]
-            axi = np.where(m[dims[1], 0:3])[0]
-            #
-            if axi < sag:
-                axs[axsx, axsy].imshow(
-                    normValsRAS[p], cmap="gray", origin="lower", extent=extent
-                )
-                if aseg is not None:
-                    axs[axsx, axsy].imshow(
-                        asegValsRAS[p] + 0.5,
-                        cmap=lutMap,
-                        origin="lower",
-                        extent=extent,
-                        vmin=0,
-                        vmax=len(lutTab),
-                        alpha=ALPHA,
-                    )
-            else:
-                axs[axsx, axsy].imshow(
-                    normValsRAS[p].transpose(),
-                    cmap="gray",
-                    origin="lower",
-                    extent=extent,
-                )
-                if aseg is not None:
-                    axs[axsx, axsy].imshow(
-                        asegValsRAS[p].transpose() + 0.5,
-                        cmap=lutMap,
-                        origin="lower",
-                        extent=extent,
-                        vmin=0,
-                        vmax=len(lutTab),
-                        alpha=ALPHA,
-                    )
         elif CutsRRAS[p][0] == "z":
             # x axis of the image should be towards right, y axis should be towards anterior in RAS image
             dims = (0, 1)
-            # determine extent
-            extent = (
-                rasIdxFlat3[0, dims[0]],
-                rasIdxFlat3[-1, dims[0]],
-                rasIdxFlat3[0, dims[1]],
-                rasIdxFlat3[-1, dims[1]],
-            )
-            # imshow puts the first dimension (rows) of the data on the y axis, and the second (columns) on the x axis
-            sag = np.where(m[dims[0], 0:3])[0]
-            cor = np.where(m[dims[1], 0:3])[0]
-            if cor < sag:
-                axs[axsx, axsy].imshow(
-                    normValsRAS[p], cmap="gray", origin="lower", extent=extent
-                )
-                if aseg is not None:
-                    axs[axsx, axsy].imshow(
-                        asegValsRAS[p] + 0.5,
-                        cmap=lutMap,
-                        origin="lower",
-                        extent=extent,
-                        vmin=0,
-                        vmax=len(lutTab),
-                        alpha=ALPHA,
-                    )
-            else:
-                axs[axsx, axsy].imshow(
-                    normValsRAS[p].transpose(),
-                    cmap="gray",
-                    origin="lower",
-                    extent=extent,
-                )
-                if aseg is not None:
-                    axs[axsx, axsy].imshow(
-                        asegValsRAS[p].transpose() + 0.5,
-                        cmap=lutMap,
-                        origin="lower",
-                        extent=extent,
-                        vmin=0,
-                        vmax=len(lutTab),
-                        alpha=ALPHA,
-                    )
 
-        # prepare plot
-        if rasIdxFlat3[0, dims[0]] > rasIdxFlat3[-1, dims[0]]:
-            axs[axsx, axsy].invert_xaxis()
-        if rasIdxFlat3[0, dims[1]] > rasIdxFlat3[-1, dims[1]]:
-            axs[axsx, axsy].invert_yaxis()
+        # determine extent
+        extent = (
+            rasCorners[0, dims[0]],
+            rasCorners[-1, dims[0]],
+            rasCorners[0, dims[1]],
+            rasCorners[-1, dims[1]],
+        )
 
-        axs[axsx, axsy].set_axis_off()
-        axs[axsx, axsy].set_aspect("equal")
+        # images are shown with the first dimension (rows) of the data on the
+        # y axis, and the second (columns) on the x axis
+        baseVals = normValsRAS[p]
+        overlayVals = asegValsRAS[p] if asegFile is not None else None
+        if not np.where(m[dims[1], 0:3])[0] < np.where(m[dims[0], 0:3])[0]:
+            baseVals = baseVals.transpose()
+            if overlayVals is not None:
+                overlayVals = overlayVals.transpose()
+
+        # determine axis limits: images are shown with their extent, then
+        # axes are inverted if necessary, unless limits are given
+        xlim = [extent[0], extent[1]]
+        ylim = [extent[2], extent[3]]
+
+        if rasCorners[0, dims[0]] > rasCorners[-1, dims[0]]:
+            xlim = xlim[::-1]
+        if rasCorners[0, dims[1]] > rasCorners[-1, dims[1]]:
+            ylim = ylim[::-1]
 
         if XLIM is not None:
-            axs[axsx, axsy].set_xlim(XLIM[p])
+            xlim = list(XLIM[p])
 
         if YLIM is not None:
-            axs[axsx, axsy].set_ylim(YLIM[p])
+            ylim = list(YLIM[p])
 
         # determine left-right orientation for coronal and axial views
         if ORIENTATION == "radiological":
             if CutsRRAS[p][0] == "y" or CutsRRAS[p][0] == "z":
-                axs[axsx, axsy].invert_xaxis()
+                xlim = xlim[::-1]
 
-        # now plot
+        # get line segments of each surface
+        lines = list()
         for s in range(len(surf)):
             if len(LVL[s][p][0][0]) > 0:
-                logging.info("Surface " + str(s))
-
-                # create array of line segments
-                tmpx = list()
-                tmpy = list()
-
-                for i in range(len(LVL[s][p][1][0])):
-                    tmpx.append(
-                        (
-                            LVL[s][p][0][0][LVL[s][p][1][0][i][0] - 1][dims[0]],
-                            LVL[s][p][0][0][LVL[s][p][1][0][i][1] - 1][dims[0]],
-                        )
-                    )
-                    tmpy.append(
-                        (
-                            LVL[s][p][0][0][LVL[s][p][1][0][i][0] - 1][dims[1]],
-                            LVL[s][p][0][0][LVL[s][p][1][0][i][1] - 1][dims[1]],
-                        )
+                # chain line segments into polylines via their shared points
+                chains, diagnostics = chainLevelsets(
+                    LVL[s][p][1][0], points=LVL[s][p][0][0]
+                )
+
+                if diagnostics["open"] > 0 or diagnostics["junctions"] > 0:
+                    warnings.warn(
+                        "WARNING: a problem occurred with the surface overlays: "
+                        + f"surface {s}, panel {p}, "
+                        + ", ".join([f"{k}: {v}" for k, v in diagnostics.items()]),
+                        stacklevel=2,
                     )
 
-                tmpx = np.array(tmpx)
-                tmpy = np.array(tmpy)
+                lvlPoints = np.array(LVL[s][p][0][0])[:, dims]
+                lines.append(([lvlPoints[x - 1, :] for x in chains], surfcolor[s]))
+
+        panels.append(
+            {
+                "base": baseVals,
+                "overlay": overlayVals,
+                "extent": extent,
+                "xlim": xlim,
+                "ylim": ylim,
+                "lines": lines,
+            }
+        )
 
-                # remove duplicate points
-                tmpxy = np.unique(np.concatenate((tmpx, tmpy), axis=1), axis=0)
-                tmpx = tmpxy[:, 0:2]
-                tmpy = tmpxy[:, 2:4]
+    # -----------------------------------------------------------------------------
+    # raster engine: composite the panels directly in numpy and write the image
+
+    if ENGINE == "raster":
+        logging.info("Compositing " + str(len(panels)) + " panels")
+
+        _compositePanels(
+            panels,
+            myLayout,
+            None if INTERACTIVE else OUTFILE,
+            lutTab,
+            ALPHA,
+            FIGSIZE * FIGDPI,
+            max(1, round(np.round(FIGSIZE / 8) * FIGDPI / 72)),
+        )
 
-                # remove segments which are de-facto points
-                tmpIdx = np.logical_or(
-                    np.abs(tmpx[:, 0] - tmpx[:, 1]) > tol,
-                    np.abs(tmpy[:, 0] - tmpy[:, 1]) > tol,
-                )
-                tmpx = tmpx[tmpIdx, :]
-                tmpy = tmpy[tmpIdx, :]
-
-                # need to order array of line segments; whenever we encounter a
-                # closed loop, we will already plot; otherwise, plot in the end
-                sortIdx = np.array(range(0, len(tmpx)))
-
-                tmpxSort = np.array(tmpx[sortIdx[0],], ndmin=2)
-                tmpySort = np.array(tmpy[sortIdx[0],], ndmin=2)
-
-                sortIdx = np.delete(sortIdx, sortIdx[0])
-
-                while len(sortIdx) > 1:
-                    findIdx = np.array(
-                        np.where(
-                            np.logical_and(
-                                np.abs(
-                                    tmpx[sortIdx,] - tmpxSort[tmpxSort.shape[0] - 1, 1]
-                                )
-                                < tol,
-                                np.abs(
-                                    tmpy[sortIdx,] - tmpySort[tmpySort.shape[0] - 1, 1]
-                                )
-                                < tol,
-                            )
-                        ),
-                        ndmin=2,
-                    ).T
-
-                    # delete existing finds
-                    findIdxKeep = list()
-                    for k in range(findIdx.shape[0]):
-                        if not np.any(
-                            np.all(
-                                np.logical_or(
-                                    tmpx[sortIdx[findIdx[k, 0]], 0] == tmpxSort,
-                                    tmpx[sortIdx[findIdx[k, 0]], 1] == tmpxSort,
-                                ),
-                                axis=1,
-                            )
-                        ):
-                            findIdxKeep.append(k)
-                    findIdx = findIdx[findIdxKeep,]
-
-                    if findIdx.shape[0] == 0:
-                        # close loop and plot already
-                        axs[axsx, axsy].plot(
-                            tmpxSort,
-                            tmpySort,
-                            color=surfcolor[s],
-                            linewidth=np.round(FIGSIZE / 8),
-                        )
-                        # reset (start new loop)
-                        tmpxSort = np.array(tmpx[sortIdx[0],], ndmin=2)
-                        tmpySort = np.array(tmpy[sortIdx[0],], ndmin=2)
-                        sortIdx = np.delete(sortIdx, 0)
-                    elif findIdx.shape[0] == 1:
-                        # add to current set
-                        if findIdx[0, 1] == 0:
-                            tmpxSort = np.append(
-                                tmpxSort,
-                                np.array(tmpx[sortIdx[findIdx[0, 0]], ::1], ndmin=2),
-                                axis=0,
-                            )
-                            tmpySort = np.append(
-                                tmpySort,
-                                np.array(tmpy[sortIdx[findIdx[0, 0]], ::1], ndmin=2),
-                                axis=0,
-                            )
-                        elif findIdx[0, 1] == 1:
-                            tmpxSort = np.append(
-                                tmpxSort,
-                                np.array(tmpx[sortIdx[findIdx[0, 0]], ::-1], ndmin=2),
-                                axis=0,
-                            )
-                            tmpySort = np.append(
-                                tmpySort,
-                                np.array(tmpy[sortIdx[findIdx[0, 0]], ::-1], ndmin=2),
-                                axis=0,
-                            )
-                        sortIdx = np.delete(sortIdx, findIdx[0, 0])
-                    elif findIdx.shape[0] > 1:
-                        warnings.warn(
-                            "WARNING: a problem occurred with the surface overlays",
-                            stacklevel = 2
-                        )
-                # now final plot
-                axs[axsx, axsy].plot(
-                    tmpxSort,
-                    tmpySort,
-                    color=surfcolor[s],
-                    linewidth=np.round(FIGSIZE / 8),
-                )
+        return
 
     # -----------------------------------------------------------------------------
-    # output
+    # plotting: unless interactive, re-use a figure template with the same
+    # layout and draw directly onto its Agg canvas, so the figure never gets
+    # displayed
 
-    if not INTERACTIVE:
-        plt.savefig(OUTFILE, facecolor=fig.get_facecolor())
-        plt.close(fig)
+    from fsqc.fsqcUtils import returnColorLUTColormap
 
-    # -----------------------------------------------------------------------------
-    #
+    lutMap = returnColorLUTColormap()
+
+    # get figure; templates are locked while in use, because they are shared
+    # across threads
+    if INTERACTIVE:
+        template = _createFigureTemplate(myLayout, FIGSIZE, FIGDPI, INTERACTIVE)
+        templateLock = contextlib.nullcontext()
+    else:
+        # unused panels are left as they are in a new figure, hence the
+        # number of panels is part of the key; clearing the axes of unused
+        # panels would change the tight layout
+        templateKey = (tuple(myLayout), len(CutsRRAS), FIGSIZE, FIGDPI)
+        with _FIGURE_TEMPLATES_LOCK:
+            template = _FIGURE_TEMPLATES.get(templateKey)
+            if template is None:
+                template = _createFigureTemplate(myLayout, FIGSIZE, FIGDPI, INTERACTIVE)
+                _FIGURE_TEMPLATES[templateKey] = template
+        templateLock = template["lock"]
+
+    with templateLock:
+        fig = template["figure"]
+
+        # plot each panel; overlay values are shifted to the centers of the
+        # colormap bins
+        for p, panel in enumerate(panels):
+            logging.info("Panel " + str(p))
+
+            _updatePanel(
+                template,
+                myLayoutList[p][0],
+                myLayoutList[p][1],
+                panel["base"],
+                panel["overlay"] + 0.5 if panel["overlay"] is not None else None,
+                panel["extent"],
+                panel["xlim"],
+                panel["ylim"],
+                panel["lines"],
+                lutMap,
+                len(lutTab),
+                ALPHA,
+                np.round(FIGSIZE / 8),
+            )
+
+        # -------------------------------------------------------------------------
+        # output
+
+        if not INTERACTIVE:
+            fig.subplots_adjust(**template["subplotpars"])
+            fig.savefig(OUTFILE, facecolor=fig.get_facecolor())
+
+
+# -----------------------------------------------------------------------------
+# figure templates
+
+
+def _createFigureTemplate(layout, figsize, dpi, interactive):
+    """
+    Create a figure with a grid of axes. Non-interactive figures are drawn on
+    an Agg canvas, without pyplot.
+    """
+    import threading
+
+    import numpy as np
+
+    if interactive:
+        from matplotlib import pyplot as plt
+
+        fig, axs = plt.subplots(layout[0], layout[1])
+    else:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        axs = fig.subplots(layout[0], layout[1])
+
+    axs = np.reshape(axs, layout)
+
+    # adjust layout
+    fig.set_size_inches([figsize * layout[1], figsize * layout[0]])
+    fig.set_dpi(dpi)
+    fig.set_facecolor("black")
+    fig.set_tight_layout({"pad": 0})
+    fig.subplots_adjust(wspace=0)
+
+    # panels hold the artists of each axes once they have been used; the
+    # subplot parameters are kept, because the tight layout is computed
+    # relative to the current axes positions whenever the figure is drawn
+    return {
+        "figure": fig,
+        "axes": axs,
+        "subplotpars": vars(fig.subplotpars).copy(),
+        "panels": [[None] * layout[1] for _ in range(layout[0])],
+        "lock": threading.Lock(),
+    }
+
+
+def _updatePanel(
+    template,
+    axsx,
+    axsy,
+    base,
+    overlay,
+    extent,
+    xlim,
+    ylim,
+    lines,
+    cmap,
+    vmax,
+    alpha,
+    linewidth,
+):
+    """
+    Show images and lines in a panel of a figure template, re-using the
+    artists of previous screenshots where possible.
+    """
+    import numpy as np
+    from matplotlib.collections import LineCollection
+
+    ax = template["axes"][axsx, axsy]
+    panel = template["panels"][axsx][axsy]
+
+    if panel is None:
+        ax.set_axis_off()
+        ax.set_aspect("equal")
+        panel = {"base": None, "overlay": None, "lines": list()}
+        template["panels"][axsx][axsy] = panel
+
+    # base image, scaled to its range of values
+    if panel["base"] is None:
+        panel["base"] = ax.imshow(base, cmap="gray", origin="lower", extent=extent)
+    else:
+        panel["base"].set_data(base)
+        panel["base"].set_extent(extent)
+        panel["base"].set_clim(np.min(base), np.max(base))
+
+    # overlay image
+    if overlay is not None:
+        if panel["overlay"] is None:
+            panel["overlay"] = ax.imshow(
+                overlay,
+                cmap=cmap,
+                origin="lower",
+                extent=extent,
+                vmin=0,
+                vmax=vmax,
+                alpha=alpha,
+            )
+        else:
+            panel["overlay"].set_data(overlay)
+            panel["overlay"].set_extent(extent)
+            panel["overlay"].set_cmap(cmap)
+            panel["overlay"].set_clim(0, vmax)
+            panel["overlay"].set_alpha(alpha)
+    if panel["overlay"] is not None:
+        panel["overlay"].set_visible(overlay is not None)
+
+    # axis limits
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+
+    # lines; one collection per surface
+    for i, (segments, color) in enumerate(lines):
+        if i == len(panel["lines"]):
+            panel["lines"].append(
+                ax.add_collection(LineCollection([], linewidth=linewidth))
+            )
+        panel["lines"][i].set_segments(segments)
+        panel["lines"][i].set_color(color)
+        panel["lines"][i].set_visible(True)
+    for i in range(len(lines), len(panel["lines"])):
+        panel["lines"][i].set_visible(False)
+
+
+# -----------------------------------------------------------------------------
+# raster engine
+
+
+def _compositePanels(panels, layout, outfile, lut, alpha, size, linewidth):
+    """
+    Composite panels into an image of size x size pixel tiles, and write it to
+    outfile, or show it if outfile is None.
+    """
+    import numpy as np
+    from PIL import Image
+
+    image = np.zeros((layout[0] * size, layout[1] * size, 3), dtype=np.uint8)
+
+    for p, panel in enumerate(panels):
+        row, col = divmod(p, layout[1])
+        image[row * size : (row + 1) * size, col * size : (col + 1) * size] = (
+            _rasterizePanel(panel, lut, alpha, size, linewidth)
+        )
+
+    if outfile is None:
+        Image.fromarray(image).show()
+    else:
+        Image.fromarray(image).save(outfile)
+
+
+def _rasterizePanel(panel, lut, alpha, size, linewidth):
+    """
+    Rasterize a panel onto a black, square tile. Like matplotlib's imshow with
+    equal aspect, the axis limits are scaled to fit the tile and centered.
+    """
+    import numpy as np
+    from PIL import Image, ImageColor, ImageDraw
+
+    # limits may be given as lists of scalars or of one-element arrays
+    xlim = np.ravel(panel["xlim"]).astype(float)
+    ylim = np.ravel(panel["ylim"]).astype(float)
+    extent = panel["extent"]
+
+    # pixels per unit, and size and offset of the axes within the tile
+    scale = size / max(abs(xlim[1] - xlim[0]), abs(ylim[1] - ylim[0]))
+    w = abs(xlim[1] - xlim[0]) * scale
+    h = abs(ylim[1] - ylim[0]) * scale
+    u0 = (size - w) / 2
+    v0 = (size - h) / 2
+
+    # window the base image to its range of values, and alpha-blend the
+    # overlay colors
+    base = panel["base"]
+    baseMin = np.min(base)
+    baseMax = np.max(base)
+    if baseMax > baseMin:
+        rgb = np.repeat(((base - baseMin) / (baseMax - baseMin))[..., None], 3, axis=2)
+    else:
+        rgb = np.zeros(base.shape + (3,))
+
+    if panel["overlay"] is not None:
+        rgb = (1 - alpha) * rgb + alpha * lut[panel["overlay"], 0:3]
+
+    rgb = np.round(rgb * 255).astype(np.uint8)
+
+    # sample the image at the centers of the pixels of the tile (nearest
+    # neighbor); columns are left to right, rows are top to bottom
+    uvCenters = np.arange(size) + 0.5
+
+    x = xlim[0] + (uvCenters - u0) / w * (xlim[1] - xlim[0])
+    y = ylim[1] - (uvCenters - v0) / h * (ylim[1] - ylim[0])
+
+    j = np.floor((x - extent[0]) / (extent[1] - extent[0]) * base.shape[1])
+    i = np.floor((y - extent[2]) / (extent[3] - extent[2]) * base.shape[0])
+
+    jValid = (j >= 0) & (j < base.shape[1])
+    iValid = (i >= 0) & (i < base.shape[0])
+
+    j = np.where(jValid, j, 0).astype(int)
+    i = np.where(iValid, i, 0).astype(int)
+
+    tile = rgb[np.ix_(i, j)]
+    tile[~iValid, :] = 0
+    tile[:, ~jValid] = 0
+
+    # draw lines
+    if len(panel["lines"]) > 0:
+        tileImage = Image.fromarray(tile)
+        draw = ImageDraw.Draw(tileImage)
+        for segments, color in panel["lines"]:
+            fill = ImageColor.getrgb(color)
+            for segment in segments:
+                u = u0 + (segment[:, 0] - xlim[0]) / (xlim[1] - xlim[0]) * w
+                v = v0 + (ylim[1] - segment[:, 1]) / (ylim[1] - ylim[0]) * h
+                draw.line(list(zip(u, v)), fill=fill, width=linewidth)
+        tile = np.array(tileImage)
+
+    # clip to the axes
+    tile[(uvCenters < v0) | (uvCenters > v0 + h), :] = 0
+    tile[:, (uvCenters < u0) | (uvCenters > u0 + w)] = 0
+
+    return tile
@@ -1,10 +1,32 @@
 """
 This module provides a function to create surface plots
 """
+
+# -----------------------------------------------------------------------------
+# imports
+
+import threading
+
+# -----------------------------------------------------------------------------
+# rendering session: the image exporter is started once per process and
+# shared by all surface plots
+
+_RENDER_SESSION = {"started": False}
+_RENDER_SESSION_LOCK = threading.Lock()
+
 # -----------------------------------------------------------------------------
 
 
-def createSurfacePlots(SUBJECT, SUBJECTS_DIR, SURFACES_OUTDIR, VIEWS, FASTSURFER):
+def createSurfacePlots(
+    SUBJECT,
+    SUBJECTS_DIR,
+    SURFACES_OUTDIR,
+    VIEWS,
+    FASTSURFER,
+    BACKEND="plotly",
+    DECIMATE=None,
+    N_JOBS=1,
+):
     """
     Create surface plots.
 
@@ -20,6 +42,19 @@ def createSurfacePlots(SUBJECT, SUBJECTS_DIR, SURFACES_OUTDIR, VIEWS, FASTSURFER
         List of views for which surface plots should be created.
     FASTSURFER : bool
         Flag indicating whether FastSurfer processing was used.
+    BACKEND : str, optional
+        The backend for rendering the surfaces, default is "plotly".
+        Can be "plotly" or "raster". The "raster" backend renders the
+        surfaces with an orthographic projection, a z-buffer, and Lambert
+        shading in numpy, and does not need plotly and kaleido.
+    DECIMATE : None or int, optional
+        Target number of triangles of the surfaces, default is None. If given,
+        surfaces are decimated for rendering, and the decimated surfaces are
+        kept in the cache directory, if one is set.
+    N_JOBS : int, optional
+        Maximum number of worker processes for rendering and exporting the
+        images of this subject, default is 1. If 1, all images are created
+        within the calling process.
 
     Returns
     -------
@@ -28,12 +63,14 @@ def createSurfacePlots(SUBJECT, SUBJECTS_DIR, SURFACES_OUTDIR, VIEWS, FASTSURFER
     """
     # imports
 
+    import multiprocessing
     import os
+    from concurrent.futures import ProcessPoolExecutor
 
-    import lapy as lp
     import nibabel as nb
     import numpy as np
-    from lapy import plot as lpp
+
+    from fsqc.fsqcCache import importDecimatedSurface
 
     # -----------------------------------------------------------------------------
     # settings
@@ -46,126 +83,368 @@ def createSurfacePlots(SUBJECT, SUBJECTS_DIR, SURFACES_OUTDIR, VIEWS, FASTSURFER
         ("inferior", 0, 0, -2),
     ]
     scale_png = 0.8
+    size_png = 800
 
-    # -----------------------------------------------------------------------------
-    # import surfaces and overlays
-
-    triaPialL = nb.freesurfer.read_geometry(
-        os.path.join(SUBJECTS_DIR, SUBJECT, "surf", "lh.pial")
-    )
-    triaPialR = nb.freesurfer.read_geometry(
-        os.path.join(SUBJECTS_DIR, SUBJECT, "surf", "rh.pial")
-    )
-    triaInflL = nb.freesurfer.read_geometry(
-        os.path.join(SUBJECTS_DIR, SUBJECT, "surf", "lh.inflated")
-    )
-    triaInflR = nb.freesurfer.read_geometry(
-        os.path.join(SUBJECTS_DIR, SUBJECT, "surf", "rh.inflated")
-    )
+    if BACKEND != "plotly" and BACKEND != "raster":
+        raise ValueError("ERROR: surfaces backend must be either 'plotly' or 'raster'.")
 
-    triaPialL = lp.TriaMesh(triaPialL[0], triaPialL[1])
-    triaPialR = lp.TriaMesh(triaPialR[0], triaPialR[1])
-    triaInflL = lp.TriaMesh(triaInflL[0], triaInflL[1])
-    triaInflR = lp.TriaMesh(triaInflR[0], triaInflR[1])
+    # -----------------------------------------------------------------------------
+    # import overlays
 
     if FASTSURFER is True:
-        annotL = nb.freesurfer.read_annot(
-            os.path.join(SUBJECTS_DIR, SUBJECT, "label", "lh.aparc.DKTatlas.annot"),
-            orig_ids=False,
-        )
-        annotR = nb.freesurfer.read_annot(
-            os.path.join(SUBJECTS_DIR, SUBJECT, "label", "rh.aparc.DKTatlas.annot"),
-            orig_ids=False,
-        )
+        annotName = "aparc.DKTatlas.annot"
     else:
-        annotL = nb.freesurfer.read_annot(
-            os.path.join(SUBJECTS_DIR, SUBJECT, "label", "lh.aparc.annot"),
-            orig_ids=False,
-        )
-        annotR = nb.freesurfer.read_annot(
-            os.path.join(SUBJECTS_DIR, SUBJECT, "label", "rh.aparc.annot"),
-            orig_ids=False,
+        annotName = "aparc.annot"
+
+    annotFiles = dict()
+    annots = dict()
+    for hemi in ["lh", "rh"]:
+        annotFiles[hemi] = os.path.join(
+            SUBJECTS_DIR, SUBJECT, "label", hemi + "." + annotName
         )
+        annots[hemi] = nb.freesurfer.read_annot(annotFiles[hemi], orig_ids=False)
 
     # -----------------------------------------------------------------------------
-    # plots
+    # import surfaces, optionally decimated, and determine vertex colors
 
-    # check if annotation has labels that are not included in the colortable
-    if any(annotL[0] == -1):
-        # prepend colortable and update indices
-        ctabL = np.concatenate((np.mat([127, 127, 127]), annotL[1][:, 0:3]), axis=0)
-        indsL = annotL[0] + 1
-    else:
-        ctabL = annotL[1][:, 0:3]
-        indsL = annotL[0]
+    surfaces = list()
 
-    vAnnotL = ctabL[indsL, :]
+    for surf in ["pial", "inflated"]:
+        for hemi in ["lh", "rh"]:
+            surfFile = os.path.join(SUBJECTS_DIR, SUBJECT, "surf", hemi + "." + surf)
 
-    # check if annotation has labels that are not included in the colortable
-    if any(annotR[0] == -1):
-        # prepend colortable and update indices
-        ctabR = np.concatenate((np.mat([127, 127, 127]), annotR[1][:, 0:3]), axis=0)
-        indsR = annotR[0] + 1
-    else:
-        ctabR = annotR[1][:, 0:3]
-        indsR = annotR[0]
+            if DECIMATE is None:
+                v, t = nb.freesurfer.read_geometry(surfFile)
+                labels = annots[hemi][0]
+            else:
+                v, t, labels = importDecimatedSurface(
+                    surfFile, annotFiles[hemi], DECIMATE
+                )
 
-    vAnnotR = ctabR[indsR, :]
+            # check if annotation has labels that are not included in the colortable
+            if any(annots[hemi][0] == -1):
+                # prepend colortable and update indices
+                ctab = np.concatenate(
+                    (np.array([[127, 127, 127]]), annots[hemi][1][:, 0:3]), axis=0
+                )
+                inds = labels + 1
+            else:
+                ctab = annots[hemi][1][:, 0:3]
+                inds = labels
+
+            surfaces.append((hemi + "." + surf, (v, t), ctab[inds, :]))
 
     # -----------------------------------------------------------------------------
-    # plots
+    # plots: for plotly, the figure of each surface is built once, and only the
+    # camera is changed between views; all images are then exported at once,
+    # or in one batch per worker process
+
+    surfaceFigures = dict()
+
+    rasterJobs = list()
+    figures = list()
+    files = list()
 
     for view, x, y, z in _views_available:
-        fpath_lp = os.path.join(SURFACES_OUTDIR, f"lh.pial.{view}.png")
-        fpath_rp = os.path.join(SURFACES_OUTDIR, f"rh.pial.{view}.png")
-        fpath_li = os.path.join(SURFACES_OUTDIR, f"lh.inflated.{view}.png")
-        fpath_ri = os.path.join(SURFACES_OUTDIR, f"rh.inflated.{view}.png")
-
-        if view in VIEWS:
-            camera = dict(
-                up=dict(x=0, y=0, z=1),
-                center=dict(x=0, y=0, z=0),
-                eye=dict(x=x, y=y, z=z),
-            )
+        for surface, tria, vcolor in surfaces:
+            fpath = os.path.join(SURFACES_OUTDIR, f"{surface}.{view}.png")
 
-            lpp.plot_tria_mesh(
-                triaPialL,
-                vcolor=vAnnotL,
-                background_color="black",
-                camera=camera,
-                export_png=fpath_lp,
-                no_display=True,
-                scale_png=scale_png,
-            )
-            lpp.plot_tria_mesh(
-                triaPialR,
-                vcolor=vAnnotR,
-                background_color="black",
-                camera=camera,
-                export_png=fpath_rp,
-                no_display=True,
-                scale_png=scale_png,
-            )
-            lpp.plot_tria_mesh(
-                triaInflL,
-                vcolor=vAnnotL,
-                background_color="black",
-                camera=camera,
-                export_png=fpath_li,
-                no_display=True,
-                scale_png=scale_png,
-            )
-            lpp.plot_tria_mesh(
-                triaInflR,
-                vcolor=vAnnotR,
-                background_color="black",
-                camera=camera,
-                export_png=fpath_ri,
-                no_display=True,
-                scale_png=scale_png,
-            )
+            if view in VIEWS and BACKEND == "raster":
+                rasterJobs.append(
+                    (
+                        tria[0],
+                        tria[1],
+                        vcolor,
+                        (x, y, z),
+                        (0, 0, 1),
+                        round(size_png * scale_png),
+                        fpath,
+                    )
+                )
+
+            elif view in VIEWS:
+                if surface not in surfaceFigures:
+                    surfaceFigures[surface] = _createSurfaceFigure(
+                        tria[0], tria[1], vcolor, size_png
+                    )
+
+                camera = dict(
+                    up=dict(x=0, y=0, z=1),
+                    center=dict(x=0, y=0, z=0),
+                    eye=dict(x=x, y=y, z=z),
+                )
+
+                figures.append(_setSurfaceCamera(surfaceFigures[surface], camera))
+                files.append(fpath)
+
+            elif os.path.isfile(fpath):
+                # remove images potentially created in earlier run but not updated now
+                os.remove(fpath)
+
+    nWorkers = min(N_JOBS, len(rasterJobs) + len(figures))
+
+    if nWorkers <= 1:
+        for job in rasterJobs:
+            _rasterizeSurface(*job)
+        _exportSurfaceFigures(figures, files, scale_png, size_png)
+
+    else:
+        # worker processes are not forked from the calling process, because
+        # other threads of the same process (see --n-threads) may hold locks,
+        # e.g. of the logging module or the volume cache, while forking
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            mpContext = multiprocessing.get_context("forkserver")
         else:
-            # remove images potentially created in earlier run but not updated now
-            for fpath in [fpath_lp, fpath_rp, fpath_li, fpath_ri]:
-                if os.path.isfile(fpath):
-                    os.remove(fpath)
+            mpContext = multiprocessing.get_context("spawn")
+
+        with ProcessPoolExecutor(
+            max_workers=nWorkers, mp_context=mpContext, initializer=_initRenderWorker
+        ) as executor:
+            futures = [executor.submit(_rasterizeSurface, *job) for job in rasterJobs]
+            for i in range(nWorkers):
+                futures.append(
+                    executor.submit(
+                        _exportSurfaceFigures,
+                        figures[i::nWorkers],
+                        files[i::nWorkers],
+                        scale_png,
+                        size_png,
+                    )
+                )
+            # propagate errors of the workers
+            for future in futures:
+                future.result()
+
+
+# -----------------------------------------------------------------------------
+# rendering session
+
+
+def _createSurfaceFigure(v, t, vcolor, size):
+    """
+    Create the figure of a triangle mesh with vertex colors, equivalent to the
+    one of lapy.plot.plot_tria_mesh, as a plain figure dictionary.
+    """
+    import plotly.graph_objects as go
+
+    noaxis = dict(
+        showbackground=False,
+        showline=False,
+        zeroline=False,
+        showgrid=False,
+        showticklabels=False,
+        title="",
+    )
+
+    fig = go.Figure(
+        data=[
+            go.Mesh3d(
+                x=v[:, 0],
+                y=v[:, 1],
+                z=v[:, 2],
+                i=t[:, 0],
+                j=t[:, 1],
+                k=t[:, 2],
+                flatshading=False,
+                vertexcolor=vcolor,
+                showscale=False,
+            )
+        ],
+        layout=go.Layout(
+            width=size,
+            height=size,
+            scene=dict(xaxis=noaxis, yaxis=noaxis, zaxis=noaxis),
+            plot_bgcolor="black",
+            paper_bgcolor="black",
+        ),
+    )
+
+    return fig.to_dict()
+
+
+def _setSurfaceCamera(fig, camera):
+    """
+    Return a shallow copy of a figure dictionary with a different camera; the
+    traces are shared.
+    """
+    layout = dict(fig["layout"])
+    layout["scene"] = dict(layout["scene"], camera=camera)
+
+    return dict(fig, layout=layout)
+
+
+def _startRenderSession():
+    """
+    Start the image exporter once per process, if kaleido supports a
+    persistent session (kaleido >= 1.0); older versions of kaleido keep their
+    exporter process alive by themselves.
+    """
+    import kaleido
+
+    with _RENDER_SESSION_LOCK:
+        if not _RENDER_SESSION["started"]:
+            if hasattr(kaleido, "start_sync_server"):
+                kaleido.start_sync_server()
+            _RENDER_SESSION["started"] = True
+
+
+def _initRenderWorker():
+    """
+    Reset the rendering session in a new worker process; a session that was
+    started in the parent process is not available in child processes.
+    """
+    with _RENDER_SESSION_LOCK:
+        _RENDER_SESSION["started"] = False
+
+
+def _exportSurfaceFigures(figures, files, scale, size):
+    """
+    Export figure dictionaries to image files, in a single batch if supported
+    by plotly and kaleido.
+    """
+    import plotly.io as pio
+
+    if len(figures) == 0:
+        return
+
+    _startRenderSession()
+
+    # figures are validated already, when they are created
+    if hasattr(pio, "write_images") and _kaleidoMajorVersion() >= 1:
+        pio.write_images(
+            figures, files, scale=scale, width=size, height=size, validate=False
+        )
+    else:
+        for fig, file in zip(figures, files):
+            pio.write_image(fig, file, scale=scale, validate=False)
+
+
+def _kaleidoMajorVersion():
+    """
+    Return the major version of kaleido.
+    """
+    from importlib.metadata import version
+
+    return int(version("kaleido").split(".")[0])
+
+
+# -----------------------------------------------------------------------------
+# raster backend
+
+
+def _rasterizeSurface(v, t, vcolor, eye, up, size, outfile, chunk=1000000):
+    """
+    Render a triangle mesh with vertex colors to an image file.
+
+    The mesh is projected orthographically onto the plane orthogonal to the
+    direction from the origin towards the eye, and scaled such that its
+    bounding box fits the image in views along the coordinate axes (with the
+    same scale for all views). Vertex colors are shaded by Lambert
+    shading with a light at the eye, and interpolated across triangles; the
+    closest triangle at each pixel is determined by a z-buffer. If the eye is
+    in the direction of the up vector, the anterior direction is used as the
+    up vector instead.
+    """
+    import numpy as np
+    from PIL import Image
+
+    v = np.asarray(v, dtype=np.float64)
+    t = np.asarray(t, dtype=np.int64)
+    vcolor = np.asarray(vcolor, dtype=np.float64)
+
+    # camera: image x axis, image y axis (upwards), and the direction towards
+    # the eye
+    back = np.asarray(eye, dtype=np.float64) / np.linalg.norm(eye)
+    right = np.cross(up, back)
+    if np.linalg.norm(right) < 1e-6:
+        right = np.cross((0, 1, 0), back)
+    right = right / np.linalg.norm(right)
+    upward = np.cross(back, right)
+
+    # project vertices to pixel coordinates and depth (larger is closer)
+    center = (np.min(v, axis=0) + np.max(v, axis=0)) / 2
+    scale = 0.9 * size / np.max(np.max(v, axis=0) - np.min(v, axis=0))
+
+    x = (v - center) @ right * scale + size / 2
+    y = size / 2 - (v - center) @ upward * scale
+    depth = (v - center) @ back
+
+    # Lambert shading of vertex colors with area-weighted vertex normals;
+    # surfaces are lit from both sides
+    triaNormals = np.cross(v[t[:, 1]] - v[t[:, 0]], v[t[:, 2]] - v[t[:, 0]])
+    vertexNormals = np.zeros(v.shape)
+    for i in range(3):
+        np.add.at(vertexNormals, t[:, i], triaNormals)
+    vertexNormals /= np.maximum(np.linalg.norm(vertexNormals, axis=1), 1e-12)[
+        :, np.newaxis
+    ]
+    shading = 0.3 + 0.7 * np.abs(vertexNormals @ back)
+    vcolor = vcolor * shading[:, np.newaxis]
+
+    # pixels whose centers are within the bounding box of each triangle;
+    # degenerate triangles are dropped
+    tx = x[t]
+    ty = y[t]
+    area = (tx[:, 1] - tx[:, 0]) * (ty[:, 2] - ty[:, 0]) - (tx[:, 2] - tx[:, 0]) * (
+        ty[:, 1] - ty[:, 0]
+    )
+    i0 = np.maximum(np.ceil(np.min(tx, axis=1) - 0.5), 0).astype(np.int64)
+    i1 = np.minimum(np.floor(np.max(tx, axis=1) - 0.5), size - 1).astype(np.int64)
+    j0 = np.maximum(np.ceil(np.min(ty, axis=1) - 0.5), 0).astype(np.int64)
+    j1 = np.minimum(np.floor(np.max(ty, axis=1) - 0.5), size - 1).astype(np.int64)
+    w = np.maximum(i1 - i0 + 1, 0)
+    h = np.maximum(j1 - j0 + 1, 0)
+    w[np.abs(area) < 1e-12] = 0
+    n = w * h
+
+    zbuffer = np.full(size * size, -np.inf)
+    image = np.zeros((size * size, 3))
+
+    # process triangles in chunks of about `chunk` candidate pixels
+    triangles = np.flatnonzero(n)
+    splits = np.searchsorted(
+        np.cumsum(n[triangles]), np.arange(chunk, np.sum(n), chunk)
+    )
+    for tc in np.split(triangles, splits):
+        if len(tc) == 0:
+            continue
+
+        # enumerate candidate pixels of each triangle
+        fragTria = np.repeat(tc, n[tc])
+        k = np.arange(len(fragTria)) - np.repeat(np.cumsum(n[tc]) - n[tc], n[tc])
+        px = i0[fragTria] + k % w[fragTria]
+        py = j0[fragTria] + k // w[fragTria]
+
+        # barycentric coordinates of the pixel centers
+        fx = tx[fragTria]
+        fy = ty[fragTria]
+        cx = px + 0.5
+        cy = py + 0.5
+        b0 = (
+            (fx[:, 1] - cx) * (fy[:, 2] - cy) - (fx[:, 2] - cx) * (fy[:, 1] - cy)
+        ) / area[fragTria]
+        b1 = (
+            (fx[:, 2] - cx) * (fy[:, 0] - cy) - (fx[:, 0] - cx) * (fy[:, 2] - cy)
+        ) / area[fragTria]
+        b = np.stack((b0, b1, 1 - b0 - b1), axis=1)
+
+        inside = np.all(b >= -1e-9, axis=1)
+        fragTria = fragTria[inside]
+        b = b[inside]
+        pix = py[inside] * size + px[inside]
+        fragDepth = np.sum(b * depth[t[fragTria]], axis=1)
+
+        # closest fragment of each pixel, if closer than the z-buffer
+        order = np.lexsort((-fragDepth, pix))
+        pix, first = np.unique(pix[order], return_index=True)
+        closest = order[first]
+        closer = fragDepth[closest] > zbuffer[pix]
+        pix = pix[closer]
+        closest = closest[closer]
+
+        zbuffer[pix] = fragDepth[closest]
+        image[pix] = np.einsum("ij,ijk->ik", b[closest], vcolor[t[fragTria[closest]]])
+
+    image = np.clip(np.round(image), 0, 255).astype(np.uint8).reshape(size, size, 3)
+
+    Image.fromarray(image).save(outfile)
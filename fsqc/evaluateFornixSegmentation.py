@@ -11,9 +11,11 @@ def evaluateFornixSegmentation(
     OUTPUT_DIR,
     CREATE_SCREENSHOT=True,
     SCREENSHOTS_OUTFILE=None,
+    SCREENSHOTS_ENGINE="matplotlib",
     RUN_SHAPEDNA=True,
     N_EIGEN=15,
     WRITE_EIGEN=True,
+    WRITE_INTERMEDIATES=False,
 ):
     """
     Evaluate potential missegmentation of the fornix.
@@ -22,9 +24,10 @@ def evaluateFornixSegmentation(
     which might erroneously be attached to the 'corpus callosum' label.
 
     It applies the cc_up.lta transform to the norm.mgz and aseg files,
-    creating a binary corpus callosum mask and surface. The resulting
-    files are saved to subject-specific directories within
-    the 'fornix' subdirectory of the output directory.
+    creating a binary corpus callosum mask and surface. The transformed
+    images and the mask are kept in memory, and are only saved to
+    subject-specific directories within the 'fornix' subdirectory of the
+    output directory if WRITE_INTERMEDIATES is True.
 
     If the corresponding arguments are set to 'True', the script also
     creates screenshots and runs a shape analysis of the
@@ -43,12 +46,17 @@ def evaluateFornixSegmentation(
         Whether to create screenshots.
     SCREENSHOTS_OUTFILE : str or list, optional (default: None)
         File or list of files for screenshots.
+    SCREENSHOTS_ENGINE : str, optional (default: "matplotlib")
+        Engine for screenshots, either 'matplotlib' or 'raster'.
     RUN_SHAPEDNA : bool, optional (default: True)
         Whether to run shape analysis.
     N_EIGEN : int, optional (default: 30)
         Number of Eigenvalues for shape analysis.
     WRITE_EIGEN : bool, optional (default: True)
         Write csv file with eigenvalues (or nans) to output directory.
+    WRITE_INTERMEDIATES : bool, optional (default: False)
+        Write the transformed images (asegCCup.mgz, normCCup.mgz) and the
+        corpus callosum mask (cc.mgz) to the output directory.
 
     Returns
     -------
@@ -62,11 +70,11 @@ def evaluateFornixSegmentation(
     import os
     import warnings
 
-    import nibabel as nb
     import numpy as np
     import pandas as pd
 
     from fsqc.createScreenshots import createScreenshots
+    from fsqc.fsqcCache import importHeader
     from fsqc.fsqcUtils import applyTransform, binarizeImage
 
     # --------------------------------------------------------------------------
@@ -116,30 +124,63 @@ def evaluateFornixSegmentation(
         SCREENSHOTS_OUTFILE = os.path.join(OUTPUT_DIR, "cc.png")
 
     # --------------------------------------------------------------------------
-    # conduct transform for aseg and norm
+    # determine the sagittal planes for the screenshot; the transform does not
+    # change the geometry of the images
 
-    applyTransform(
+    hdr = importHeader(os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "aseg.mgz"))
+    vox2ras_tkr = hdr.get_vox2ras_tkr()
+
+    x_coord = np.matmul(vox2ras_tkr, np.array((128, 128, 128, 1))[:, np.newaxis])[0]
+
+    # unless the transformed images are written, only the slab of voxels that
+    # contains these planes (plus a margin of one voxel) is interpolated
+    vDim = np.flatnonzero(vox2ras_tkr[0, 0:3])
+
+    if WRITE_INTERMEDIATES is True or len(vDim) != 1:
+        region = None
+    else:
+        vDim = vDim[0]
+        step = vox2ras_tkr[0, vDim]
+        vIdx = (x_coord + np.array((-1, 0, 1)) - vox2ras_tkr[0, 3]) / step
+        region = [slice(0, x) for x in hdr.get_data_shape()[0:3]]
+        region[vDim] = slice(
+            max(int(np.floor(np.min(vIdx))) - 1, 0),
+            min(int(np.ceil(np.max(vIdx))) + 2, hdr.get_data_shape()[vDim]),
+        )
+        region = tuple(region)
+
+    # --------------------------------------------------------------------------
+    # conduct transform for aseg and norm; the resulting images are kept in
+    # memory and only written if requested
+
+    def outFile(name):
+        return os.path.join(OUTPUT_DIR, name) if WRITE_INTERMEDIATES is True else None
+
+    asegCCup = applyTransform(
         os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "aseg.mgz"),
-        os.path.join(OUTPUT_DIR, "asegCCup.mgz"),
+        outFile("asegCCup.mgz"),
         mat_file=os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "transforms", "cc_up.lta"),
         interp="nearest",
+        out_region=region,
     )
 
     # when using 'make_upright', conducting the transform for norm.mgz is no
     # longer necessary (and will produce the same results)
 
-    applyTransform(
+    normCCup = applyTransform(
         os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "norm.mgz"),
-        os.path.join(OUTPUT_DIR, "normCCup.mgz"),
+        outFile("normCCup.mgz"),
         mat_file=os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "transforms", "cc_up.lta"),
         interp="cubic",
+        out_region=region,
+        dtype=np.float32,
     )
 
     # create fornix mask
 
-    binarizeImage(
-        os.path.join(OUTPUT_DIR, "asegCCup.mgz"),
-        os.path.join(OUTPUT_DIR, "cc.mgz"),
+    cc = binarizeImage(
+        asegCCup,
+        outFile("cc.mgz"),
         match=[251, 252, 253, 254, 255],
     )
 
@@ -147,21 +188,17 @@ def evaluateFornixSegmentation(
     # create screenshot
 
     if CREATE_SCREENSHOT is True:
-        hdr = nb.load(os.path.join(OUTPUT_DIR, "asegCCup.mgz"))
-        x_coord = np.matmul(
-            hdr.header.get_vox2ras_tkr(), np.array((128, 128, 128, 1))[:, np.newaxis]
-        )[0]
-
         createScreenshots(
             SUBJECT=SUBJECT,
             SUBJECTS_DIR=SUBJECTS_DIR,
             INTERACTIVE=False,
             VIEWS=[("x", x_coord - 1), ("x", x_coord), ("x", x_coord + 1)],
             LAYOUT=(1, 3),
-            BASE=os.path.join(OUTPUT_DIR, "normCCup.mgz"),
-            OVERLAY=os.path.join(OUTPUT_DIR, "cc.mgz"),
+            BASE=normCCup,
+            OVERLAY=cc,
             SURF=None,
             OUTFILE=SCREENSHOTS_OUTFILE,
+            ENGINE=SCREENSHOTS_ENGINE,
         )
 
     # --------------------------------------------------------------------------
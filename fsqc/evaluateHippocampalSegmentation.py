@@ -12,6 +12,7 @@ def evaluateHippocampalSegmentation(
     CREATE_SCREENSHOT=True,
     SCREENSHOTS_OUTFILE=None,
     SCREENSHOTS_ORIENTATION="radiological",
+    SCREENSHOTS_ENGINE="matplotlib",
     HEMI="lh",
     LABEL="T1.v21",
 ):
@@ -40,6 +41,8 @@ def evaluateHippocampalSegmentation(
         File or list of files for screenshots.
     SCREENSHOTS_ORIENTATION : str, optional, default: "radiological"
         Orientation for screenshots.
+    SCREENSHOTS_ENGINE : str, optional, default: "matplotlib"
+        Engine for screenshots, either 'matplotlib' or 'raster'.
     HEMI : str, optional, default: "lh"
         Hemisphere to evaluate, either 'lh' or 'rh'.
     LABEL : str, optional, default: "T1.v21"
@@ -61,12 +64,10 @@ def evaluateHippocampalSegmentation(
     import logging
     import os
 
-    import nibabel as nb
     import numpy as np
-    from scipy import ndimage
 
     from fsqc.createScreenshots import createScreenshots
-    from fsqc.fsqcUtils import binarizeImage
+    from fsqc.fsqcUtils import binarizeImage, importLabels, labelStats
 
     # --------------------------------------------------------------------------
     # check files
@@ -121,18 +122,19 @@ def evaluateHippocampalSegmentation(
     # --------------------------------------------------------------------------
     # get centroids
 
-    seg = nb.load(
+    seg_data, seg = importLabels(
         os.path.join(
             SUBJECTS_DIR,
             SUBJECT,
             "mri",
             HEMI + ".hippoAmygLabels-" + LABEL + ".FSvoxelSpace.mgz",
-        )
+        ),
+        return_image=True,
     )
-    seg_data = seg.get_fdata()
-    seg_labels = np.setdiff1d(np.unique(seg_data), 0)
+    seg_stats = labelStats(seg_data)
+    seg_labels = np.flatnonzero(seg_stats["count"][1:]) + 1
 
-    centroids = np.array(ndimage.center_of_mass(seg_data, seg_data, seg_labels))
+    centroids = seg_stats["centroid"][seg_labels]
     centroids = np.concatenate((seg_labels[:, np.newaxis], centroids), axis=1)
 
     vox2ras_tkr = seg.header.get_vox2ras_tkr()
@@ -184,6 +186,7 @@ def evaluateHippocampalSegmentation(
             SURF=None,
             OUTFILE=SCREENSHOTS_OUTFILE,
             ORIENTATION=SCREENSHOTS_ORIENTATION,
+            ENGINE=SCREENSHOTS_ENGINE,
             XLIM=XLIM,
             YLIM=YLIM,
         )
@@ -13,6 +13,7 @@ def evaluateHypothalamicSegmentation(
     CREATE_SCREENSHOT=True,
     SCREENSHOTS_OUTFILE=None,
     SCREENSHOTS_ORIENTATION="radiological",
+    SCREENSHOTS_ENGINE="matplotlib",
 ):
     """
     Evaluate potential missegmentation of the hypothalamus.
@@ -39,6 +40,8 @@ def evaluateHypothalamicSegmentation(
         File or list of files for screenshots.
     SCREENSHOTS_ORIENTATION : str, optional, default: "radiological"
         Orientation for screenshots.
+    SCREENSHOTS_ENGINE : str, optional, default: "matplotlib"
+        Engine for screenshots, either 'matplotlib' or 'raster'.
 
     Returns
     -------
@@ -56,12 +59,10 @@ def evaluateHypothalamicSegmentation(
     import logging
     import os
 
-    import nibabel as nb
     import numpy as np
-    from scipy import ndimage
 
     from fsqc.createScreenshots import createScreenshots
-    from fsqc.fsqcUtils import binarizeImage
+    from fsqc.fsqcUtils import binarizeImage, importLabels, labelStats
 
     # --------------------------------------------------------------------------
     # check files
@@ -103,13 +104,14 @@ def evaluateHypothalamicSegmentation(
     # --------------------------------------------------------------------------
     # get centroids
 
-    seg = nb.load(
-        os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "hypothalamic_subunits_seg.v1.mgz")
+    seg_data, seg = importLabels(
+        os.path.join(SUBJECTS_DIR, SUBJECT, "mri", "hypothalamic_subunits_seg.v1.mgz"),
+        return_image=True,
     )
-    seg_data = seg.get_fdata()
-    seg_labels = np.setdiff1d(np.unique(seg_data), 0)
+    seg_stats = labelStats(seg_data)
+    seg_labels = np.flatnonzero(seg_stats["count"][1:]) + 1
 
-    centroids = np.array(ndimage.center_of_mass(seg_data, seg_data, seg_labels))
+    centroids = seg_stats["centroid"][seg_labels]
     centroids = np.concatenate((seg_labels[:, np.newaxis], centroids), axis=1)
 
     vox2ras_tkr = seg.header.get_vox2ras_tkr()
@@ -253,6 +255,7 @@ def evaluateHypothalamicSegmentation(
             SURF=None,
             OUTFILE=SCREENSHOTS_OUTFILE,
             ORIENTATION=SCREENSHOTS_ORIENTATION,
+            ENGINE=SCREENSHOTS_ENGINE,
             XLIM=XLIM,
             YLIM=YLIM,
         )
@@ -0,0 +1,866 @@
+"""
+This module provides a cache for image volumes, which allows modules that work
+on the same subject to share decompressed image data, and optionally keeps
+decompressed image data on disk for subsequent runs, including a
+random-access index that allows reading single slices of compressed images.
+Decimated surfaces and resampled images can be kept in the cache directory as
+well.
+
+"""
+
+# ------------------------------------------------------------------------------
+# imports
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# ------------------------------------------------------------------------------
+# settings
+
+BRICK_SIZE = 16  # edge length of the independently compressed bricks in voxels
+VOLUME_CACHE_SIZE = 8 * 1024**3  # maximum size of image volumes on disk
+RESAMPLED_CACHE_SIZE = 2 * 1024**3  # maximum size of resampled images on disk
+EVICTION_GRACE_PERIOD = 60  # seconds for which new or used volumes are not evicted
+
+# ------------------------------------------------------------------------------
+# cache state; there is a single cache per process, which is active only within
+# a volumeCache() context
+
+_cache = OrderedDict()
+_cacheLock = threading.Lock()
+_cacheKeyLocks = dict()
+_cacheSettings = {"active": False, "max_size": 0, "size": 0, "cache_dir": None}
+_contentHashes = dict()
+_volumesSizes = dict()
+
+
+# ------------------------------------------------------------------------------
+# volumeCache()
+
+
+@contextmanager
+def volumeCache(max_size, cache_dir=None):
+    """
+    A context manager that activates the volume cache.
+
+    Within the context, images that are loaded via `importImage` are kept in
+    memory, and repeated loads of the same file return the cached data instead
+    of reading and decompressing the file again. The cache is emptied when the
+    context is left. Nested contexts use the cache of the outermost context.
+
+    If a cache directory is given, decompressed image data is additionally
+    stored on disk as uncompressed arrays in native byte order. Subsequent
+    loads of the same file, also in later runs, are memory-mapped from the
+    cache directory instead of being read and decompressed again. If the total
+    size of the stored volumes exceeds `VOLUME_CACHE_SIZE`, the least recently
+    used volumes are removed from the cache directory, except for those used
+    within the last `EVICTION_GRACE_PERIOD` seconds.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximum size of the cache in bytes. If exceeded, the least recently
+        used volumes are removed from the cache.
+    cache_dir : str, default: None
+        Directory for the on-disk cache. If None, no on-disk cache is used.
+
+    Yields
+    ------
+    None
+    """
+    with _cacheLock:
+        if _cacheSettings["active"]:
+            nested = True
+        else:
+            nested = False
+            _cacheSettings["active"] = True
+            _cacheSettings["max_size"] = max_size
+            _cacheSettings["cache_dir"] = cache_dir
+
+    try:
+        yield
+    finally:
+        if not nested:
+            clearVolumeCache()
+            with _cacheLock:
+                _cacheSettings["active"] = False
+                _cacheSettings["cache_dir"] = None
+
+
+# ------------------------------------------------------------------------------
+# clearVolumeCache()
+
+
+def clearVolumeCache():
+    """
+    Remove all volumes from the volume cache.
+
+    Returns
+    -------
+    None
+        This function returns nothing.
+    """
+    with _cacheLock:
+        _cache.clear()
+        _cacheKeyLocks.clear()
+        _cacheSettings["size"] = 0
+
+
+# ------------------------------------------------------------------------------
+# importImage()
+
+
+def importImage(filename):
+    """
+    Load an image into memory, using the volume cache if it is active.
+
+    Parameters
+    ----------
+    filename : str or nibabel image
+        Path to the image file; any format that can be read by nibabel. In-memory
+        images are used as they are.
+
+    Returns
+    -------
+    img : nibabel image
+        Image of the same class as returned by `nibabel.load`, but with the
+        image data held in memory as a read-only array in native byte order.
+
+    Notes
+    -----
+    Cached volumes are identified by their path, size and modification time,
+    such that files that are re-written during processing are re-read. Each
+    call returns a new image object that shares the cached data array, hence
+    any data conversions (e.g. by `get_fdata`) are not kept in the cache.
+    The same key is used for the on-disk cache; outdated files in the cache
+    directory are removed once they are the least recently used ones and the
+    cache directory exceeds `VOLUME_CACHE_SIZE`.
+    """
+    if _isImage(filename):
+        return filename
+
+    # determine cache key
+    filename, key = _cacheKey(filename)
+
+    # look up cache
+    with _cacheLock:
+        active = _cacheSettings["active"]
+        if active:
+            if key in _cache.keys():
+                _cache.move_to_end(key)
+                return _newImage(*_cache[key])
+            keyLock = _cacheKeyLocks.setdefault(key, threading.Lock())
+
+    if not active:
+        return _newImage(*_loadVolume(filename))
+
+    # load volume; the key-specific lock makes sure that a volume that is
+    # requested concurrently is loaded only once
+    with keyLock:
+        with _cacheLock:
+            if key in _cache.keys():
+                _cache.move_to_end(key)
+                return _newImage(*_cache[key])
+
+        if _cacheSettings["cache_dir"] is None:
+            volume = _loadVolume(filename)
+        else:
+            volume = _loadCachedVolume(filename, key, _cacheSettings["cache_dir"])
+
+        with _cacheLock:
+            _addToCache(key, volume)
+            _cacheKeyLocks.pop(key, None)
+
+    return _newImage(*volume)
+
+
+# ------------------------------------------------------------------------------
+# importHeader()
+
+
+def importHeader(filename):
+    """
+    Load the header of an image, using the volume cache if it is active.
+
+    Parameters
+    ----------
+    filename : str or nibabel image
+        Path to the image file; any format that can be read by nibabel. In-memory
+        images are used as they are.
+
+    Returns
+    -------
+    header : nibabel header
+        Image header, as returned by `nibabel.load(filename).header`.
+
+    Notes
+    -----
+    For compressed files, reading the header with nibabel may require the
+    decompression of the whole file (e.g. to read the footer of .mgz files).
+    This is avoided if the image is held in the volume cache or has been
+    stored in the cache directory.
+    """
+    import os
+
+    import nibabel as nb
+
+    if _isImage(filename):
+        return filename.header
+
+    filename, key = _cacheKey(filename)
+
+    with _cacheLock:
+        if _cacheSettings["active"] and key in _cache.keys():
+            return _cache[key][3]
+        cache_dir = _cacheSettings["cache_dir"]
+
+    if cache_dir is not None:
+        cachePath = _cachePath(cache_dir, key)
+        if os.path.isfile(cachePath + ".header.npz"):
+            try:
+                return _readHeader(cachePath)[2]
+            except (OSError, ValueError):
+                # file removed concurrently or incomplete
+                pass
+
+    return nb.load(filename).header
+
+
+# ------------------------------------------------------------------------------
+# importRegion()
+
+
+def importRegion(filename, region):
+    """
+    Load a rectangular region (e.g. a slice) of an image.
+
+    Parameters
+    ----------
+    filename : str or nibabel image
+        Path to the image file; any format that can be read by nibabel. In-memory
+        images are used as they are.
+    region : tuple of slice
+        Region of the image, given as one slice object (with a step size of
+        one) per dimension.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Image data within the region, in its native data type and byte order.
+
+    Notes
+    -----
+    The data is taken from the first of the following sources that is
+    available:
+
+    - the volume cache, if the image has already been loaded,
+    - the uncompressed array in the cache directory (memory-mapped),
+    - the brick index in the cache directory,
+    - the image file itself.
+
+    The brick index is created in the cache directory when an image is not
+    yet cached, and the loaded image is added to the volume cache. The brick
+    index is the only on-disk copy of the image data; `importImage` reads the
+    image from the bricks in this case. It stores the image data in bricks of
+    `BRICK_SIZE` voxels
+    per dimension, each of which is compressed independently. Reading a
+    slice then only requires the decompression of the bricks that intersect
+    the slice instead of the decompression of the whole volume. The gzip
+    streams of .mgz files themselves cannot be used for random access,
+    because the zlib module does not allow resuming decompression at
+    arbitrary bit positions.
+    """
+    import os
+
+    import numpy as np
+
+    if _isImage(filename):
+        return np.array(np.asanyarray(filename.dataobj)[region])
+
+    filename, key = _cacheKey(filename)
+
+    with _cacheLock:
+        active = _cacheSettings["active"]
+        if active and key in _cache.keys():
+            _cache.move_to_end(key)
+            return np.array(_cache[key][1][region])
+        cache_dir = _cacheSettings["cache_dir"]
+
+    if cache_dir is None:
+        return np.array(np.asanyarray(importImage(filename).dataobj)[region])
+
+    cachePath = _cachePath(cache_dir, key)
+
+    try:
+        if os.path.isfile(cachePath + ".npy"):
+            data = np.array(np.load(cachePath + ".npy", mmap_mode="r")[region])
+            # mark as recently used
+            os.utime(cachePath + ".npy")
+            return data
+        if os.path.isfile(cachePath + ".zidx.npz"):
+            data = _readBricks(cachePath, region)
+            os.utime(cachePath + ".zidx.npz")
+            return data
+    except (OSError, ValueError):
+        # files removed concurrently or incomplete
+        pass
+
+    # create brick index; the header is stored as well, such that it can be
+    # read without decompressing the image file
+    volume = _loadVolume(filename)
+    imgClass, data, affine, header = volume
+    if _writeHeader(cachePath, imgClass, affine, header):
+        _writeBricks(cachePath, data)
+        _addVolumeSize(cache_dir, cachePath)
+
+    with _cacheLock:
+        if key not in _cache.keys():
+            _addToCache(key, volume)
+
+    return np.array(data[region])
+
+
+# ------------------------------------------------------------------------------
+# importDecimatedSurface()
+
+
+def importDecimatedSurface(filename, annot_file, n_faces):
+    """
+    Load a surface and its annotation, decimated to a target number of
+    triangles, using the cache directory if one is set.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the surface file, e.g. lh.pial.
+    annot_file : str
+        Path to the annotation file, e.g. lh.aparc.annot.
+    n_faces : int
+        Target number of triangles, see `fsqcUtils.decimateMesh`.
+
+    Returns
+    -------
+    v : numpy.ndarray
+        Vertex coordinates of the decimated surface.
+    t : numpy.ndarray
+        Triangles of the decimated surface.
+    labels : numpy.ndarray
+        Annotation indices of the vertices of the decimated surface, as
+        returned by `nibabel.freesurfer.read_annot(annot_file,
+        orig_ids=False)`.
+
+    Notes
+    -----
+    Decimated surfaces are stored in the cache directory, keyed by both input
+    files and the target number of triangles, such that they are computed
+    only once per subject.
+    """
+    import os
+
+    import nibabel as nb
+    import numpy as np
+
+    from fsqc.fsqcUtils import decimateMesh
+
+    filename, key = _cacheKey(filename)
+    annot_file, annotKey = _cacheKey(annot_file)
+
+    with _cacheLock:
+        cache_dir = _cacheSettings["cache_dir"]
+
+    if cache_dir is not None:
+        cachePath = _cachePath(cache_dir, (key, annotKey, n_faces))
+        if os.path.isfile(cachePath + ".mesh.npz"):
+            with np.load(cachePath + ".mesh.npz") as mesh:
+                return mesh["v"], mesh["t"], mesh["labels"]
+
+    v, t = nb.freesurfer.read_geometry(filename)
+    labels = nb.freesurfer.read_annot(annot_file, orig_ids=False)[0]
+
+    v, t, labels = decimateMesh(v, t, n_faces, labels=labels)
+
+    if cache_dir is not None:
+        _writeCacheFile(
+            cachePath + ".mesh.npz",
+            lambda f: np.savez(f, v=v, t=t, labels=labels),
+        )
+
+    return v, t, labels
+
+
+# ------------------------------------------------------------------------------
+# importResampled()
+
+
+def importResampled(filename, mat_file, params, resample):
+    """
+    Resample an image, using the cache directory if one is set.
+
+    Parameters
+    ----------
+    filename : str or nibabel image
+        Path to the image file that is resampled. In-memory images are not
+        cached.
+    mat_file : str
+        Path to the transformation file, e.g. an .lta file.
+    params : tuple
+        Any further parameters that determine the result, e.g. interpolation
+        order, output region and data type. Must have a deterministic `repr`.
+    resample : callable
+        Function without arguments that does the resampling and returns a
+        dictionary of numpy arrays.
+
+    Returns
+    -------
+    dict
+        Dictionary of numpy arrays, as returned by `resample`.
+
+    Notes
+    -----
+    Results are stored in the cache directory as compressed .npz files, keyed
+    by the SHA-256 hashes of the contents of both files and by `params`. They
+    are hence re-used across runs, also for copied or re-written but identical
+    files. If the total size of these files exceeds `RESAMPLED_CACHE_SIZE`,
+    the least recently used files are removed.
+    """
+    import os
+
+    import numpy as np
+
+    with _cacheLock:
+        cache_dir = _cacheSettings["cache_dir"]
+
+    if cache_dir is None or _isImage(filename):
+        return resample()
+
+    key = (_contentHash(filename), _contentHash(mat_file), params)
+    cacheFile = _cachePath(cache_dir, key) + ".resampled.npz"
+
+    if os.path.isfile(cacheFile):
+        try:
+            with np.load(cacheFile) as cached:
+                result = {x: cached[x] for x in cached.files}
+            # mark as recently used
+            os.utime(cacheFile)
+            return result
+        except (OSError, ValueError):
+            # file removed concurrently or incomplete
+            pass
+
+    result = resample()
+
+    _writeCacheFile(cacheFile, lambda f: np.savez_compressed(f, **result))
+    _evictResampled(cache_dir, RESAMPLED_CACHE_SIZE)
+
+    return result
+
+
+# ------------------------------------------------------------------------------
+# auxiliary functions
+
+
+def _isImage(obj):
+    """
+    Check if obj is an in-memory nibabel image rather than a filename.
+    """
+    import nibabel as nb
+
+    return isinstance(obj, nb.spatialimages.SpatialImage)
+
+
+def _addToCache(key, volume):
+    """
+    Add a volume to the in-memory cache, if the cache is active, and remove the
+    least recently used volumes if the cache is full; requires `_cacheLock`.
+    """
+    if not _cacheSettings["active"]:
+        return
+
+    _cache[key] = volume
+    _cacheSettings["size"] += volume[1].nbytes
+    while _cacheSettings["size"] > _cacheSettings["max_size"] and len(_cache) > 0:
+        _, evicted = _cache.popitem(last=False)
+        _cacheSettings["size"] -= evicted[1].nbytes
+
+
+def _cacheKey(filename):
+    """
+    Return the resolved filename and the cache key of an image file.
+    """
+    import os
+
+    filename = os.path.realpath(filename)
+    stat = os.stat(filename)
+
+    return filename, (filename, stat.st_size, stat.st_mtime_ns)
+
+
+def _contentHash(filename):
+    """
+    Return the SHA-256 hash of the contents of a file; hashes are kept for
+    the lifetime of the process, unless the file changes.
+    """
+    import hashlib
+
+    filename, key = _cacheKey(filename)
+
+    with _cacheLock:
+        if key in _contentHashes.keys():
+            return _contentHashes[key]
+
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+
+    with _cacheLock:
+        _contentHashes[key] = sha256.hexdigest()
+
+    return sha256.hexdigest()
+
+
+def _evictResampled(cache_dir, max_size):
+    """
+    Remove the least recently used resampled images from the cache directory
+    until their total size is at most max_size.
+    """
+    import glob
+    import os
+
+    files = list()
+    for file in glob.glob(os.path.join(cache_dir, "*.resampled.npz")):
+        try:
+            stat = os.stat(file)
+        except OSError:
+            continue
+        files.append((stat.st_mtime_ns, stat.st_size, file))
+
+    size = sum([x[1] for x in files])
+    for _, fileSize, file in sorted(files):
+        if size <= max_size:
+            break
+        try:
+            os.remove(file)
+        except OSError:
+            pass
+        size -= fileSize
+
+
+def _addVolumeSize(cache_dir, cachePath):
+    """
+    Add the size of a new volume to the estimated size of all volumes in the
+    cache directory, and evict volumes if the estimate exceeds
+    `VOLUME_CACHE_SIZE`. The estimate is initialized and updated by scanning
+    the cache directory, which is hence only done once per process and
+    whenever the limit is crossed, not for each volume that is written.
+    """
+    import glob
+    import os
+
+    entrySize = 0
+    for file in glob.glob(cachePath + ".*"):
+        try:
+            entrySize += os.stat(file).st_size
+        except OSError:
+            pass
+
+    with _cacheLock:
+        size = _volumesSizes.get(cache_dir)
+        if size is not None:
+            size += entrySize
+            _volumesSizes[cache_dir] = size
+
+    if size is None or size > VOLUME_CACHE_SIZE:
+        size = _evictVolumes(cache_dir, VOLUME_CACHE_SIZE)
+        if size is not None:
+            with _cacheLock:
+                _volumesSizes[cache_dir] = size
+
+
+def _evictVolumes(cache_dir, max_size):
+    """
+    Remove the least recently used volumes, i.e. their data, brick index and
+    header files, from the cache directory until their total size is at most
+    max_size, and return the remaining total size. Returns None if another
+    process is evicting volumes from the same cache directory at the time.
+
+    Volumes that have been written or used within `EVICTION_GRACE_PERIOD` are
+    kept, because other processes may be about to read them.
+    """
+    import os
+    import time
+
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    # only one process at a time evicts volumes from a cache directory
+    lockFile = open(os.path.join(cache_dir, "evict.lock"), "a")
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+        return _evictVolumesLocked(cache_dir, max_size, time.time_ns())
+    finally:
+        lockFile.close()
+
+
+def _evictVolumesLocked(cache_dir, max_size, now):
+    """
+    Remove volumes from the cache directory, see `_evictVolumes`.
+    """
+    import glob
+    import os
+
+    entries = dict()
+    for ext in [".npy", ".zidx.npz", ".zbricks", ".header.npz"]:
+        for file in glob.glob(os.path.join(cache_dir, "*" + ext)):
+            try:
+                stat = os.stat(file)
+            except OSError:
+                continue
+            entry = entries.setdefault(file[: -len(ext)], [0, 0, list()])
+            entry[0] = max(entry[0], stat.st_mtime_ns)
+            entry[1] += stat.st_size
+            entry[2].append(file)
+
+    size = sum([x[1] for x in entries.values()])
+    for mtime, entrySize, files in sorted(entries.values()):
+        if size <= max_size or now - mtime < EVICTION_GRACE_PERIOD * 10**9:
+            break
+        # the data and index files are removed first, such that the entry is
+        # no longer considered complete
+        for file in files:
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+        size -= entrySize
+
+    return size
+
+
+def _cachePath(cache_dir, key):
+    """
+    Return the path of the cache files (without extension) for a cache key.
+    """
+    import hashlib
+    import os
+
+    return os.path.join(cache_dir, hashlib.sha1(repr(key).encode("utf-8")).hexdigest())
+
+
+def _writeCacheFile(filename, write):
+    """
+    Write a cache file via a temporary file that is renamed atomically, such
+    that concurrent processes never read incomplete cache files.
+    """
+    import logging
+    import os
+    import tempfile
+
+    tmpFile = None
+    try:
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(filename), delete=False
+        ) as f:
+            tmpFile = f.name
+            write(f)
+        os.replace(tmpFile, filename)
+    except OSError as e:
+        logging.warning("Could not write cache file " + filename + ": " + str(e))
+        if tmpFile is not None and os.path.isfile(tmpFile):
+            os.remove(tmpFile)
+
+
+def _writeBricks(cachePath, data):
+    """
+    Write image data as independently compressed bricks, followed by the
+    index of their byte offsets.
+    """
+    import zlib
+
+    import numpy as np
+
+    bricks = list()
+    for start in np.ndindex(*[len(range(0, n, BRICK_SIZE)) for n in data.shape]):
+        region = tuple(slice(i * BRICK_SIZE, (i + 1) * BRICK_SIZE) for i in start)
+        bricks.append(zlib.compress(np.ascontiguousarray(data[region]).tobytes()))
+
+    offsets = np.cumsum([0] + [len(x) for x in bricks], dtype=np.int64)
+
+    # the index is written last, hence its existence indicates a complete entry
+    _writeCacheFile(cachePath + ".zbricks", lambda f: f.writelines(bricks))
+    _writeCacheFile(
+        cachePath + ".zidx.npz",
+        lambda f: np.savez(
+            f,
+            offsets=offsets,
+            shape=np.array(data.shape),
+            dtype=np.array(data.dtype.str),
+            brick_size=np.array(BRICK_SIZE),
+        ),
+    )
+
+
+def _readBricks(cachePath, region):
+    """
+    Read a region of an image from the brick index.
+    """
+    import zlib
+
+    import numpy as np
+
+    with np.load(cachePath + ".zidx.npz") as index:
+        offsets = index["offsets"]
+        shape = tuple(index["shape"])
+        dtype = np.dtype(str(index["dtype"]))
+        brickSize = int(index["brick_size"])
+
+    # get start and stop of the region as well as the range of bricks that
+    # intersect the region in each dimension
+    bounds = [region[i].indices(shape[i])[0:2] for i in range(len(shape))]
+    data = np.empty([max(hi - lo, 0) for lo, hi in bounds], dtype=dtype)
+    if data.size == 0:
+        return data
+    nBricks = [len(range(0, n, brickSize)) for n in shape]
+    brickRanges = [
+        range(lo // brickSize, (hi - 1) // brickSize + 1) for lo, hi in bounds
+    ]
+
+    with open(cachePath + ".zbricks", "rb") as f:
+        for brick in np.ndindex(*[len(r) for r in brickRanges]):
+            brick = tuple(r[i] for r, i in zip(brickRanges, brick))
+            i = np.ravel_multi_index(brick, nBricks)
+            f.seek(offsets[i])
+            brickData = np.frombuffer(
+                zlib.decompress(f.read(offsets[i + 1] - offsets[i])), dtype=dtype
+            ).reshape(
+                [
+                    min((b + 1) * brickSize, n) - b * brickSize
+                    for b, n in zip(brick, shape)
+                ]
+            )
+            # copy the intersection of brick and region
+            src = list()
+            dst = list()
+            for b, (lo, hi) in zip(brick, bounds):
+                brickLo = max(b * brickSize, lo)
+                brickHi = min((b + 1) * brickSize, hi)
+                src.append(slice(brickLo - b * brickSize, brickHi - b * brickSize))
+                dst.append(slice(brickLo - lo, brickHi - lo))
+            data[tuple(dst)] = brickData[tuple(src)]
+
+    return data
+
+
+def _writeHeader(cachePath, imgClass, affine, header):
+    """
+    Write the image class, affine and header of an image to the cache
+    directory; returns False if the header cannot be stored.
+    """
+    import numpy as np
+
+    if not hasattr(header, "binaryblock"):
+        return False
+
+    _writeCacheFile(
+        cachePath + ".header.npz",
+        lambda f: np.savez(
+            f,
+            img_class=np.array(imgClass.__name__),
+            affine=affine,
+            binaryblock=np.frombuffer(header.binaryblock, dtype=np.uint8),
+        ),
+    )
+
+    return True
+
+
+def _readHeader(cachePath):
+    """
+    Read the image class, affine and header of an image from the cache
+    directory.
+    """
+    import nibabel as nb
+    import numpy as np
+
+    with np.load(cachePath + ".header.npz") as cached:
+        imgClass = str(cached["img_class"])
+        affine = cached["affine"]
+        binaryblock = cached["binaryblock"].tobytes()
+
+    imgClasses = {x.__name__: x for x in nb.all_image_classes}
+    if imgClass not in imgClasses.keys():
+        raise ValueError("ERROR: unknown image class " + imgClass + " in cache.")
+    imgClass = imgClasses[imgClass]
+
+    return imgClass, affine, imgClass.header_class(binaryblock)
+
+
+def _loadVolume(filename):
+    """
+    Load an image from disk and return its class, data, affine and header.
+    """
+    import nibabel as nb
+    import numpy as np
+
+    img = nb.load(filename)
+    data = np.asanyarray(img.dataobj)
+    data = data.astype(data.dtype.newbyteorder("="), copy=False)
+    data.flags.writeable = False
+
+    return img.__class__, data, img.affine, img.header
+
+
+def _loadCachedVolume(filename, key, cache_dir):
+    """
+    Load an image from the on-disk cache, or from disk if it is not cached yet,
+    and return its class, data, affine and header.
+    """
+    import os
+
+    import numpy as np
+
+    cachePath = _cachePath(cache_dir, key)
+
+    # read from cache; the data file is written last, hence its existence
+    # indicates a complete cache entry. Images that have been cached by
+    # `importRegion` are only stored as a brick index, which is decompressed
+    # as a whole, such that there is only one copy of the data on disk.
+    try:
+        if os.path.isfile(cachePath + ".npy"):
+            imgClass, affine, header = _readHeader(cachePath)
+            data = np.load(cachePath + ".npy", mmap_mode="r")
+            # mark as recently used
+            os.utime(cachePath + ".npy")
+            return imgClass, data, affine, header
+        if os.path.isfile(cachePath + ".zidx.npz"):
+            imgClass, affine, header = _readHeader(cachePath)
+            data = _readBricks(cachePath, (slice(None),) * len(header.get_data_shape()))
+            data.flags.writeable = False
+            os.utime(cachePath + ".zidx.npz")
+            return imgClass, data, affine, header
+    except (OSError, ValueError):
+        # files removed concurrently or incomplete
+        pass
+
+    # load volume and write to cache
+    volume = _loadVolume(filename)
+    imgClass, data, affine, header = volume
+    if _writeHeader(cachePath, imgClass, affine, header):
+        _writeCacheFile(cachePath + ".npy", lambda f: np.save(f, data))
+        _addVolumeSize(cache_dir, cachePath)
+
+    return volume
+
+
+def _newImage(imgClass, data, affine, header):
+    """
+    Create a new image object from cached data.
+    """
+    return imgClass(data, affine, header)
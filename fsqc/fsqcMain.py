@@ -2,6 +2,31 @@
 This module provides the main functionality of the fsqc package.
 """
 
+# ==============================================================================
+# SETTINGS
+
+# internal settings (might be turned into command-line arguments in the future)
+
+SNR_AMOUT_EROSION = 3
+FORNIX_SCREENSHOT = True
+FORNIX_SHAPE = False
+FORNIX_N_EIGEN = 15
+FORNIX_WRITE_EIGEN = True
+FORNIX_WRITE_INTERMEDIATES = False
+HYPOTHALAMUS_SCREENSHOT = True
+HIPPOCAMPUS_SCREENSHOT = True
+OUTLIER_N_MIN = 5
+
+SHAPE_EVEC = False
+SHAPE_SKIPCORTEX = False
+SHAPE_NUM = 50
+SHAPE_NORM = "geometry"
+SHAPE_REWEIGHT = True
+SHAPE_ASYMMETRY = True
+
+VOLUME_CACHE_SIZE = 1024**3  # maximum size of the per-subject volume cache in bytes
+
+
 # ==============================================================================
 # FUNCTIONS
 
@@ -202,7 +227,9 @@ def get_help(print_help=True, return_help=False):
                                   [--hippocampus-html] [--hippocampus-label <label>]
                                   [--shape] [--outlier] [--fastsurfer]
                                   [--no-group] [--group-only]
-                                  [--exit-on-error] [--skip-existing] [-h]
+                                  [--exit-on-error] [--skip-existing]
+                                  [--n-jobs <number>] [--n-threads <number>]
+                                  [--cache-dir <directory>] [-h]
 
         required arguments:
           --subjects_dir <directory>
@@ -255,6 +282,14 @@ def get_help(print_help=True, return_help=False):
           --skip-existing       skips processing for a given case if output
                                 already exists, even with possibly different
                                 parameters or settings.
+          --n-jobs <number>     number of subjects to process in parallel
+                                (default: 1)
+          --n-threads <number>  number of modules to run concurrently for each
+                                subject (default: 1)
+          --cache-dir <directory>
+                                directory for storing decompressed image data,
+                                which is re-used by subsequent runs (default:
+                                None)
 
         getting help:
           -h, --help            display this help message and exit
@@ -295,6 +330,21 @@ def get_help(print_help=True, return_help=False):
                                 are x=-10 x=10 y=0 z=0.
           --screenshots_layout <rows> <columns>
                                 layout matrix for screenshot images
+          --screenshots_engine <matplotlib|raster>
+                                engine for creating screenshot images: 'matplotlib'
+                                (default) or 'raster', which composites images
+                                with numpy and PIL and is considerably faster.
+          --surfaces_backend <plotly|raster>
+                                backend for rendering surface plots: 'plotly'
+                                (default) or 'raster', which renders surfaces with
+                                numpy and does not require plotly and kaleido.
+          --surfaces_decimate <faces>
+                                decimate surfaces to about this number of triangles
+                                before rendering surface plots. Decimated surfaces
+                                are kept in the cache directory, if one is given.
+          --surfaces_n_jobs <number>
+                                number of worker processes for rendering the
+                                surface plots of each subject (default: 1)
 
 
     ========================
@@ -652,6 +702,32 @@ def _parse_arguments():
         action="store_true",
         required=False,
     )
+    optional.add_argument(
+        "--n-jobs",
+        dest="n_jobs",
+        help="number of subjects to process in parallel",
+        default=1,
+        type=int,
+        metavar="<number>",
+        required=False,
+    )
+    optional.add_argument(
+        "--n-threads",
+        dest="n_threads",
+        help="number of modules to run concurrently for each subject",
+        default=1,
+        type=int,
+        metavar="<number>",
+        required=False,
+    )
+    optional.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        help="directory for storing decompressed image data",
+        default=None,
+        metavar="<directory>",
+        required=False,
+    )
 
     expert = parser.add_argument_group("expert arguments")
     expert.add_argument(
@@ -697,6 +773,40 @@ def _parse_arguments():
         metavar="<num>",
         required=False,
     )
+    expert.add_argument(
+        "--screenshots_engine",
+        dest="screenshots_engine",
+        help="engine for screenshots",
+        default="matplotlib",
+        metavar="<matplotlib|raster>",
+        required=False,
+    )
+    expert.add_argument(
+        "--surfaces_backend",
+        dest="surfaces_backend",
+        help="backend for surface plots",
+        default="plotly",
+        metavar="<plotly|raster>",
+        required=False,
+    )
+    expert.add_argument(
+        "--surfaces_decimate",
+        dest="surfaces_decimate",
+        help="number of triangles of decimated surfaces for surface plots",
+        default=None,
+        type=int,
+        metavar="<faces>",
+        required=False,
+    )
+    expert.add_argument(
+        "--surfaces_n_jobs",
+        dest="surfaces_n_jobs",
+        help="number of worker processes for surface plots of each subject",
+        default=1,
+        type=int,
+        metavar="<number>",
+        required=False,
+    )
     expert.add_argument(
         "--screenshots_orientation",
         dest="screenshots_orientation",
@@ -749,9 +859,13 @@ def _parse_arguments():
     argsDict["screenshots_views"] = args.screenshots_views
     argsDict["screenshots_layout"] = args.screenshots_layout
     argsDict["screenshots_orientation"] = args.screenshots_orientation
+    argsDict["screenshots_engine"] = args.screenshots_engine
     argsDict["surfaces"] = args.surfaces
     argsDict["surfaces_html"] = args.surfaces_html
     argsDict["surfaces_views"] = args.surfaces_views
+    argsDict["surfaces_backend"] = args.surfaces_backend
+    argsDict["surfaces_decimate"] = args.surfaces_decimate
+    argsDict["surfaces_n_jobs"] = args.surfaces_n_jobs
     argsDict["skullstrip"] = args.skullstrip
     argsDict["skullstrip_html"] = args.skullstrip_html
     argsDict["fornix"] = args.fornix
@@ -768,6 +882,9 @@ def _parse_arguments():
     argsDict["group_only"] = args.group_only
     argsDict["exit_on_error"] = args.exit_on_error
     argsDict["skip_existing"] = args.skip_existing
+    argsDict["n_jobs"] = args.n_jobs
+    argsDict["n_threads"] = args.n_threads
+    argsDict["cache_dir"] = args.cache_dir
 
     #
     return argsDict
@@ -867,6 +984,30 @@ def _check_arguments(argsDict):
             "ERROR: Use either --skip_existing or --group-only (but not both)."
         )
 
+    # check if number of parallel jobs is valid
+    if not isinstance(argsDict["n_jobs"], int) or argsDict["n_jobs"] < 1:
+        raise ValueError("ERROR: --n-jobs must be a positive integer.")
+
+    # check if number of concurrent modules is valid
+    if not isinstance(argsDict["n_threads"], int) or argsDict["n_threads"] < 1:
+        raise ValueError("ERROR: --n-threads must be a positive integer.")
+
+    # check if cache directory exists or can be created and is writable
+    if argsDict["cache_dir"] is not None:
+        argsDict["cache_dir"] = os.path.abspath(argsDict["cache_dir"])
+        try:
+            os.makedirs(argsDict["cache_dir"], exist_ok=True)
+            testfile = tempfile.TemporaryFile(dir=argsDict["cache_dir"])
+            testfile.close()
+        except Exception as e:
+            logging.error(
+                "ERROR: cannot create or write to cache directory "
+                + argsDict["cache_dir"]
+            )
+            logging.error("Reason: " + str(e))
+            raise
+        logging.info("Using cache directory " + argsDict["cache_dir"])
+
     # check if screenshots subdirectory exists or can be created and is writable
     if argsDict["screenshots"] is True or argsDict["screenshots_html"] is True:
         if os.path.isdir(os.path.join(argsDict["output_dir"], "screenshots")):
@@ -965,6 +1106,39 @@ def _check_arguments(argsDict):
             + argsDict["screenshots_orientation"]
         )
 
+    # check screenshots_engine
+    if (
+        argsDict["screenshots_engine"] != "matplotlib"
+        and argsDict["screenshots_engine"] != "raster"
+    ):
+        raise ValueError(
+            "ERROR: screenshots_engine argument must be either 'matplotlib' or 'raster'."
+        )
+    else:
+        logging.info("Found screenshot engine set to " + argsDict["screenshots_engine"])
+
+    # check surfaces_backend
+    if (
+        argsDict["surfaces_backend"] != "plotly"
+        and argsDict["surfaces_backend"] != "raster"
+    ):
+        raise ValueError(
+            "ERROR: surfaces_backend argument must be either 'plotly' or 'raster'."
+        )
+    else:
+        logging.info("Found surfaces backend set to " + argsDict["surfaces_backend"])
+
+    # check surfaces_decimate
+    if argsDict["surfaces_decimate"] is not None and argsDict["surfaces_decimate"] < 1:
+        raise ValueError("ERROR: surfaces_decimate argument must be a positive number.")
+
+    # check surfaces_n_jobs
+    if (
+        not isinstance(argsDict["surfaces_n_jobs"], int)
+        or argsDict["surfaces_n_jobs"] < 1
+    ):
+        raise ValueError("ERROR: --surfaces_n_jobs must be a positive integer.")
+
     # check if skullstrip subdirectory exists or can be created and is writable
     if argsDict["skullstrip"] is True or argsDict["skullstrip_html"] is True:
         if os.path.isdir(os.path.join(argsDict["output_dir"], "skullstrip")):
@@ -1509,32 +1683,72 @@ def _check_packages():
 
 
 # ------------------------------------------------------------------------------
-# do fsqc
+# init worker
 
 
-def _do_fsqc(argsDict):
+def _init_worker(logfile):
     """
-    Run the fsqc submodules.
+    Initialize logging within a worker process.
 
     Parameters
     ----------
-    argsDict : dict
-        Dictionary containing input arguments.
+    logfile : str
+        Filename of the logfile.
 
     Returns
     -------
     None
         This function returns nothing.
-    """
 
-    # ------------------------------------------------------------------------------
+    Notes
+    -----
+    Depending on the multiprocessing start method, worker processes may or may
+    not inherit the logging configuration of the parent process. If no handlers
+    are present, logging to stdout and to the logfile is set up here.
+    """
     # imports
+    import logging
+    import sys
 
-    import csv
+    # set up logging if not inherited from parent process
+    if len(logging.getLogger().handlers) == 0:
+        logfile_format = "[%(levelname)s: %(filename)s: %(lineno)4d]: %(message)s"
+        logfile_handlers = [logging.StreamHandler(sys.stdout)]
+        if logfile is not None:
+            logfile_handlers.append(logging.FileHandler(filename=logfile, mode="a"))
+        logging.basicConfig(
+            level=logging.INFO, format=logfile_format, handlers=logfile_handlers
+        )
+
+
+# ------------------------------------------------------------------------------
+# do fsqc: core metrics
+
+
+def _do_fsqc_metrics(subject, argsDict, status_dict):
+    """
+    Compute the core metrics for a single subject.
+
+    Parameters
+    ----------
+    subject : str
+        Subject ID.
+    argsDict : dict
+        Dictionary containing input arguments.
+    status_dict : dict
+        Dictionary with the module status of a previous run; empty if no
+        statusfile was found.
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys 'metrics', 'status', and 'images', containing
+        the subject-specific results of the module.
+    """
+
+    # imports
     import logging
     import os
-    import time
-    from pathlib import Path
 
     import numpy as np
     import pandas as pd
@@ -1544,1174 +1758,1623 @@ def _do_fsqc(argsDict):
     from fsqc.checkRotation import checkRotation
     from fsqc.checkSNR import checkSNR
     from fsqc.checkTopology import checkTopology
-    from fsqc.createScreenshots import createScreenshots
-    from fsqc.createSurfacePlots import createSurfacePlots
-    from fsqc.evaluateFornixSegmentation import evaluateFornixSegmentation
-    from fsqc.evaluateHippocampalSegmentation import evaluateHippocampalSegmentation
-    from fsqc.evaluateHypothalamicSegmentation import evaluateHypothalamicSegmentation
-    from fsqc.outlierDetection import outlierDetection, outlierTable
 
-    # ------------------------------------------------------------------------------
-    # internal settings (might be turned into command-line arguments in the future)
-
-    SNR_AMOUT_EROSION = 3
-    FORNIX_SCREENSHOT = True
-    FORNIX_SHAPE = False
-    FORNIX_N_EIGEN = 15
-    FORNIX_WRITE_EIGEN = True
-    HYPOTHALAMUS_SCREENSHOT = True
-    HIPPOCAMPUS_SCREENSHOT = True
-    OUTLIER_N_MIN = 5
-
-    SHAPE_EVEC = False
-    SHAPE_SKIPCORTEX = False
-    SHAPE_NUM = 50
-    SHAPE_NORM = "geometry"
-    SHAPE_REWEIGHT = True
-    SHAPE_ASYMMETRY = True
+    # create dicts
+    metricsDict = {"subject": subject}
+    imagesDict = dict()
 
-    # --------------------------------------------------------------------------
-    # process
+    # set images
+    if argsDict["fastsurfer"] is True:
+        aparc_image = "aparc.DKTatlas+aseg.deep.mgz"
+    else:
+        aparc_image = "aparc+aseg.mgz"
 
-    # start the processing with a message
-    print("")
-    print("-----------------------------")
+    # check / create subject-specific metrics_outdir
+    metrics_outdir = os.path.join(argsDict["output_dir"], "metrics", subject)
+    if not os.path.isdir(metrics_outdir):
+        os.makedirs(metrics_outdir)
 
-    # create metrics dict
-    metricsDict = dict()
+    #
+    metrics_status = 0
+    if argsDict["skip_existing"] is True:
+        if len(status_dict) > 0:
+            if status_dict["metrics"] == 0 or status_dict["metrics"] == 3:
+                metrics_status = 3
+                logging.info("Skipping metrics computation for " + subject)
+            else:
+                logging.info(
+                    "Not skipping metrics computation for "
+                    + subject
+                    + ": statusfile did not indicate ok or skipped"
+                )
+        else:
+            logging.info(
+                "Not skipping metrics computation for "
+                + subject
+                + ": no statusfile was found"
+            )
 
-    # create images dict
-    imagesScreenshotsDict = dict()
-    imagesSurfacesDict = dict()
-    imagesSkullstripDict = dict()
-    imagesFornixDict = dict()
-    imagesHypothalamusDict = dict()
-    imagesHippocampusLeftDict = dict()
-    imagesHippocampusRightDict = dict()
+    if metrics_status == 0:
+        # get WM and GM SNR for orig.mgz and norm.mgz; masks are computed once
+        try:
+            (wm_snr_orig, gm_snr_orig), (wm_snr_norm, gm_snr_norm) = checkSNR(
+                argsDict["subjects_dir"],
+                subject,
+                SNR_AMOUT_EROSION,
+                aparc_image=aparc_image,
+                ref_images=["orig.mgz", "norm.mgz"],
+            )
 
-    # create status dict
-    statusDict = dict()
+        except Exception as e:
+            logging.error("ERROR: SNR computation failed for " + subject)
+            logging.error("Reason: " + str(e))
+            wm_snr_orig = np.nan
+            gm_snr_orig = np.nan
+            wm_snr_norm = np.nan
+            gm_snr_norm = np.nan
+            metrics_status = 1
+            if argsDict["exit_on_error"] is True:
+                raise
 
-    # --------------------------------------------------------------------------
-    # subject-level processing
+        # check CC size
+        try:
+            cc_size = checkCCSize(argsDict["subjects_dir"], subject)
 
-    if argsDict["group_only"] is False:
-        # loop through the specified subjects
-        for subject in argsDict["subjects"]:
-            #
-            logging.info(
-                "Starting fsqc for subject "
-                + subject
-                + " at "
-                + time.strftime("%Y-%m-%d %H:%M %Z", time.localtime(time.time())),
+        except Exception as e:
+            logging.error("ERROR: CC size computation failed for " + subject)
+            logging.error("Reason: " + str(e))
+            cc_size = np.nan
+            metrics_status = 1
+            if argsDict["exit_on_error"] is True:
+                raise
+
+        # check topology
+        try:
+            (
+                holes_lh,
+                holes_rh,
+                defects_lh,
+                defects_rh,
+                topo_lh,
+                topo_rh,
+            ) = checkTopology(argsDict["subjects_dir"], subject)
+
+        except Exception as e:
+            logging.error("ERROR: Topology check failed for " + subject)
+            logging.error("Reason: " + str(e))
+            holes_lh = np.nan
+            holes_rh = np.nan
+            defects_lh = np.nan
+            defects_rh = np.nan
+            topo_lh = np.nan
+            topo_rh = np.nan
+            metrics_status = 1
+            if argsDict["exit_on_error"] is True:
+                raise
+
+        # check contrast
+        try:
+            con_snr_lh, con_snr_rh = checkContrast(argsDict["subjects_dir"], subject)
+
+        except Exception as e:
+            logging.error("ERROR: Contrast check failed for " + subject)
+            logging.error("Reason: " + str(e))
+            con_snr_lh = np.nan
+            con_snr_rh = np.nan
+            metrics_status = 1
+            if argsDict["exit_on_error"] is True:
+                raise
+
+        # check rotation
+        try:
+            rot_tal_x, rot_tal_y, rot_tal_z = checkRotation(
+                argsDict["subjects_dir"], subject
             )
 
-            # ----------------------------------------------------------------------
-            # set images
+        except Exception as e:
+            logging.error("ERROR: Rotation failed for " + subject)
+            logging.error("Reason: " + str(e))
+            rot_tal_x = np.nan
+            rot_tal_y = np.nan
+            rot_tal_z = np.nan
+            metrics_status = 1
+            if argsDict["exit_on_error"] is True:
+                raise
 
-            if argsDict["fastsurfer"] is True:
-                aparc_image = "aparc.DKTatlas+aseg.deep.mgz"
-            else:
-                aparc_image = "aparc+aseg.mgz"
-
-            # ----------------------------------------------------------------------
-            # add subject to dictionary
-
-            metricsDict.update({subject: {"subject": subject}})
-            statusDict.update({subject: {"subject": subject}})
-
-            # ----------------------------------------------------------------------
-            # check for existing statusfile
-
-            # check / create subject-specific status_outdir
-            status_outdir = os.path.join(argsDict["output_dir"], "status", subject)
-            if not os.path.isdir(status_outdir):
-                os.makedirs(status_outdir)
-
-            # if it already exists, read statusfile
-            status_dict = dict()
-            if os.path.exists(os.path.join(status_outdir, "status.txt")):
-                status_dict = dict(
-                    pd.read_csv(
-                        os.path.join(status_outdir, "status.txt"),
-                        sep=":",
-                        header=None,
-                        comment="#",
-                        names=["module", "status"],
-                        dtype=str,
-                    ).to_dict(orient="split")["data"]
-                )
-                for x in [
-                    "metrics",
-                    "shape",
-                    "screenshots",
-                    "surfaces",
-                    "skullstrip",
-                    "fornix",
-                    "hypothalamus",
-                    "hippocampus",
-                ]:
-                    status_dict[x] = int(status_dict[x])
-                statusDict[subject] = status_dict
-
-            # note:
-            # 0: OK
-            # 1: Failed
-            # 2: Not done
-            # 3: Skipped
-
-            # ----------------------------------------------------------------------
-            # compute core metrics
-
-            # check / create subject-specific metrics_outdir
-            metrics_outdir = os.path.join(argsDict["output_dir"], "metrics", subject)
-            if not os.path.isdir(metrics_outdir):
-                os.makedirs(metrics_outdir)
+        # store data
+        metricsDict.update(
+            {
+                "wm_snr_orig": wm_snr_orig,
+                "gm_snr_orig": gm_snr_orig,
+                "wm_snr_norm": wm_snr_norm,
+                "gm_snr_norm": gm_snr_norm,
+                "cc_size": cc_size,
+                "holes_lh": holes_lh,
+                "holes_rh": holes_rh,
+                "defects_lh": defects_lh,
+                "defects_rh": defects_rh,
+                "topo_lh": topo_lh,
+                "topo_rh": topo_rh,
+                "con_snr_lh": con_snr_lh,
+                "con_snr_rh": con_snr_rh,
+                "rot_tal_x": rot_tal_x,
+                "rot_tal_y": rot_tal_y,
+                "rot_tal_z": rot_tal_z,
+            }
+        )
 
-            #
-            metrics_status = 0
-            if argsDict["skip_existing"] is True:
-                if len(status_dict) > 0:
-                    if (
-                        statusDict[subject]["metrics"] == 0
-                        or statusDict[subject]["metrics"] == 3
-                    ):
-                        metrics_status = 3
-                        logging.info("Skipping metrics computation for " + subject)
-                    else:
-                        logging.info(
-                            "Not skipping metrics computation for "
-                            + subject
-                            + ": statusfile did not indicate ok or skipped"
-                        )
-                else:
-                    logging.info(
-                        "Not skipping metrics computation for "
-                        + subject
-                        + ": no statusfile was found"
-                    )
+        # write to file
+        pd.DataFrame(metricsDict, index=[subject]).to_csv(
+            os.path.join(argsDict["output_dir"], "metrics", subject, "metrics.csv")
+        )
 
-            if metrics_status == 0:
-                # get WM and GM SNR for orig.mgz
-                try:
-                    wm_snr_orig, gm_snr_orig = checkSNR(
-                        argsDict["subjects_dir"],
-                        subject,
-                        SNR_AMOUT_EROSION,
-                        ref_image="orig.mgz",
-                        aparc_image=aparc_image,
-                    )
+    elif metrics_status == 3:
+        metricsDict = (
+            metricsDict
+            | pd.read_csv(
+                os.path.join(metrics_outdir, "metrics.csv"),
+                dtype={"Unnamed: 0": str, "subject": str},
+            )
+            .set_index("Unnamed: 0")
+            .to_dict(orient="index")[subject]
+        )
 
-                except Exception as e:
-                    logging.error("ERROR: SNR computation failed for " + subject)
-                    logging.error("Reason: " + str(e))
-                    wm_snr_orig = np.nan
-                    gm_snr_orig = np.nan
-                    metrics_status = 1
-                    if argsDict["exit_on_error"] is True:
-                        raise
-
-                # get WM and GM SNR for norm.mgz
-                try:
-                    wm_snr_norm, gm_snr_norm = checkSNR(
-                        argsDict["subjects_dir"],
-                        subject,
-                        SNR_AMOUT_EROSION,
-                        ref_image="norm.mgz",
-                        aparc_image=aparc_image,
-                    )
+    # note that we cannot "not do" the metrics module, only skipping is possible.
+    # hence no metrics_status == 2 possible.
 
-                except Exception as e:
-                    logging.error("ERROR: SNR computation failed for " + subject)
-                    logging.error("Reason: " + str(e))
-                    wm_snr_norm = np.nan
-                    gm_snr_norm = np.nan
-                    metrics_status = 1
-                    if argsDict["exit_on_error"] is True:
-                        raise
-
-                # check CC size
-                try:
-                    cc_size = checkCCSize(argsDict["subjects_dir"], subject)
-
-                except Exception as e:
-                    logging.error("ERROR: CC size computation failed for " + subject)
-                    logging.error("Reason: " + str(e))
-                    cc_size = np.nan
-                    metrics_status = 1
-                    if argsDict["exit_on_error"] is True:
-                        raise
-
-                # check topology
-                try:
-                    (
-                        holes_lh,
-                        holes_rh,
-                        defects_lh,
-                        defects_rh,
-                        topo_lh,
-                        topo_rh,
-                    ) = checkTopology(argsDict["subjects_dir"], subject)
-
-                except Exception as e:
-                    logging.error("ERROR: Topology check failed for " + subject)
-                    logging.error("Reason: " + str(e))
-                    holes_lh = np.nan
-                    holes_rh = np.nan
-                    defects_lh = np.nan
-                    defects_rh = np.nan
-                    topo_lh = np.nan
-                    topo_rh = np.nan
-                    metrics_status = 1
-                    if argsDict["exit_on_error"] is True:
-                        raise
-
-                # check contrast
-                try:
-                    con_snr_lh, con_snr_rh = checkContrast(
-                        argsDict["subjects_dir"], subject
-                    )
+    # return
+    return {
+        "metrics": metricsDict,
+        "status": {"metrics": metrics_status},
+        "images": imagesDict,
+    }
 
-                except Exception as e:
-                    logging.error("ERROR: Contrast check failed for " + subject)
-                    logging.error("Reason: " + str(e))
-                    con_snr_lh = np.nan
-                    con_snr_rh = np.nan
-                    metrics_status = 1
-                    if argsDict["exit_on_error"] is True:
-                        raise
-
-                # check rotation
-                try:
-                    rot_tal_x, rot_tal_y, rot_tal_z = checkRotation(
-                        argsDict["subjects_dir"], subject
-                    )
 
-                except Exception as e:
-                    logging.error("ERROR: Rotation failed for " + subject)
-                    logging.error("Reason: " + str(e))
-                    rot_tal_x = np.nan
-                    rot_tal_y = np.nan
-                    rot_tal_z = np.nan
-                    metrics_status = 1
-                    if argsDict["exit_on_error"] is True:
-                        raise
-
-                # store data
-                metricsDict[subject].update(
-                    {
-                        "wm_snr_orig": wm_snr_orig,
-                        "gm_snr_orig": gm_snr_orig,
-                        "wm_snr_norm": wm_snr_norm,
-                        "gm_snr_norm": gm_snr_norm,
-                        "cc_size": cc_size,
-                        "holes_lh": holes_lh,
-                        "holes_rh": holes_rh,
-                        "defects_lh": defects_lh,
-                        "defects_rh": defects_rh,
-                        "topo_lh": topo_lh,
-                        "topo_rh": topo_rh,
-                        "con_snr_lh": con_snr_lh,
-                        "con_snr_rh": con_snr_rh,
-                        "rot_tal_x": rot_tal_x,
-                        "rot_tal_y": rot_tal_y,
-                        "rot_tal_z": rot_tal_z,
-                    }
-                )
+# ------------------------------------------------------------------------------
+# do fsqc: shape analysis
 
-                # write to file
-                pd.DataFrame(metricsDict[subject], index=[subject]).to_csv(
-                    os.path.join(
-                        argsDict["output_dir"], "metrics", subject, "metrics.csv"
-                    )
-                )
 
-            elif metrics_status == 3:
-                metricsDict[subject] = (
-                    metricsDict[subject]
-                    | pd.read_csv(
-                        os.path.join(metrics_outdir, "metrics.csv"),
-                        dtype={"Unnamed: 0": str, "subject": str},
-                    )
-                    .set_index("Unnamed: 0")
-                    .to_dict(orient="index")[subject]
-                )
+def _do_fsqc_shape(subject, argsDict, status_dict):
+    """
+    Run the shape analysis module for a single subject.
 
-            # note that we cannot "not do" the metrics module, only skipping is possible.
-            # hence no metrics_status == 2 possible.
+    Parameters
+    ----------
+    subject : str
+        Subject ID.
+    argsDict : dict
+        Dictionary containing input arguments.
+    status_dict : dict
+        Dictionary with the module status of a previous run; empty if no
+        statusfile was found.
 
-            # store data
-            statusDict[subject].update({"metrics": metrics_status})
+    Returns
+    -------
+    dict
+        Dictionary with the keys 'metrics', 'status', and 'images', containing
+        the subject-specific results of the module. Additionally, the
+        'shape' key contains the results of the shape analysis.
+    """
 
-            # ----------------------------------------------------------------------
-            # run optional modules: shape analysis
+    # imports
+    import logging
+    import os
+    from pathlib import Path
 
-            if argsDict["shape"] is True:
-                # determine status
-                shape_status = 0
-                if argsDict["skip_existing"] is True:
-                    if len(status_dict) > 0:
-                        if (
-                            statusDict[subject]["shape"] == 0
-                            or statusDict[subject]["shape"] == 3
-                        ):
-                            shape_status = 3
-                            logging.info("Skipping shape computation for " + subject)
-                        else:
-                            logging.info(
-                                "Not skipping shape computation for "
-                                + subject
-                                + ": statusfile did not indicate ok or skipped"
-                            )
-                    else:
-                        logging.info(
-                            "Not skipping shape computation for "
-                            + subject
-                            + ": no statusfile was found"
-                        )
+    import pandas as pd
+
+    # create dicts
+    metricsDict = dict()
+    imagesDict = dict()
+    distDict = dict()
 
-                # check / create subject-specific brainprint_outdir
-                brainprint_outdir = Path(
-                    os.path.join(argsDict["output_dir"], "brainprint", subject)
+    if argsDict["shape"] is True:
+        # determine status
+        shape_status = 0
+        if argsDict["skip_existing"] is True:
+            if len(status_dict) > 0:
+                if status_dict["shape"] == 0 or status_dict["shape"] == 3:
+                    shape_status = 3
+                    logging.info("Skipping shape computation for " + subject)
+                else:
+                    logging.info(
+                        "Not skipping shape computation for "
+                        + subject
+                        + ": statusfile did not indicate ok or skipped"
+                    )
+            else:
+                logging.info(
+                    "Not skipping shape computation for "
+                    + subject
+                    + ": no statusfile was found"
                 )
 
-                #
-                if shape_status == 0:
-                    #
-                    try:
-                        # message
-                        print("-----------------------------")
-                        print("Running brainPrint analysis ...")
-                        print("")
-
-                        # compute brainprint (will also compute shapeDNA)
-                        import brainprint
-
-                        # run brainPrint
-                        evMat, evecMat, dstMat = brainprint.brainprint.run_brainprint(
-                            subjects_dir=argsDict["subjects_dir"],
-                            subject_id=subject,
-                            destination=brainprint_outdir,
-                            keep_eigenvectors=SHAPE_EVEC,
-                            skip_cortex=SHAPE_SKIPCORTEX,
-                            num=SHAPE_NUM,
-                            norm=SHAPE_NORM,
-                            reweight=SHAPE_REWEIGHT,
-                            asymmetry=SHAPE_ASYMMETRY,
-                        )
+        # check / create subject-specific brainprint_outdir
+        brainprint_outdir = Path(
+            os.path.join(argsDict["output_dir"], "brainprint", subject)
+        )
 
-                        # get a subset of the brainprint results
-                        distDict = {subject: dstMat}
+        #
+        if shape_status == 0:
+            #
+            try:
+                # message
+                print("-----------------------------")
+                print("Running brainPrint analysis ...")
+                print("")
 
-                        # return
-                        shape_status = 0
+                # compute brainprint (will also compute shapeDNA)
+                import brainprint
+
+                # run brainPrint
+                evMat, evecMat, dstMat = brainprint.brainprint.run_brainprint(
+                    subjects_dir=argsDict["subjects_dir"],
+                    subject_id=subject,
+                    destination=brainprint_outdir,
+                    keep_eigenvectors=SHAPE_EVEC,
+                    skip_cortex=SHAPE_SKIPCORTEX,
+                    num=SHAPE_NUM,
+                    norm=SHAPE_NORM,
+                    reweight=SHAPE_REWEIGHT,
+                    asymmetry=SHAPE_ASYMMETRY,
+                )
 
-                    #
-                    except Exception as e:
-                        distDict = {subject: []}
-                        logging.error(
-                            "ERROR: the shape module failed for subject " + subject
-                        )
-                        logging.error("Reason: " + str(e))
-                        shape_status = 1
-                        if argsDict["exit_on_error"] is True:
-                            raise
+                # get a subset of the brainprint results
+                distDict = {subject: dstMat}
 
-                elif shape_status == 3:
-                    # read results from previous run
-                    dstMat = pd.read_csv(
-                        brainprint_outdir / (subject + ".brainprint.asymmetry.csv")
-                    ).to_dict(orient="index")[0]
-                    distDict = {subject: dstMat}
+                # return
+                shape_status = 0
 
-                # store data
-                metricsDict[subject].update(distDict[subject])
+            #
+            except Exception as e:
+                distDict = {subject: []}
+                logging.error("ERROR: the shape module failed for subject " + subject)
+                logging.error("Reason: " + str(e))
+                shape_status = 1
+                if argsDict["exit_on_error"] is True:
+                    raise
 
-            else:
-                shape_status = 2
+        elif shape_status == 3:
+            # read results from previous run
+            dstMat = pd.read_csv(
+                brainprint_outdir / (subject + ".brainprint.asymmetry.csv")
+            ).to_dict(orient="index")[0]
+            distDict = {subject: dstMat}
 
-            # store data
-            statusDict[subject].update({"shape": shape_status})
+        # store data
+        metricsDict.update(distDict[subject])
 
-            # ----------------------------------------------------------------------
-            # run optional modules: screenshots
+    else:
+        shape_status = 2
 
-            if argsDict["screenshots"] is True or argsDict["screenshots_html"] is True:
+    # return
+    return {
+        "metrics": metricsDict,
+        "status": {"shape": shape_status},
+        "images": imagesDict,
+        "shape": distDict.get(subject),
+    }
 
-                # determine status
-                screenshots_status = 0
-                if argsDict["skip_existing"] is True:
-                    if len(status_dict) > 0:
-                        if (
-                            statusDict[subject]["screenshots"] == 0
-                            or statusDict[subject]["screenshots"] == 3
-                        ):
-                            screenshots_status = 3
-                            logging.info(
-                                "Skipping screenshots computation for " + subject
-                            )
-                        else:
-                            logging.info(
-                                "Not skipping screenshots computation for "
-                                + subject
-                                + ": statusfile did not indicate ok or skipped"
-                            )
-                    else:
-                        logging.info(
-                            "Not skipping screenshots computation for "
-                            + subject
-                            + ": no statusfile was found"
-                        )
 
-                # check / create subject-specific screenshots_outdir
-                screenshots_outdir = os.path.join(
-                    argsDict["output_dir"], "screenshots", subject
-                )
-                if not os.path.isdir(screenshots_outdir):
-                    os.makedirs(screenshots_outdir)
-                outfile = os.path.join(screenshots_outdir, subject + ".png")
+# ------------------------------------------------------------------------------
+# do fsqc: screenshots
 
-                #
-                if screenshots_status == 0:
-                    #
-                    try:
-                        # message
-                        print("-----------------------------")
-                        print("Creating screenshots ...")
-                        print("")
-
-                        # re-initialize
-                        screenshots_base_subj = list()
-                        screenshots_overlay_subj = list()
-                        screenshots_surf_subj = list()
-
-                        # check screenshots_base
-                        if argsDict["screenshots_base"] == "default":
-                            screenshots_base_subj = argsDict["screenshots_base"]
-                            logging.info("Using default for screenshot base image")
-                        elif os.path.isfile(argsDict["screenshots_base"]):
-                            screenshots_base_subj = argsDict["screenshots_base"]
-                            logging.info(
-                                "Using "
-                                + screenshots_base_subj
-                                + " as screenshot base image"
-                            )
-                        elif os.path.isfile(
-                            os.path.join(
-                                argsDict["subjects_dir"],
-                                subject,
-                                "mri",
-                                argsDict["screenshots_base"],
-                            )
-                        ):
-                            screenshots_base_subj = os.path.join(
-                                argsDict["subjects_dir"],
-                                subject,
-                                "mri",
-                                argsDict["screenshots_base"],
-                            )
-                            logging.info(
-                                "Using "
-                                + screenshots_base_subj
-                                + " as screenshot base image"
-                            )
-                        else:
-                            raise FileNotFoundError(
-                                "ERROR: cannot find the screenshots base file "
-                                + argsDict["screenshots_base"]
-                            )
 
-                        # check screenshots_overlay
-                        if argsDict["screenshots_overlay"] is not None:
-                            if argsDict["screenshots_overlay"] == "default":
-                                screenshots_overlay_subj = argsDict[
-                                    "screenshots_overlay"
-                                ]
+def _do_fsqc_screenshots(subject, argsDict, status_dict):
+    """
+    Run the screenshots module for a single subject.
+
+    Parameters
+    ----------
+    subject : str
+        Subject ID.
+    argsDict : dict
+        Dictionary containing input arguments.
+    status_dict : dict
+        Dictionary with the module status of a previous run; empty if no
+        statusfile was found.
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys 'metrics', 'status', and 'images', containing
+        the subject-specific results of the module.
+    """
+
+    # imports
+    import logging
+    import os
+
+    from fsqc.createScreenshots import createScreenshots
+
+    # create dicts
+    metricsDict = dict()
+    imagesDict = dict()
+
+    if argsDict["screenshots"] is True or argsDict["screenshots_html"] is True:
+        # determine status
+        screenshots_status = 0
+        if argsDict["skip_existing"] is True:
+            if len(status_dict) > 0:
+                if status_dict["screenshots"] == 0 or status_dict["screenshots"] == 3:
+                    screenshots_status = 3
+                    logging.info("Skipping screenshots computation for " + subject)
+                else:
+                    logging.info(
+                        "Not skipping screenshots computation for "
+                        + subject
+                        + ": statusfile did not indicate ok or skipped"
+                    )
+            else:
+                logging.info(
+                    "Not skipping screenshots computation for "
+                    + subject
+                    + ": no statusfile was found"
+                )
+
+        # check / create subject-specific screenshots_outdir
+        screenshots_outdir = os.path.join(
+            argsDict["output_dir"], "screenshots", subject
+        )
+        if not os.path.isdir(screenshots_outdir):
+            os.makedirs(screenshots_outdir)
+        outfile = os.path.join(screenshots_outdir, subject + ".png")
+
+        #
+        if screenshots_status == 0:
+            #
+            try:
+                # message
+                print("-----------------------------")
+                print("Creating screenshots ...")
+                print("")
+
+                # re-initialize
+                screenshots_base_subj = list()
+                screenshots_overlay_subj = list()
+                screenshots_surf_subj = list()
+
+                # check screenshots_base
+                if argsDict["screenshots_base"] == "default":
+                    screenshots_base_subj = argsDict["screenshots_base"]
+                    logging.info("Using default for screenshot base image")
+                elif os.path.isfile(argsDict["screenshots_base"]):
+                    screenshots_base_subj = argsDict["screenshots_base"]
+                    logging.info(
+                        "Using " + screenshots_base_subj + " as screenshot base image"
+                    )
+                elif os.path.isfile(
+                    os.path.join(
+                        argsDict["subjects_dir"],
+                        subject,
+                        "mri",
+                        argsDict["screenshots_base"],
+                    )
+                ):
+                    screenshots_base_subj = os.path.join(
+                        argsDict["subjects_dir"],
+                        subject,
+                        "mri",
+                        argsDict["screenshots_base"],
+                    )
+                    logging.info(
+                        "Using " + screenshots_base_subj + " as screenshot base image"
+                    )
+                else:
+                    raise FileNotFoundError(
+                        "ERROR: cannot find the screenshots base file "
+                        + argsDict["screenshots_base"]
+                    )
+
+                # check screenshots_overlay
+                if argsDict["screenshots_overlay"] is not None:
+                    if argsDict["screenshots_overlay"] == "default":
+                        screenshots_overlay_subj = argsDict["screenshots_overlay"]
+                        logging.info("Using default for screenshot overlay image")
+                    elif os.path.isfile(argsDict["screenshots_overlay"]):
+                        screenshots_overlay_subj = argsDict["screenshots_overlay"]
+                        logging.info(
+                            "Using "
+                            + screenshots_overlay_subj
+                            + " as screenshot overlay image"
+                        )
+                    elif os.path.isfile(
+                        os.path.join(
+                            argsDict["subjects_dir"],
+                            subject,
+                            "mri",
+                            argsDict["screenshots_overlay"],
+                        )
+                    ):
+                        screenshots_overlay_subj = os.path.join(
+                            argsDict["subjects_dir"],
+                            subject,
+                            "mri",
+                            argsDict["screenshots_overlay"],
+                        )
+                        logging.info(
+                            "Using "
+                            + screenshots_overlay_subj
+                            + " as screenshot overlay image"
+                        )
+                    else:
+                        raise FileNotFoundError(
+                            "ERROR: cannot find the screenshots overlay file "
+                            + argsDict["screenshots_overlay"]
+                        )
+                else:
+                    screenshots_overlay_subj = argsDict["screenshots_overlay"]
+
+                # check screenshots_surf
+                if argsDict["screenshots_surf"] is not None:
+                    if isinstance(argsDict["screenshots_surf"], str):
+                        if argsDict["screenshots_surf"] == "default":
+                            screenshots_surf_subj = "default"
+                            logging.info("Using default for screenshot surface")
+                        else:
+                            if os.path.isfile(argsDict["screenshots_surf"]):
                                 logging.info(
-                                    "Using default for screenshot overlay image"
+                                    "Using "
+                                    + argsDict["screenshots_surf"]
+                                    + " as screenshot surface"
                                 )
-                            elif os.path.isfile(argsDict["screenshots_overlay"]):
-                                screenshots_overlay_subj = argsDict[
-                                    "screenshots_overlay"
-                                ]
+                                screenshots_surf_subj = [argsDict["screenshots_surf"]]
+                            else:
+                                raise FileNotFoundError(
+                                    "ERROR: cannot find the screenshots surface file "
+                                    + argsDict["screenshots_surf"]
+                                )
+                    elif isinstance(argsDict["screenshots_surf"], list):
+                        for screenshots_surf_i in argsDict["screenshots_surf"]:
+                            if os.path.isfile(screenshots_surf_i):
                                 logging.info(
                                     "Using "
-                                    + screenshots_overlay_subj
-                                    + " as screenshot overlay image"
+                                    + screenshots_surf_i
+                                    + " as screenshot surface"
                                 )
                             elif os.path.isfile(
                                 os.path.join(
                                     argsDict["subjects_dir"],
                                     subject,
-                                    "mri",
-                                    argsDict["screenshots_overlay"],
+                                    "surf",
+                                    screenshots_surf_i,
                                 )
                             ):
-                                screenshots_overlay_subj = os.path.join(
+                                screenshots_surf_i = os.path.join(
                                     argsDict["subjects_dir"],
                                     subject,
-                                    "mri",
-                                    argsDict["screenshots_overlay"],
+                                    "surf",
+                                    screenshots_surf_i,
                                 )
                                 logging.info(
                                     "Using "
-                                    + screenshots_overlay_subj
-                                    + " as screenshot overlay image"
+                                    + screenshots_surf_i
+                                    + " as screenshot surface"
                                 )
                             else:
                                 raise FileNotFoundError(
-                                    "ERROR: cannot find the screenshots overlay file "
-                                    + argsDict["screenshots_overlay"]
+                                    "ERROR: cannot find the screenshots surface file "
+                                    + screenshots_surf_i
                                 )
-                        else:
-                            screenshots_overlay_subj = argsDict["screenshots_overlay"]
-
-                        # check screenshots_surf
-                        if argsDict["screenshots_surf"] is not None:
-                            if isinstance(argsDict["screenshots_surf"], str):
-                                if argsDict["screenshots_surf"] == "default":
-                                    screenshots_surf_subj = "default"
-                                    logging.info("Using default for screenshot surface")
-                                else:
-                                    if os.path.isfile(argsDict["screenshots_surf"]):
-                                        logging.info(
-                                            "Using "
-                                            + argsDict["screenshots_surf"]
-                                            + " as screenshot surface"
-                                        )
-                                        screenshots_surf_subj = [argsDict["screenshots_surf"]]
-                                    else:
-                                        raise FileNotFoundError(
-                                            "ERROR: cannot find the screenshots surface file "
-                                            + argsDict["screenshots_surf"]
-                                        )
-                            elif isinstance(argsDict["screenshots_surf"], list):
-                                for screenshots_surf_i in argsDict["screenshots_surf"]:
-                                    if os.path.isfile(screenshots_surf_i):
-                                        logging.info(
-                                            "Using "
-                                            + screenshots_surf_i
-                                            + " as screenshot surface"
-                                        )
-                                    elif os.path.isfile(
-                                        os.path.join(
-                                            argsDict["subjects_dir"],
-                                            subject,
-                                            "surf",
-                                            screenshots_surf_i,
-                                        )
-                                    ):
-                                        screenshots_surf_i = os.path.join(
-                                            argsDict["subjects_dir"],
-                                            subject,
-                                            "surf",
-                                            screenshots_surf_i,
-                                        )
-                                        logging.info(
-                                            "Using "
-                                            + screenshots_surf_i
-                                            + " as screenshot surface"
-                                        )
-                                    else:
-                                        raise FileNotFoundError(
-                                            "ERROR: cannot find the screenshots surface file "
-                                            + screenshots_surf_i
-                                        )
-                                    screenshots_surf_subj.append(screenshots_surf_i)
-                        else:
-                            screenshots_surf_subj = None
-
-                        # process
-                        createScreenshots(
-                            SUBJECT=subject,
-                            SUBJECTS_DIR=argsDict["subjects_dir"],
-                            OUTFILE=outfile,
-                            INTERACTIVE=False,
-                            BASE=screenshots_base_subj,
-                            OVERLAY=screenshots_overlay_subj,
-                            SURF=screenshots_surf_subj,
-                            VIEWS=argsDict["screenshots_views"],
-                            LAYOUT=argsDict["screenshots_layout"],
-                            ORIENTATION=argsDict["screenshots_orientation"],
+                            screenshots_surf_subj.append(screenshots_surf_i)
+                else:
+                    screenshots_surf_subj = None
+
+                # process
+                createScreenshots(
+                    SUBJECT=subject,
+                    SUBJECTS_DIR=argsDict["subjects_dir"],
+                    OUTFILE=outfile,
+                    INTERACTIVE=False,
+                    BASE=screenshots_base_subj,
+                    OVERLAY=screenshots_overlay_subj,
+                    SURF=screenshots_surf_subj,
+                    VIEWS=argsDict["screenshots_views"],
+                    LAYOUT=argsDict["screenshots_layout"],
+                    ORIENTATION=argsDict["screenshots_orientation"],
+                    ENGINE=argsDict["screenshots_engine"],
+                )
+
+                # return
+                screenshots_status = 0
+
+            #
+            except Exception as e:
+                logging.error("ERROR: screenshots module failed for subject " + subject)
+                logging.error("Reason: " + str(e))
+                screenshots_status = 1
+                if argsDict["exit_on_error"] is True:
+                    raise
+
+        # store data
+        if screenshots_status == 0 or screenshots_status == 3:
+            imagesDict["screenshots"] = outfile
+        else:
+            imagesDict["screenshots"] = []
+
+    else:
+        screenshots_status = 2
+
+    # return
+    return {
+        "metrics": metricsDict,
+        "status": {"screenshots": screenshots_status},
+        "images": imagesDict,
+    }
+
+
+# ------------------------------------------------------------------------------
+# do fsqc: surface plots
+
+
+def _do_fsqc_surfaces(subject, argsDict, status_dict):
+    """
+    Run the surface plots module for a single subject.
+
+    Parameters
+    ----------
+    subject : str
+        Subject ID.
+    argsDict : dict
+        Dictionary containing input arguments.
+    status_dict : dict
+        Dictionary with the module status of a previous run; empty if no
+        statusfile was found.
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys 'metrics', 'status', and 'images', containing
+        the subject-specific results of the module.
+    """
+
+    # imports
+    import logging
+    import os
+
+    from fsqc.createSurfacePlots import createSurfacePlots
+
+    # create dicts
+    metricsDict = dict()
+    imagesDict = dict()
+
+    if argsDict["surfaces"] is True or argsDict["surfaces_html"] is True:
+        # determine status
+        surfaces_status = 0
+        if argsDict["skip_existing"] is True:
+            if len(status_dict) > 0:
+                if status_dict["surfaces"] == 0 or status_dict["surfaces"] == 3:
+                    surfaces_status = 3
+                    logging.info("Skipping surfaces computation for " + subject)
+                else:
+                    logging.info(
+                        "Not skipping surfaces computation for "
+                        + subject
+                        + ": statusfile did not indicate ok or skipped"
+                    )
+            else:
+                logging.info(
+                    "Not skipping surfaces computation for "
+                    + subject
+                    + ": no statusfile was found"
+                )
+
+        # check / create subject-specific surfaces_outdir
+        surfaces_outdir = os.path.join(argsDict["output_dir"], "surfaces", subject)
+        if not os.path.isdir(surfaces_outdir):
+            os.makedirs(surfaces_outdir)
+
+        #
+        if surfaces_status == 0:
+            #
+            try:
+                # message
+                print("-----------------------------")
+                print("Creating surface plots ...")
+                print("")
+
+                # process
+                createSurfacePlots(
+                    SUBJECT=subject,
+                    SUBJECTS_DIR=argsDict["subjects_dir"],
+                    SURFACES_OUTDIR=surfaces_outdir,
+                    VIEWS=argsDict["surfaces_views"],
+                    FASTSURFER=argsDict["fastsurfer"],
+                    BACKEND=argsDict["surfaces_backend"],
+                    DECIMATE=argsDict["surfaces_decimate"],
+                    N_JOBS=argsDict["surfaces_n_jobs"],
+                )
+                # return
+                surfaces_status = 0
+
+            #
+            except Exception as e:
+                logging.error("ERROR: surfaces module failed for subject " + subject)
+                logging.error("Reason: " + str(e))
+                surfaces_status = 1
+                if argsDict["exit_on_error"] is True:
+                    raise
+
+        # store data
+        if surfaces_status == 0 or surfaces_status == 3:
+            imagesDict["surfaces"] = surfaces_outdir
+        else:
+            imagesDict["surfaces"] = []
+
+    else:
+        surfaces_status = 2
+
+    # return
+    return {
+        "metrics": metricsDict,
+        "status": {"surfaces": surfaces_status},
+        "images": imagesDict,
+    }
+
+
+# ------------------------------------------------------------------------------
+# do fsqc: skullstrip
+
+
+def _do_fsqc_skullstrip(subject, argsDict, status_dict):
+    """
+    Run the skullstrip module for a single subject.
+
+    Parameters
+    ----------
+    subject : str
+        Subject ID.
+    argsDict : dict
+        Dictionary containing input arguments.
+    status_dict : dict
+        Dictionary with the module status of a previous run; empty if no
+        statusfile was found.
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys 'metrics', 'status', and 'images', containing
+        the subject-specific results of the module.
+    """
+
+    # imports
+    import logging
+    import os
+
+    from fsqc.createScreenshots import createScreenshots
+
+    # create dicts
+    metricsDict = dict()
+    imagesDict = dict()
+
+    if argsDict["skullstrip"] is True or argsDict["skullstrip_html"] is True:
+        # determine status
+        skullstrip_status = 0
+        if argsDict["skip_existing"] is True:
+            if len(status_dict) > 0:
+                if status_dict["skullstrip"] == 0 or status_dict["skullstrip"] == 3:
+                    skullstrip_status = 3
+                    logging.info("Skipping skullstrip computation for " + subject)
+                else:
+                    logging.info(
+                        "Not skipping skullstrip computation for "
+                        + subject
+                        + ": statusfile did not indicate ok or skipped"
+                    )
+            else:
+                logging.info(
+                    "Not skipping skullstrip computation for "
+                    + subject
+                    + ": no statusfile was found"
+                )
+
+        # check / create subject-specific skullstrip_outdir
+        skullstrip_outdir = os.path.join(argsDict["output_dir"], "skullstrip", subject)
+        if not os.path.isdir(skullstrip_outdir):
+            os.makedirs(skullstrip_outdir)
+        outfile = os.path.join(skullstrip_outdir, subject + ".png")
+
+        #
+        if skullstrip_status == 0:
+            #
+            try:
+                # message
+                print("-----------------------------")
+                print("Creating skullstrip evaluation  ...")
+                print("")
+
+                # re-initialize
+                skullstrip_base_subj = list()
+                skullstrip_overlay_subj = list()
+
+                # check skullstrip_base
+                if os.path.isfile(
+                    os.path.join(argsDict["subjects_dir"], subject, "mri", "orig.mgz")
+                ):
+                    skullstrip_base_subj = os.path.join(
+                        argsDict["subjects_dir"], subject, "mri", "orig.mgz"
+                    )
+                    logging.info("Using " + "orig.mgz" + " as skullstrip base image")
+                else:
+                    raise FileNotFoundError(
+                        "ERROR: cannot find the skullstrip base file " + "orig.mgz"
+                    )
+
+                # check skullstrip_overlay
+                if os.path.isfile(
+                    os.path.join(
+                        argsDict["subjects_dir"],
+                        subject,
+                        "mri",
+                        "brainmask.mgz",
+                    )
+                ):
+                    skullstrip_overlay_subj = os.path.join(
+                        argsDict["subjects_dir"],
+                        subject,
+                        "mri",
+                        "brainmask.mgz",
+                    )
+                    logging.info(
+                        "Using " + "brainmask.mgz" + " as skullstrip overlay image"
+                    )
+                else:
+                    raise FileNotFoundError(
+                        "ERROR: cannot find the skullstrip overlay file "
+                        + "brainmask.mgz"
+                    )
+
+                # process
+                createScreenshots(
+                    SUBJECT=subject,
+                    SUBJECTS_DIR=argsDict["subjects_dir"],
+                    OUTFILE=outfile,
+                    INTERACTIVE=False,
+                    BASE=skullstrip_base_subj,
+                    OVERLAY=skullstrip_overlay_subj,
+                    SURF=None,
+                    VIEWS=argsDict["screenshots_views"],
+                    LAYOUT=argsDict["screenshots_layout"],
+                    BINARIZE=True,
+                    ORIENTATION=argsDict["screenshots_orientation"],
+                    ENGINE=argsDict["screenshots_engine"],
+                )
+
+                # return
+                skullstrip_status = 0
+
+            #
+            except Exception as e:
+                logging.error("ERROR: skullstrip module failed for subject " + subject)
+                logging.error("Reason: " + str(e))
+                skullstrip_status = 1
+                if argsDict["exit_on_error"] is True:
+                    raise
+
+        # store data
+        if skullstrip_status == 0 or skullstrip_status == 3:
+            imagesDict["skullstrip"] = outfile
+        else:
+            imagesDict["skullstrip"] = []
+
+    else:
+        skullstrip_status = 2
+
+    # return
+    return {
+        "metrics": metricsDict,
+        "status": {"skullstrip": skullstrip_status},
+        "images": imagesDict,
+    }
+
+
+# ------------------------------------------------------------------------------
+# do fsqc: fornix
+
+
+def _do_fsqc_fornix(subject, argsDict, status_dict):
+    """
+    Run the fornix module for a single subject.
+
+    Parameters
+    ----------
+    subject : str
+        Subject ID.
+    argsDict : dict
+        Dictionary containing input arguments.
+    status_dict : dict
+        Dictionary with the module status of a previous run; empty if no
+        statusfile was found.
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys 'metrics', 'status', and 'images', containing
+        the subject-specific results of the module. Additionally, the
+        'fornix' key contains the results of the fornix shape analysis.
+    """
+
+    # imports
+    import logging
+    import os
+
+    import numpy as np
+    import pandas as pd
+
+    from fsqc.evaluateFornixSegmentation import evaluateFornixSegmentation
+
+    # create dicts
+    metricsDict = dict()
+    imagesDict = dict()
+    fornixShapeDict = dict()
+
+    if argsDict["fornix"] is True or argsDict["fornix_html"] is True:
+        # determine status
+        fornix_status = 0
+        if argsDict["skip_existing"] is True:
+            if len(status_dict) > 0:
+                if status_dict["fornix"] == 0 or status_dict["fornix"] == 3:
+                    fornix_status = 3
+                    logging.info("Skipping fornix computation for " + subject)
+                else:
+                    logging.info(
+                        "Not skipping fornix computation for "
+                        + subject
+                        + ": statusfile did not indicate ok or skipped"
+                    )
+            else:
+                logging.info(
+                    "Not skipping fornix computation for "
+                    + subject
+                    + ": no statusfile was found"
+                )
+
+        # check / create subject-specific fornix_outdir
+        fornix_outdir = os.path.join(argsDict["output_dir"], "fornix", subject)
+        if not os.path.isdir(fornix_outdir):
+            os.makedirs(fornix_outdir)
+        fornix_screenshot_outfile = os.path.join(fornix_outdir, "cc.png")
+
+        #
+        if fornix_status == 0:
+            #
+            try:
+                # message
+                print("-----------------------------")
+                print("Checking fornix segmentation ...")
+                print("")
+
+                # process
+                fornixShapeOutput = evaluateFornixSegmentation(
+                    SUBJECT=subject,
+                    SUBJECTS_DIR=argsDict["subjects_dir"],
+                    OUTPUT_DIR=fornix_outdir,
+                    CREATE_SCREENSHOT=FORNIX_SCREENSHOT,
+                    SCREENSHOTS_OUTFILE=fornix_screenshot_outfile,
+                    SCREENSHOTS_ENGINE=argsDict["screenshots_engine"],
+                    RUN_SHAPEDNA=FORNIX_SHAPE,
+                    N_EIGEN=FORNIX_N_EIGEN,
+                    WRITE_EIGEN=FORNIX_WRITE_EIGEN,
+                    WRITE_INTERMEDIATES=FORNIX_WRITE_INTERMEDIATES,
+                )
+
+                # create a dictionary from fornix shape output
+                fornixShapeDict = {
+                    subject: dict(
+                        zip(
+                            map(
+                                "fornixShapeEV{:0>3}".format,
+                                range(FORNIX_N_EIGEN),
+                            ),
+                            fornixShapeOutput,
+                        )
+                    )
+                }
+
+                # return
+                fornix_status = 0
+
+            #
+            except Exception as e:
+                fornixShapeDict = {
+                    subject: dict(
+                        zip(
+                            map(
+                                "fornixShapeEV{:0>3}".format,
+                                range(FORNIX_N_EIGEN),
+                            ),
+                            np.full(FORNIX_N_EIGEN, np.nan),
+                        )
+                    )
+                }
+                logging.error("ERROR: fornix module failed for subject " + subject)
+                logging.error("Reason: " + str(e))
+                fornix_status = 1
+                if argsDict["exit_on_error"] is True:
+                    raise
+
+            # store data
+            if FORNIX_SHAPE:
+                metricsDict.update(fornixShapeDict[subject])
+
+        elif fornix_status == 3:
+            if FORNIX_SHAPE:
+                # read results from previous run
+                fornixShapeOutput = np.array(
+                    pd.read_csv(os.path.join(fornix_outdir, subject + ".fornix.csv"))
+                )[0]
+                fornixShapeDict = {
+                    subject: dict(
+                        zip(
+                            map(
+                                "fornixShapeEV{:0>3}".format,
+                                range(FORNIX_N_EIGEN),
+                            ),
+                            fornixShapeOutput,
                         )
+                    )
+                }
+                metricsDict.update(fornixShapeDict[subject])
+
+        # store data
+        if FORNIX_SCREENSHOT and (fornix_status == 0 or fornix_status == 3):
+            imagesDict["fornix"] = fornix_screenshot_outfile
+        else:
+            imagesDict["fornix"] = []
+
+    else:
+        fornix_status = 2
+
+    # return
+    return {
+        "metrics": metricsDict,
+        "status": {"fornix": fornix_status},
+        "images": imagesDict,
+        "fornix": fornixShapeDict.get(subject),
+    }
+
+
+# ------------------------------------------------------------------------------
+# do fsqc: hypothalamus
+
+
+def _do_fsqc_hypothalamus(subject, argsDict, status_dict):
+    """
+    Run the hypothalamus module for a single subject.
+
+    Parameters
+    ----------
+    subject : str
+        Subject ID.
+    argsDict : dict
+        Dictionary containing input arguments.
+    status_dict : dict
+        Dictionary with the module status of a previous run; empty if no
+        statusfile was found.
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys 'metrics', 'status', and 'images', containing
+        the subject-specific results of the module.
+    """
+
+    # imports
+    import logging
+    import os
+
+    from fsqc.evaluateHypothalamicSegmentation import evaluateHypothalamicSegmentation
+
+    # create dicts
+    metricsDict = dict()
+    imagesDict = dict()
+
+    if argsDict["hypothalamus"] is True or argsDict["hypothalamus_html"] is True:
+        # determine status
+        hypothalamus_status = 0
+        if argsDict["skip_existing"] is True:
+            if len(status_dict) > 0:
+                if status_dict["hypothalamus"] == 0 or status_dict["hypothalamus"] == 3:
+                    hypothalamus_status = 3
+                    logging.info("Skipping hypothalamus computation for " + subject)
+                else:
+                    logging.info(
+                        "Not skipping hypothalamus computation for "
+                        + subject
+                        + ": statusfile did not indicate ok or skipped"
+                    )
+            else:
+                logging.info(
+                    "Not skipping hypothalamus computation for "
+                    + subject
+                    + ": no statusfile was found"
+                )
+
+        # check / create subject-specific hypothalamus_outdir
+        hypothalamus_outdir = os.path.join(
+            argsDict["output_dir"], "hypothalamus", subject
+        )
+        if not os.path.isdir(hypothalamus_outdir):
+            os.makedirs(hypothalamus_outdir)
+        hypothalamus_screenshot_outfile = os.path.join(
+            hypothalamus_outdir, "hypothalamus.png"
+        )
+
+        #
+        if hypothalamus_status == 0:
+            #
+            try:
+                # message
+                print("-----------------------------")
+                print("Checking hypothalamus segmentation ...")
+                print("")
+
+                # process
+                evaluateHypothalamicSegmentation(
+                    SUBJECT=subject,
+                    SUBJECTS_DIR=argsDict["subjects_dir"],
+                    OUTPUT_DIR=hypothalamus_outdir,
+                    CREATE_SCREENSHOT=HYPOTHALAMUS_SCREENSHOT,
+                    SCREENSHOTS_OUTFILE=hypothalamus_screenshot_outfile,
+                    SCREENSHOTS_ORIENTATION=argsDict["screenshots_orientation"],
+                    SCREENSHOTS_ENGINE=argsDict["screenshots_engine"],
+                )
+
+                # return
+                hypothalamus_status = 0
+
+            #
+            except Exception as e:
+                logging.error(
+                    "ERROR: hypothalamus module failed for subject " + subject
+                )
+                logging.error("Reason: " + str(e))
+                hypothalamus_status = 1
+                if argsDict["exit_on_error"] is True:
+                    raise
+
+        # store data
+        if HYPOTHALAMUS_SCREENSHOT and (
+            hypothalamus_status == 0 or hypothalamus_status == 3
+        ):
+            imagesDict["hypothalamus"] = hypothalamus_screenshot_outfile
+        else:
+            imagesDict["hypothalamus"] = []
+
+    else:
+        hypothalamus_status = 2
+
+    # return
+    return {
+        "metrics": metricsDict,
+        "status": {"hypothalamus": hypothalamus_status},
+        "images": imagesDict,
+    }
+
+
+# ------------------------------------------------------------------------------
+# do fsqc: hippocampus
+
+
+def _do_fsqc_hippocampus(subject, argsDict, status_dict):
+    """
+    Run the hippocampus module for a single subject.
+
+    Parameters
+    ----------
+    subject : str
+        Subject ID.
+    argsDict : dict
+        Dictionary containing input arguments.
+    status_dict : dict
+        Dictionary with the module status of a previous run; empty if no
+        statusfile was found.
 
-                        # return
-                        screenshots_status = 0
+    Returns
+    -------
+    dict
+        Dictionary with the keys 'metrics', 'status', and 'images', containing
+        the subject-specific results of the module.
+    """
 
-                    #
-                    except Exception as e:
-                        logging.error(
-                            "ERROR: screenshots module failed for subject " + subject
-                        )
-                        logging.error("Reason: " + str(e))
-                        screenshots_status = 1
-                        if argsDict["exit_on_error"] is True:
-                            raise
-
-                # store data
-                if screenshots_status == 0 or screenshots_status == 3:
-                    imagesScreenshotsDict[subject] = outfile
-                else:
-                    imagesScreenshotsDict[subject] = []
+    # imports
+    import logging
+    import os
 
-            else:
-                screenshots_status = 2
+    from fsqc.evaluateHippocampalSegmentation import evaluateHippocampalSegmentation
 
-            # store data
-            statusDict[subject].update({"screenshots": screenshots_status})
+    # create dicts
+    metricsDict = dict()
+    imagesDict = dict()
+
+    if argsDict["hippocampus"] is True or argsDict["hippocampus_html"] is True:
+        # determine status
+        hippocampus_status = 0
+        if argsDict["skip_existing"] is True:
+            if len(status_dict) > 0:
+                if status_dict["hippocampus"] == 0 or status_dict["hippocampus"] == 3:
+                    hippocampus_status = 3
+                    logging.info("Skipping hippocampus computation for " + subject)
+                else:
+                    logging.info(
+                        "Not skipping hippocampus computation for "
+                        + subject
+                        + ": statusfile did not indicate ok or skipped"
+                    )
+            else:
+                logging.info(
+                    "Not skipping hippocampus computation for "
+                    + subject
+                    + ": no statusfile was found"
+                )
 
-            # ----------------------------------------------------------------------
-            # run optional modules: surface plots
+        # check / create subject-specific hippocampus_outdir
+        hippocampus_outdir = os.path.join(
+            argsDict["output_dir"], "hippocampus", subject
+        )
+        if not os.path.isdir(hippocampus_outdir):
+            os.makedirs(hippocampus_outdir)
+        hippocampus_screenshot_outfile_left = os.path.join(
+            hippocampus_outdir, "hippocampus-left.png"
+        )
+        hippocampus_screenshot_outfile_right = os.path.join(
+            hippocampus_outdir, "hippocampus-right.png"
+        )
 
-            if argsDict["surfaces"] is True or argsDict["surfaces_html"] is True:
-                # determine status
-                surfaces_status = 0
-                if argsDict["skip_existing"] is True:
-                    if len(status_dict) > 0:
-                        if (
-                            statusDict[subject]["surfaces"] == 0
-                            or statusDict[subject]["surfaces"] == 3
-                        ):
-                            surfaces_status = 3
-                            logging.info("Skipping surfaces computation for " + subject)
-                        else:
-                            logging.info(
-                                "Not skipping surfaces computation for "
-                                + subject
-                                + ": statusfile did not indicate ok or skipped"
-                            )
-                    else:
-                        logging.info(
-                            "Not skipping surfaces computation for "
-                            + subject
-                            + ": no statusfile was found"
-                        )
+        #
+        if hippocampus_status == 0:
+            #
+            try:
+                # message
+                print("-----------------------------")
+                print("Checking hippocampus segmentation ...")
+                print("")
 
-                # check / create subject-specific surfaces_outdir
-                surfaces_outdir = os.path.join(
-                    argsDict["output_dir"], "surfaces", subject
+                # process left
+                evaluateHippocampalSegmentation(
+                    SUBJECT=subject,
+                    SUBJECTS_DIR=argsDict["subjects_dir"],
+                    OUTPUT_DIR=hippocampus_outdir,
+                    CREATE_SCREENSHOT=HIPPOCAMPUS_SCREENSHOT,
+                    SCREENSHOTS_OUTFILE=hippocampus_screenshot_outfile_left,
+                    SCREENSHOTS_ORIENTATION=argsDict["screenshots_orientation"],
+                    SCREENSHOTS_ENGINE=argsDict["screenshots_engine"],
+                    HEMI="lh",
+                    LABEL=argsDict["hippocampus_label"],
+                )
+                evaluateHippocampalSegmentation(
+                    SUBJECT=subject,
+                    SUBJECTS_DIR=argsDict["subjects_dir"],
+                    OUTPUT_DIR=hippocampus_outdir,
+                    CREATE_SCREENSHOT=HIPPOCAMPUS_SCREENSHOT,
+                    SCREENSHOTS_OUTFILE=hippocampus_screenshot_outfile_right,
+                    SCREENSHOTS_ORIENTATION=argsDict["screenshots_orientation"],
+                    SCREENSHOTS_ENGINE=argsDict["screenshots_engine"],
+                    HEMI="rh",
+                    LABEL=argsDict["hippocampus_label"],
                 )
-                if not os.path.isdir(surfaces_outdir):
-                    os.makedirs(surfaces_outdir)
 
-                #
-                if surfaces_status == 0:
-                    #
-                    try:
-                        # message
-                        print("-----------------------------")
-                        print("Creating surface plots ...")
-                        print("")
-
-                        # process
-                        createSurfacePlots(
-                            SUBJECT=subject,
-                            SUBJECTS_DIR=argsDict["subjects_dir"],
-                            SURFACES_OUTDIR=surfaces_outdir,
-                            VIEWS=argsDict["surfaces_views"],
-                            FASTSURFER=argsDict["fastsurfer"],
-                        )
-                        # return
-                        surfaces_status = 0
+                # return
+                hippocampus_status = 0
 
-                    #
-                    except Exception as e:
-                        logging.error(
-                            "ERROR: surfaces module failed for subject " + subject
-                        )
-                        logging.error("Reason: " + str(e))
-                        surfaces_status = 1
-                        if argsDict["exit_on_error"] is True:
-                            raise
-
-                # store data
-                if surfaces_status == 0 or surfaces_status == 3:
-                    imagesSurfacesDict[subject] = surfaces_outdir
-                else:
-                    imagesSurfacesDict[subject] = []
+            #
+            except Exception as e:
+                logging.error("ERROR: hippocampus module failed for subject " + subject)
+                logging.error("Reason: " + str(e))
+                hippocampus_status = 1
+                if argsDict["exit_on_error"] is True:
+                    raise
 
-            else:
-                surfaces_status = 2
+        # store data
+        if HIPPOCAMPUS_SCREENSHOT and (
+            hippocampus_status == 0 or hippocampus_status == 3
+        ):
+            imagesDict["hippocampus_left"] = hippocampus_screenshot_outfile_left
+            imagesDict["hippocampus_right"] = hippocampus_screenshot_outfile_right
+        else:
+            imagesDict["hippocampus_left"] = []
+            imagesDict["hippocampus_right"] = []
 
-            # store data
-            statusDict[subject].update({"surfaces": surfaces_status})
+    else:
+        hippocampus_status = 2
 
-            # ----------------------------------------------------------------------
-            # run optional modules: skullstrip
+    # return
+    return {
+        "metrics": metricsDict,
+        "status": {"hippocampus": hippocampus_status},
+        "images": imagesDict,
+    }
 
-            if argsDict["skullstrip"] is True or argsDict["skullstrip_html"] is True:
-                # determine status
-                skullstrip_status = 0
-                if argsDict["skip_existing"] is True:
-                    if len(status_dict) > 0:
-                        if (
-                            statusDict[subject]["skullstrip"] == 0
-                            or statusDict[subject]["skullstrip"] == 3
-                        ):
-                            skullstrip_status = 3
-                            logging.info(
-                                "Skipping skullstrip computation for " + subject
-                            )
-                        else:
-                            logging.info(
-                                "Not skipping skullstrip computation for "
-                                + subject
-                                + ": statusfile did not indicate ok or skipped"
-                            )
-                    else:
-                        logging.info(
-                            "Not skipping skullstrip computation for "
-                            + subject
-                            + ": no statusfile was found"
-                        )
 
-                # check / create subject-specific skullstrip_outdir
-                skullstrip_outdir = os.path.join(
-                    argsDict["output_dir"], "skullstrip", subject
-                )
-                if not os.path.isdir(skullstrip_outdir):
-                    os.makedirs(skullstrip_outdir)
-                outfile = os.path.join(skullstrip_outdir, subject + ".png")
+# ------------------------------------------------------------------------------
+# run tasks
 
-                #
-                if skullstrip_status == 0:
-                    #
-                    try:
-                        # message
-                        print("-----------------------------")
-                        print("Creating skullstrip evaluation  ...")
-                        print("")
-
-                        # re-initialize
-                        skullstrip_base_subj = list()
-                        skullstrip_overlay_subj = list()
-
-                        # check skullstrip_base
-                        if os.path.isfile(
-                            os.path.join(
-                                argsDict["subjects_dir"], subject, "mri", "orig.mgz"
-                            )
-                        ):
-                            skullstrip_base_subj = os.path.join(
-                                argsDict["subjects_dir"], subject, "mri", "orig.mgz"
-                            )
-                            logging.info(
-                                "Using " + "orig.mgz" + " as skullstrip base image"
-                            )
-                        else:
-                            raise FileNotFoundError(
-                                "ERROR: cannot find the skullstrip base file "
-                                + "orig.mgz"
-                            )
 
-                        # check skullstrip_overlay
-                        if os.path.isfile(
-                            os.path.join(
-                                argsDict["subjects_dir"],
-                                subject,
-                                "mri",
-                                "brainmask.mgz",
-                            )
-                        ):
-                            skullstrip_overlay_subj = os.path.join(
-                                argsDict["subjects_dir"],
-                                subject,
-                                "mri",
-                                "brainmask.mgz",
-                            )
-                            logging.info(
-                                "Using "
-                                + "brainmask.mgz"
-                                + " as skullstrip overlay image"
-                            )
-                        else:
-                            raise FileNotFoundError(
-                                "ERROR: cannot find the skullstrip overlay file "
-                                + "brainmask.mgz"
-                            )
+def _run_tasks(tasks, n_threads=1):
+    """
+    Run a set of independent tasks, respecting their shared resources.
 
-                        # process
-                        createScreenshots(
-                            SUBJECT=subject,
-                            SUBJECTS_DIR=argsDict["subjects_dir"],
-                            OUTFILE=outfile,
-                            INTERACTIVE=False,
-                            BASE=skullstrip_base_subj,
-                            OVERLAY=skullstrip_overlay_subj,
-                            SURF=None,
-                            VIEWS=argsDict["screenshots_views"],
-                            LAYOUT=argsDict["screenshots_layout"],
-                            BINARIZE=True,
-                            ORIENTATION=argsDict["screenshots_orientation"],
-                        )
+    Parameters
+    ----------
+    tasks : list of dict
+        List of tasks. Each task is a dictionary with the keys 'name',
+        'function', 'args', and 'resources'. Tasks that share a resource are
+        not run concurrently; otherwise, tasks are started in the given order
+        as soon as a thread is available.
+    n_threads : int, default: 1
+        Maximum number of tasks that are run concurrently. If 1, tasks are run
+        sequentially in the given order.
 
-                        # return
-                        skullstrip_status = 0
+    Returns
+    -------
+    dict
+        Dictionary with the return values of the tasks, keyed by task name.
+    """
 
-                    #
-                    except Exception as e:
-                        logging.error(
-                            "ERROR: skullstrip module failed for subject " + subject
-                        )
-                        logging.error("Reason: " + str(e))
-                        skullstrip_status = 1
-                        if argsDict["exit_on_error"] is True:
-                            raise
-
-                # store data
-                if skullstrip_status == 0 or skullstrip_status == 3:
-                    imagesSkullstripDict[subject] = outfile
-                else:
-                    imagesSkullstripDict[subject] = []
+    # imports
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-            else:
-                skullstrip_status = 2
+    # run tasks
+    results = dict()
 
-            # store data
-            statusDict[subject].update({"skullstrip": skullstrip_status})
+    if n_threads == 1:
+        for task in tasks:
+            results[task["name"]] = task["function"](*task["args"])
 
-            # ----------------------------------------------------------------------
-            # run optional modules: fornix
+    else:
+        pending = list(tasks)
+        running = dict()
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                # start all tasks whose resources are not in use by a running
+                # task
+                resources = set()
+                for task in running.values():
+                    resources.update(task["resources"])
+                for task in list(pending):
+                    if len(running) == n_threads:
+                        break
+                    if resources.isdisjoint(task["resources"]):
+                        future = executor.submit(task["function"], *task["args"])
+                        running[future] = task
+                        resources.update(task["resources"])
+                        pending.remove(task)
+
+                # wait for at least one task to finish
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)["name"]] = future.result()
 
-            if argsDict["fornix"] is True or argsDict["fornix_html"] is True:
-                # determine status
-                fornix_status = 0
-                if argsDict["skip_existing"] is True:
-                    if len(status_dict) > 0:
-                        if (
-                            statusDict[subject]["fornix"] == 0
-                            or statusDict[subject]["fornix"] == 3
-                        ):
-                            fornix_status = 3
-                            logging.info("Skipping fornix computation for " + subject)
-                        else:
-                            logging.info(
-                                "Not skipping fornix computation for "
-                                + subject
-                                + ": statusfile did not indicate ok or skipped"
-                            )
-                    else:
-                        logging.info(
-                            "Not skipping fornix computation for "
-                            + subject
-                            + ": no statusfile was found"
-                        )
+    # return
+    return results
 
-                # check / create subject-specific fornix_outdir
-                fornix_outdir = os.path.join(argsDict["output_dir"], "fornix", subject)
-                if not os.path.isdir(fornix_outdir):
-                    os.makedirs(fornix_outdir)
-                fornix_screenshot_outfile = os.path.join(fornix_outdir, "cc.png")
 
-                #
-                if fornix_status == 0:
-                    #
-                    try:
-                        # message
-                        print("-----------------------------")
-                        print("Checking fornix segmentation ...")
-                        print("")
-
-                        # process
-                        fornixShapeOutput = evaluateFornixSegmentation(
-                            SUBJECT=subject,
-                            SUBJECTS_DIR=argsDict["subjects_dir"],
-                            OUTPUT_DIR=fornix_outdir,
-                            CREATE_SCREENSHOT=FORNIX_SCREENSHOT,
-                            SCREENSHOTS_OUTFILE=fornix_screenshot_outfile,
-                            RUN_SHAPEDNA=FORNIX_SHAPE,
-                            N_EIGEN=FORNIX_N_EIGEN,
-                            WRITE_EIGEN=FORNIX_WRITE_EIGEN,
-                        )
+# ------------------------------------------------------------------------------
+# do fsqc for a single subject
 
-                        # create a dictionary from fornix shape output
-                        fornixShapeDict = {
-                            subject: dict(
-                                zip(
-                                    map(
-                                        "fornixShapeEV{:0>3}".format,
-                                        range(FORNIX_N_EIGEN),
-                                    ),
-                                    fornixShapeOutput,
-                                )
-                            )
-                        }
 
-                        # return
-                        fornix_status = 0
-
-                    #
-                    except Exception as e:
-                        fornixShapeDict = {
-                            subject: dict(
-                                zip(
-                                    map(
-                                        "fornixShapeEV{:0>3}".format,
-                                        range(FORNIX_N_EIGEN),
-                                    ),
-                                    np.full(FORNIX_N_EIGEN, np.nan),
-                                )
-                            )
-                        }
-                        logging.error(
-                            "ERROR: fornix module failed for subject " + subject
-                        )
-                        logging.error("Reason: " + str(e))
-                        fornix_status = 1
-                        if argsDict["exit_on_error"] is True:
-                            raise
-
-                    # store data
-                    if FORNIX_SHAPE:
-                        metricsDict[subject].update(fornixShapeDict[subject])
-
-                elif fornix_status == 3:
-                    if FORNIX_SHAPE:
-                        # read results from previous run
-                        fornixShapeOutput = np.array(
-                            pd.read_csv(
-                                os.path.join(fornix_outdir, subject + ".fornix.csv")
-                            )
-                        )[0]
-                        fornixShapeDict = {
-                            subject: dict(
-                                zip(
-                                    map(
-                                        "fornixShapeEV{:0>3}".format,
-                                        range(FORNIX_N_EIGEN),
-                                    ),
-                                    fornixShapeOutput,
-                                )
-                            )
-                        }
-                        metricsDict[subject].update(fornixShapeDict[subject])
+def _do_fsqc_subject(subject, argsDict):
+    """
+    Run the fsqc submodules for a single subject.
 
-                # store data
-                if FORNIX_SCREENSHOT and (fornix_status == 0 or fornix_status == 3):
-                    imagesFornixDict[subject] = fornix_screenshot_outfile
-                else:
-                    imagesFornixDict[subject] = []
+    Parameters
+    ----------
+    subject : str
+        Subject ID.
+    argsDict : dict
+        Dictionary containing input arguments.
 
-            else:
-                fornix_status = 2
+    Returns
+    -------
+    dict
+        Dictionary with the keys 'metrics', 'status', 'images', 'shape', and
+        'fornix', containing the subject-specific entries of the metrics,
+        status, images, shape and fornix-shape dictionaries.
 
-            # store data
-            statusDict[subject].update({"fornix": fornix_status})
+    Notes
+    -----
+    The modules are set up as a set of tasks, which are independent of each
+    other. If `argsDict["n_threads"]` is larger than one, modules are run
+    concurrently. Tasks that share a resource are never run at the same time;
+    this applies to the modules that render screenshots with matplotlib, which
+    is not thread-safe.
+    """
 
-            # ----------------------------------------------------------------------
-            # run optional modules: hypothalamus
+    # ------------------------------------------------------------------------------
+    # imports
 
-            if (
-                argsDict["hypothalamus"] is True
-                or argsDict["hypothalamus_html"] is True
-            ):
-                # determine status
-                hypothalamus_status = 0
-                if argsDict["skip_existing"] is True:
-                    if len(status_dict) > 0:
-                        if (
-                            statusDict[subject]["hypothalamus"] == 0
-                            or statusDict[subject]["hypothalamus"] == 3
-                        ):
-                            hypothalamus_status = 3
-                            logging.info(
-                                "Skipping hypothalamus computation for " + subject
-                            )
-                        else:
-                            logging.info(
-                                "Not skipping hypothalamus computation for "
-                                + subject
-                                + ": statusfile did not indicate ok or skipped"
-                            )
-                    else:
-                        logging.info(
-                            "Not skipping hypothalamus computation for "
-                            + subject
-                            + ": no statusfile was found"
-                        )
+    import logging
+    import os
+    import time
 
-                # check / create subject-specific hypothalamus_outdir
-                hypothalamus_outdir = os.path.join(
-                    argsDict["output_dir"], "hypothalamus", subject
-                )
-                if not os.path.isdir(hypothalamus_outdir):
-                    os.makedirs(hypothalamus_outdir)
-                hypothalamus_screenshot_outfile = os.path.join(
-                    hypothalamus_outdir, "hypothalamus.png"
-                )
+    import pandas as pd
 
-                #
-                if hypothalamus_status == 0:
-                    #
-                    try:
-                        # message
-                        print("-----------------------------")
-                        print("Checking hypothalamus segmentation ...")
-                        print("")
-
-                        # process
-                        evaluateHypothalamicSegmentation(
-                            SUBJECT=subject,
-                            SUBJECTS_DIR=argsDict["subjects_dir"],
-                            OUTPUT_DIR=hypothalamus_outdir,
-                            CREATE_SCREENSHOT=HYPOTHALAMUS_SCREENSHOT,
-                            SCREENSHOTS_OUTFILE=hypothalamus_screenshot_outfile,
-                            SCREENSHOTS_ORIENTATION=argsDict["screenshots_orientation"],
-                        )
+    from fsqc.fsqcCache import volumeCache
 
-                        # return
-                        hypothalamus_status = 0
+    # --------------------------------------------------------------------------
+    # process
 
-                    #
-                    except Exception as e:
-                        logging.error(
-                            "ERROR: hypothalamus module failed for subject " + subject
-                        )
-                        logging.error("Reason: " + str(e))
-                        hypothalamus_status = 1
-                        if argsDict["exit_on_error"] is True:
-                            raise
-
-                # store data
-                if HYPOTHALAMUS_SCREENSHOT and (
-                    hypothalamus_status == 0 or hypothalamus_status == 3
-                ):
-                    imagesHypothalamusDict[subject] = hypothalamus_screenshot_outfile
-                else:
-                    imagesHypothalamusDict[subject] = []
+    logging.info(
+        "Starting fsqc for subject "
+        + subject
+        + " at "
+        + time.strftime("%Y-%m-%d %H:%M %Z", time.localtime(time.time())),
+    )
 
-            else:
-                hypothalamus_status = 2
+    # ----------------------------------------------------------------------
+    # check for existing statusfile
 
-            # store data
-            statusDict[subject].update({"hypothalamus": hypothalamus_status})
+    # check / create subject-specific status_outdir
+    status_outdir = os.path.join(argsDict["output_dir"], "status", subject)
+    if not os.path.isdir(status_outdir):
+        os.makedirs(status_outdir)
 
-            # ----------------------------------------------------------------------
-            # run optional modules: hippocampus
+    # if it already exists, read statusfile
+    status_dict = dict()
+    if os.path.exists(os.path.join(status_outdir, "status.txt")):
+        status_dict = dict(
+            pd.read_csv(
+                os.path.join(status_outdir, "status.txt"),
+                sep=":",
+                header=None,
+                comment="#",
+                names=["module", "status"],
+                dtype=str,
+            ).to_dict(orient="split")["data"]
+        )
+        for x in [
+            "metrics",
+            "shape",
+            "screenshots",
+            "surfaces",
+            "skullstrip",
+            "fornix",
+            "hypothalamus",
+            "hippocampus",
+        ]:
+            status_dict[x] = int(status_dict[x])
+
+    # note:
+    # 0: OK
+    # 1: Failed
+    # 2: Not done
+    # 3: Skipped
+
+    # ----------------------------------------------------------------------
+    # set up tasks
+
+    # shared resources: matplotlib (including the figure templates of
+    # createScreenshots) is not thread-safe, hence only one module at a time
+    # renders screenshots with it; the raster engine has no shared state
+    if argsDict["screenshots_engine"] == "matplotlib":
+        screenshots_resources = ["matplotlib"]
+    else:
+        screenshots_resources = []
+
+    # the modules are independent of each other, i.e. none of them uses the
+    # outputs of another one; the order of the tasks determines the order of
+    # the results in the metrics and status dictionaries
+    tasks = [
+        {
+            "name": "metrics",
+            "function": _do_fsqc_metrics,
+            "resources": [],
+        },
+        {
+            "name": "shape",
+            "function": _do_fsqc_shape,
+            "resources": [],
+        },
+        {
+            "name": "screenshots",
+            "function": _do_fsqc_screenshots,
+            "resources": screenshots_resources,
+        },
+        {
+            "name": "surfaces",
+            "function": _do_fsqc_surfaces,
+            "resources": [],
+        },
+        {
+            "name": "skullstrip",
+            "function": _do_fsqc_skullstrip,
+            "resources": screenshots_resources,
+        },
+        {
+            "name": "fornix",
+            "function": _do_fsqc_fornix,
+            "resources": screenshots_resources,
+        },
+        {
+            "name": "hypothalamus",
+            "function": _do_fsqc_hypothalamus,
+            "resources": screenshots_resources,
+        },
+        {
+            "name": "hippocampus",
+            "function": _do_fsqc_hippocampus,
+            "resources": screenshots_resources,
+        },
+    ]
+    for task in tasks:
+        task["args"] = (subject, argsDict, status_dict)
+
+    # ----------------------------------------------------------------------
+    # run tasks
+
+    # image volumes are shared between the modules of a subject via the
+    # volume cache, such that each volume is read and decompressed only once
+    with volumeCache(VOLUME_CACHE_SIZE, cache_dir=argsDict["cache_dir"]):
+        taskResults = _run_tasks(tasks, n_threads=argsDict["n_threads"])
+
+    # ----------------------------------------------------------------------
+    # collect results
 
-            if argsDict["hippocampus"] is True or argsDict["hippocampus_html"] is True:
-                # determine status
-                hippocampus_status = 0
-                if argsDict["skip_existing"] is True:
-                    if len(status_dict) > 0:
-                        if (
-                            statusDict[subject]["hippocampus"] == 0
-                            or statusDict[subject]["hippocampus"] == 3
-                        ):
-                            hippocampus_status = 3
-                            logging.info(
-                                "Skipping hippocampus computation for " + subject
-                            )
-                        else:
-                            logging.info(
-                                "Not skipping hippocampus computation for "
-                                + subject
-                                + ": statusfile did not indicate ok or skipped"
-                            )
-                    else:
-                        logging.info(
-                            "Not skipping hippocampus computation for "
-                            + subject
-                            + ": no statusfile was found"
-                        )
+    metricsDict = dict()
+    statusDict = {"subject": subject}
+    imagesDict = dict()
+    distDict = None
+    fornixShapeDict = None
+
+    for task in tasks:
+        taskResult = taskResults[task["name"]]
+        metricsDict.update(taskResult["metrics"])
+        statusDict.update(taskResult["status"])
+        imagesDict.update(taskResult["images"])
+        if "shape" in taskResult.keys():
+            distDict = taskResult["shape"]
+        if "fornix" in taskResult.keys():
+            fornixShapeDict = taskResult["fornix"]
 
-                # check / create subject-specific hippocampus_outdir
-                hippocampus_outdir = os.path.join(
-                    argsDict["output_dir"], "hippocampus", subject
-                )
-                if not os.path.isdir(hippocampus_outdir):
-                    os.makedirs(hippocampus_outdir)
-                hippocampus_screenshot_outfile_left = os.path.join(
-                    hippocampus_outdir, "hippocampus-left.png"
-                )
-                hippocampus_screenshot_outfile_right = os.path.join(
-                    hippocampus_outdir, "hippocampus-right.png"
-                )
+    # --------------------------------------------------------------------------
+    # write statusfile
+    # 0: OK
+    # 1: Failed
+    # 2: Not done
+    # 3: Skipped
+    pd.DataFrame(statusDict, index=[subject]).T.to_csv(
+        os.path.join(argsDict["output_dir"], "status", subject, "status.txt"),
+        header=False,
+        sep=":",
+    )
 
-                #
-                if hippocampus_status == 0:
-                    #
-                    try:
-                        # message
-                        print("-----------------------------")
-                        print("Checking hippocampus segmentation ...")
-                        print("")
-
-                        # process left
-                        evaluateHippocampalSegmentation(
-                            SUBJECT=subject,
-                            SUBJECTS_DIR=argsDict["subjects_dir"],
-                            OUTPUT_DIR=hippocampus_outdir,
-                            CREATE_SCREENSHOT=HIPPOCAMPUS_SCREENSHOT,
-                            SCREENSHOTS_OUTFILE=hippocampus_screenshot_outfile_left,
-                            SCREENSHOTS_ORIENTATION=argsDict["screenshots_orientation"],
-                            HEMI="lh",
-                            LABEL=argsDict["hippocampus_label"],
-                        )
-                        evaluateHippocampalSegmentation(
-                            SUBJECT=subject,
-                            SUBJECTS_DIR=argsDict["subjects_dir"],
-                            OUTPUT_DIR=hippocampus_outdir,
-                            CREATE_SCREENSHOT=HIPPOCAMPUS_SCREENSHOT,
-                            SCREENSHOTS_OUTFILE=hippocampus_screenshot_outfile_right,
-                            SCREENSHOTS_ORIENTATION=argsDict["screenshots_orientation"],
-                            HEMI="rh",
-                            LABEL=argsDict["hippocampus_label"],
-                        )
+    # --------------------------------------------------------------------------
+    # message
+    logging.info(
+        "Finished subject "
+        + subject
+        + " at "
+        + time.strftime("%Y-%m-%d %H:%M %Z", time.localtime(time.time()))
+    )
+
+    # --------------------------------------------------------------------------
+    # return
 
-                        # return
-                        hippocampus_status = 0
+    return {
+        "metrics": metricsDict,
+        "status": statusDict,
+        "images": imagesDict,
+        "shape": distDict,
+        "fornix": fornixShapeDict,
+    }
 
-                    #
-                    except Exception as e:
-                        logging.error(
-                            "ERROR: hippocampus module failed for subject " + subject
-                        )
-                        logging.error("Reason: " + str(e))
-                        hippocampus_status = 1
-                        if argsDict["exit_on_error"] is True:
-                            raise
-
-                # store data
-                if HIPPOCAMPUS_SCREENSHOT and (
-                    hippocampus_status == 0 or hippocampus_status == 3
-                ):
-                    imagesHippocampusLeftDict[
-                        subject
-                    ] = hippocampus_screenshot_outfile_left
-                    imagesHippocampusRightDict[
-                        subject
-                    ] = hippocampus_screenshot_outfile_right
-                else:
-                    imagesHippocampusLeftDict[subject] = []
-                    imagesHippocampusRightDict[subject] = []
 
-            else:
-                hippocampus_status = 2
+# ------------------------------------------------------------------------------
+# do fsqc
 
-            # store data
-            statusDict[subject].update({"hippocampus": hippocampus_status})
-
-            # --------------------------------------------------------------------------
-            # write statusfile
-            # 0: OK
-            # 1: Failed
-            # 2: Not done
-            # 3: Skipped
-            pd.DataFrame(statusDict[subject], index=[subject]).T.to_csv(
-                os.path.join(argsDict["output_dir"], "status", subject, "status.txt"),
-                header=False,
-                sep=":",
-            )
 
-            # --------------------------------------------------------------------------
-            # message
+def _do_fsqc(argsDict):
+    """
+    Run the fsqc submodules.
+
+    Parameters
+    ----------
+    argsDict : dict
+        Dictionary containing input arguments.
+
+    Returns
+    -------
+    None
+        This function returns nothing.
+
+    Notes
+    -----
+    Subjects are processed by `_do_fsqc_subject`, either sequentially or, if
+    `argsDict["n_jobs"]` is larger than one, in parallel worker processes. In
+    either case, results are merged in the order of `argsDict["subjects"]`.
+    """
+
+    # ------------------------------------------------------------------------------
+    # imports
+
+    import csv
+    import itertools
+    import logging
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    from pathlib import Path
+
+    import numpy as np
+    import pandas as pd
+
+    from fsqc.outlierDetection import outlierDetection, outlierTable
+
+    # --------------------------------------------------------------------------
+    # process
+
+    # start the processing with a message
+    print("")
+    print("-----------------------------")
+
+    # create metrics dict
+    metricsDict = dict()
+
+    # create images dict
+    imagesScreenshotsDict = dict()
+    imagesSurfacesDict = dict()
+    imagesSkullstripDict = dict()
+    imagesFornixDict = dict()
+    imagesHypothalamusDict = dict()
+    imagesHippocampusLeftDict = dict()
+    imagesHippocampusRightDict = dict()
+
+    # create status dict
+    statusDict = dict()
+
+    # create shape dicts
+    distDict = dict()
+    fornixShapeDict = dict()
+
+    # --------------------------------------------------------------------------
+    # subject-level processing
+
+    if argsDict["group_only"] is False:
+        # process the specified subjects, either sequentially or in parallel
+        if argsDict["n_jobs"] == 1 or len(argsDict["subjects"]) == 1:
+            subjectResults = [
+                _do_fsqc_subject(subject, argsDict) for subject in argsDict["subjects"]
+            ]
+        else:
             logging.info(
-                "Finished subject "
-                + subject
-                + " at "
-                + time.strftime("%Y-%m-%d %H:%M %Z", time.localtime(time.time()))
+                "Processing "
+                + str(len(argsDict["subjects"]))
+                + " subjects using "
+                + str(min(argsDict["n_jobs"], len(argsDict["subjects"])))
+                + " parallel jobs"
             )
+            with ProcessPoolExecutor(
+                max_workers=min(argsDict["n_jobs"], len(argsDict["subjects"])),
+                initializer=_init_worker,
+                initargs=(argsDict["logfile"],),
+            ) as executor:
+                # map() returns results in the order of the subjects list
+                subjectResults = list(
+                    executor.map(
+                        _do_fsqc_subject,
+                        argsDict["subjects"],
+                        itertools.repeat(argsDict),
+                    )
+                )
+
+        # merge subject-level results
+        imagesDicts = {
+            "screenshots": imagesScreenshotsDict,
+            "surfaces": imagesSurfacesDict,
+            "skullstrip": imagesSkullstripDict,
+            "fornix": imagesFornixDict,
+            "hypothalamus": imagesHypothalamusDict,
+            "hippocampus_left": imagesHippocampusLeftDict,
+            "hippocampus_right": imagesHippocampusRightDict,
+        }
+        for subject, subjectResult in zip(argsDict["subjects"], subjectResults):
+            metricsDict[subject] = subjectResult["metrics"]
+            statusDict[subject] = subjectResult["status"]
+            for key, value in subjectResult["images"].items():
+                imagesDicts[key][subject] = value
+            if subjectResult["shape"] is not None:
+                distDict[subject] = subjectResult["shape"]
+            if subjectResult["fornix"] is not None:
+                fornixShapeDict[subject] = subjectResult["fornix"]
 
     # --------------------------------------------------------------------------
     # run optional modules: outlier detection
@@ -2871,7 +3534,7 @@ def _do_fsqc(argsDict):
                         )
                         / (subject + ".brainprint.asymmetry.csv")
                     ).to_dict(orient="index")[0]
-                    distDict = {subject: dstMat}
+                    distDict[subject] = dstMat
                     metricsDict[subject].update(distDict[subject])
                 #
                 if (
@@ -2887,16 +3550,12 @@ def _do_fsqc(argsDict):
                             )
                         )
                     )[0]
-                    fornixShapeDict = {
-                        subject: dict(
-                            zip(
-                                map(
-                                    "fornixShapeEV{:0>3}".format, range(FORNIX_N_EIGEN)
-                                ),
-                                fornixShapeOutput,
-                            )
+                    fornixShapeDict[subject] = dict(
+                        zip(
+                            map("fornixShapeEV{:0>3}".format, range(FORNIX_N_EIGEN)),
+                            fornixShapeOutput,
                         )
-                    }
+                    )
                     metricsDict[subject].update(fornixShapeDict[subject])
 
         # check if other dictionaries need to be populated
@@ -3114,7 +3773,7 @@ def _do_fsqc(argsDict):
                                 argsDict["output_dir"],
                                 "surfaces",
                                 subject,
-                                f'lh.pial.{argsDict["surfaces_views"][0]}.png',
+                                f"lh.pial.{argsDict['surfaces_views'][0]}.png",
                             )
                             img = Image.open(filepath)
                             width, height = img.size
@@ -3544,9 +4203,13 @@ def run_fsqc(
     screenshots_views="default",
     screenshots_layout="default",
     screenshots_orientation="radiological",
+    screenshots_engine="matplotlib",
     surfaces=False,
     surfaces_html=False,
     surfaces_views=None,
+    surfaces_backend="plotly",
+    surfaces_decimate=None,
+    surfaces_n_jobs=1,
     skullstrip=False,
     skullstrip_html=False,
     fornix=False,
@@ -3563,6 +4226,9 @@ def run_fsqc(
     group_only=False,
     exit_on_error=False,
     skip_existing=False,
+    n_jobs=1,
+    n_threads=1,
+    cache_dir=None,
     logfile=None,
 ):
     """
@@ -3577,7 +4243,9 @@ def run_fsqc(
     output_dir : str
         Output directory.
     argsDict : dict, default: None
-        Dictionary of input arguments.
+        Dictionary of input arguments. The arguments n_jobs, n_threads,
+        cache_dir, screenshots_engine, surfaces_backend, surfaces_decimate and
+        surfaces_n_jobs may be omitted, in which case their defaults are used.
     subjects : list of str, default: None
         List of subjects to process. If None, all valid cases in the input
         directory will be processed. Cannot be used with `subjects_file`.
@@ -3604,12 +4272,22 @@ def run_fsqc(
         Example: [1, 4] (one row, four columns).
     screenshots_orientation : str, default: "radiological"
         Orientation of screenshots. Either "radiological" or "neurological".
+    screenshots_engine : str, default: "matplotlib"
+        Engine for screenshots. Either "matplotlib" or "raster".
     surfaces : bool, default: False
         Create screenshots of pial and inflated surfaces.
     surfaces_html : bool, default: False
         Create screenshots of pial and inflated surfaces and html summary page.
     surfaces_views : list of str, default: ["left", "right", "superior", "inferior"]
         List of parameters to set the views of the surface plots.
+    surfaces_backend : str, default: "plotly"
+        Backend for surface plots. Either "plotly" or "raster".
+    surfaces_decimate : int, default: None
+        Target number of triangles of decimated surfaces for surface plots.
+        If None, surfaces are not decimated.
+    surfaces_n_jobs : int, default: 1
+        Number of worker processes for rendering the surface plots of each
+        subject.
     skullstrip : bool, default: False
         Create screeenshot of MR image and skullstrip overlay.
     skullstrip_html : bool, default: False
@@ -3654,6 +4332,19 @@ def run_fsqc(
     skip_existing : bool, default: False
         Skip processing for a given case if output already exists, even with
         possibly different parameters or settings.
+    n_jobs : int, default: 1
+        Number of subjects to process in parallel. Each subject is processed
+        in a separate worker process if larger than one.
+    n_threads : int, default: 1
+        Number of modules to run concurrently for each subject.
+    cache_dir : str, default: None
+        Directory for storing decompressed image data as uncompressed arrays.
+        Subsequent runs with the same cache directory read the image data from
+        there (using memory-mapping) instead of decompressing the input files
+        again. Entries are invalidated when an input file changes, and the
+        least recently used entries are removed if the directory grows too
+        large. Resampled images of the fornix module are kept there as well,
+        keyed by the contents of the input image and the transform.
     logfile : str, default: None
         Specify a custom location for the logfile. Default location is the
         output directory.
@@ -3690,9 +4381,13 @@ def run_fsqc(
         argsDict["screenshots_views"] = screenshots_views
         argsDict["screenshots_layout"] = screenshots_layout
         argsDict["screenshots_orientation"] = screenshots_orientation
+        argsDict["screenshots_engine"] = screenshots_engine
         argsDict["surfaces"] = surfaces
         argsDict["surfaces_html"] = surfaces_html
         argsDict["surfaces_views"] = surfaces_views
+        argsDict["surfaces_backend"] = surfaces_backend
+        argsDict["surfaces_decimate"] = surfaces_decimate
+        argsDict["surfaces_n_jobs"] = surfaces_n_jobs
         argsDict["skullstrip"] = skullstrip
         argsDict["skullstrip_html"] = skullstrip_html
         argsDict["fornix"] = fornix
@@ -3709,6 +4404,9 @@ def run_fsqc(
         argsDict["group_only"] = group_only
         argsDict["exit_on_error"] = exit_on_error
         argsDict["skip_existing"] = skip_existing
+        argsDict["n_jobs"] = n_jobs
+        argsDict["n_threads"] = n_threads
+        argsDict["cache_dir"] = cache_dir
         argsDict["logfile"] = logfile
 
     elif (argsDict is not None) and (
@@ -3718,6 +4416,17 @@ def run_fsqc(
             "ERROR: cannot specify the argsDict and the subjects_dir / output_dir arguments at the same time."
         )
 
+    # use defaults for arguments that were added in later versions, such that
+    # an argsDict that was created for a previous version can still be used
+    else:
+        argsDict.setdefault("screenshots_engine", "matplotlib")
+        argsDict.setdefault("surfaces_backend", "plotly")
+        argsDict.setdefault("surfaces_decimate", None)
+        argsDict.setdefault("surfaces_n_jobs", 1)
+        argsDict.setdefault("n_jobs", 1)
+        argsDict.setdefault("n_threads", 1)
+        argsDict.setdefault("cache_dir", None)
+
     # start logging
     argsDict = _start_logging(argsDict)
 
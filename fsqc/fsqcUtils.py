@@ -5,27 +5,49 @@ This module provides various import/export functions as well as the
 """
 
 # ------------------------------------------------------------------------------
+# imports
 
+import functools
 
-def importMGH(filename):
+# ------------------------------------------------------------------------------
+# settings
+
+SPLINE_MARGIN = 16  # margin in voxels for cubic interpolation of image regions
+
+# ------------------------------------------------------------------------------
+
+
+def importMGH(filename, return_header=False):
     """
     A function to read Freesurfer MGH files.
 
     Parameters
     ----------
     filename : str
-        Path to the MGH file.
+        Path to the MGH file; may be a compressed .mgz file.
+    return_header : bool, optional
+        If True, also return the header, default is False.
 
     Returns
     -------
     vol : numpy.ndarray
-        3D array containing vol values.
+        3D array containing vol values. For .mgh files, this is a read-only,
+        memory-mapped view of the file with a big-endian data type.
+    header : dict
+        Dictionary with the header fields 'dims', 'nframes', 'type', 'dof',
+        'goodRASFlag', 'delta', 'Mdc', 'Pxyz_c', and the 4x4 'vox2ras'
+        matrix. Only returned if `return_header` is True.
 
     Notes
     -----
     Requires a valid MGH file. If not found, NaNs will be returned.
+
+    Supported data types are uchar, int, float, short, and ushort. Like
+    nibabel, a default orientation is used if the RAS information in the
+    header is not valid.
     """
 
+    import gzip
     import logging
     import os
     import struct
@@ -37,73 +59,316 @@ def importMGH(filename):
 
     if not os.path.exists(filename):
         warnings.warn("WARNING: could not find " + filename + ", returning NaNs", stacklevel = 2)
+        if return_header:
+            return numpy.nan, None
         return numpy.nan
 
-    fp = open(filename, "rb")
-    intsize = struct.calcsize(">i")
-    shortsize = struct.calcsize(">h")
-    floatsize = struct.calcsize(">f")
-    charsize = struct.calcsize(">b")
-
-    # v = struct.unpack(">i", fp.read(intsize))[0]
-    fp.read(intsize)
-    ndim1 = struct.unpack(">i", fp.read(intsize))[0]
-    ndim2 = struct.unpack(">i", fp.read(intsize))[0]
-    ndim3 = struct.unpack(">i", fp.read(intsize))[0]
-    nframes = struct.unpack(">i", fp.read(intsize))[0]
-    # vtype = struct.unpack(">i", fp.read(intsize))[0]
-    # dof = struct.unpack(">i", fp.read(intsize))[0]
-    fp.read(intsize * 2)
-
-    UNUSED_SPACE_SIZE = 256
-    USED_SPACE_SIZE = (3 * 4) + (4 * 3 * 4)  # space for ras transform
-    unused_space_size = UNUSED_SPACE_SIZE - 2
-
-    ras_good_flag = struct.unpack(">h", fp.read(shortsize))[0]
-    if ras_good_flag:
-        # We read these in but don't process them
-        # as we just want to move to the volume data
-        # delta = struct.unpack(">fff", fp.read(floatsize * 3))
-        # Mdc = struct.unpack(">fffffffff", fp.read(floatsize * 9))
-        # Pxyz_c = struct.unpack(">fff", fp.read(floatsize * 3))
-        fp.read(floatsize * 15)
-
-    unused_space_size = unused_space_size - USED_SPACE_SIZE
-
-    for _i in range(unused_space_size):
-        struct.unpack(">b", fp.read(charsize))[0]
-
-    nv = ndim1 * ndim2 * ndim3 * nframes
-    vol = numpy.frombuffer(fp.read(floatsize * nv), dtype=numpy.float32).byteswap()
-
-    # nvert = max([ndim1, ndim2, ndim3])
-    vol = numpy.reshape(vol, (ndim1, ndim2, ndim3, nframes), order="F")
+    # MGH data types
+    MGH_DTYPES = {0: ">u1", 1: ">i4", 3: ">f4", 4: ">i2", 10: ">u2"}
+
+    # the header consists of 7 ints, one short, and 15 floats, followed by
+    # unused space; the data starts at byte 284
+    HEADER_FORMAT = ">7ih15f"
+    DATA_OFFSET = 284
+
+    # read header (and data, for compressed files)
+    compressed = filename.endswith(".mgz") or filename.endswith(".gz")
+    if compressed:
+        with gzip.open(filename, "rb") as fp:
+            buffer = fp.read()
+    else:
+        with open(filename, "rb") as fp:
+            buffer = fp.read(struct.calcsize(HEADER_FORMAT))
+
+    fields = struct.unpack_from(HEADER_FORMAT, buffer)
+
+    header = dict()
+    header["dims"] = numpy.array(fields[1:4])
+    header["nframes"] = fields[4]
+    header["type"] = fields[5]
+    header["dof"] = fields[6]
+    header["goodRASFlag"] = fields[7]
+    if header["goodRASFlag"]:
+        header["delta"] = numpy.array(fields[8:11])
+        header["Mdc"] = numpy.reshape(fields[11:20], (3, 3))
+        header["Pxyz_c"] = numpy.array(fields[20:23])
+    else:
+        header["delta"] = numpy.ones(3)
+        header["Mdc"] = numpy.array([[-1.0, 0, 0], [0, 0, 1], [0, -1, 0]])
+        header["Pxyz_c"] = numpy.zeros(3)
+
+    # the rows of Mdc are the direction cosines of the x, y, z voxel axes
+    MdcD = header["Mdc"].T * header["delta"]
+    header["vox2ras"] = numpy.eye(4)
+    header["vox2ras"][0:3, 0:3] = MdcD
+    header["vox2ras"][0:3, 3] = header["Pxyz_c"] - MdcD.dot(header["dims"]) / 2
+
+    if header["type"] not in MGH_DTYPES.keys():
+        raise ValueError(
+            "ERROR: unsupported MGH data type "
+            + str(header["type"])
+            + " in "
+            + filename
+        )
+
+    # get data without copying, either from the decompressed buffer or as a
+    # memory-mapped view of the file
+    dtype = numpy.dtype(MGH_DTYPES[header["type"]])
+    shape = (*header["dims"], header["nframes"])
+    if compressed:
+        vol = numpy.frombuffer(
+            buffer, dtype=dtype, count=numpy.prod(shape), offset=DATA_OFFSET
+        )
+        vol = numpy.reshape(vol, shape, order="F")
+    else:
+        vol = numpy.memmap(
+            filename, dtype=dtype, mode="r", offset=DATA_OFFSET, shape=shape, order="F"
+        )
+
     vol = numpy.squeeze(vol)
-    fp.close()
 
+    if return_header:
+        return vol, header
     return vol
 
 
 # ------------------------------------------------------------------------------
 
 
-def binarizeImage(img_file, out_file, match=None):
+def importLabels(filename, return_image=False):
+    """
+    Load a label volume in its native data type.
+
+    Parameters
+    ----------
+    filename : str or nibabel image
+        Path to the label volume, e.g. aseg.mgz, or an in-memory image.
+    return_image : bool, optional
+        If True, also return the image object (e.g. for access to the header
+        and affine), default is False.
+
+    Returns
+    -------
+    labels : numpy.ndarray
+        3D array containing the labels, in the data type of the file (usually
+        an integer type) rather than float64. The array is read-only.
+    img : nibabel image
+        The image object; only returned if `return_image` is True.
+
+    Notes
+    -----
+    The data are obtained from the image's `dataobj` rather than from
+    `get_fdata()`, which would create a float64 copy of the volume. Volumes
+    are loaded via the volume cache, see `fsqc.fsqcCache.importImage`.
+    """
+    import numpy as np
+
+    from fsqc.fsqcCache import importImage
+
+    img = importImage(filename)
+    labels = np.asanyarray(img.dataobj)
+
+    if return_image:
+        return labels, img
+    else:
+        return labels
+
+
+# ------------------------------------------------------------------------------
+
+
+def binaryErosion(mask, size):
+    """
+    Erode a binary mask with a cubic structuring element.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        Binary mask.
+    size : int
+        Edge length of the cubic structuring element (in voxels).
+
+    Returns
+    -------
+    eroded : numpy.ndarray
+        Eroded binary mask of the same shape as `mask`.
+
+    Notes
+    -----
+    The result is identical to skimage's
+    `binary_erosion(mask, numpy.ones((size, size, size)))`, including the
+    treatment of even sizes and of the image border (which is assumed to be
+    True), but is considerably faster, because:
+
+    - the erosion is restricted to the bounding box of the mask, padded by
+      `size` voxels (erosion cannot extend beyond the mask itself),
+    - the cubic structuring element is decomposed into three one-dimensional
+      line segments, each of which is applied using a running minimum filter,
+    - the mask is processed as a boolean (uint8) array throughout.
+    """
+    import numpy as np
+    from scipy import ndimage
+
+    mask = np.asarray(mask, dtype=bool)
+    eroded = np.zeros(mask.shape, dtype=bool)
+
+    # get bounding box of the mask
+    bbox = list()
+    for axis in range(mask.ndim):
+        idx = np.flatnonzero(
+            mask.any(axis=tuple(a for a in range(mask.ndim) if a != axis))
+        )
+        if len(idx) == 0:
+            return eroded
+        bbox.append(
+            slice(max(idx[0] - size, 0), min(idx[-1] + 1 + size, mask.shape[axis]))
+        )
+    bbox = tuple(bbox)
+
+    # erode along each axis; voxels outside the image are considered True
+    mask_crop = mask[bbox].view(np.uint8)
+    for axis in range(mask.ndim):
+        mask_crop = ndimage.minimum_filter1d(
+            mask_crop, size, axis=axis, mode="constant", cval=1
+        )
+    eroded[bbox] = mask_crop.view(bool)
+
+    return eroded
+
+
+# ------------------------------------------------------------------------------
+
+
+def labelStats(labels, image=None, centroids=True, bboxes=True):
+    """
+    Compute statistics of all labels of a label volume in a single pass.
+
+    Parameters
+    ----------
+    labels : numpy.ndarray
+        Label volume with non-negative integer labels.
+    image : numpy.ndarray or None, optional
+        Reference image of the same shape as `labels`, for which the sum and
+        the sum of squares of the intensities within each label are computed.
+        Default is None.
+    centroids : bool, optional
+        If True, the centroids of the labels are computed. Default is True.
+    bboxes : bool, optional
+        If True, the bounding boxes of the labels are computed. Default is True.
+
+    Returns
+    -------
+    stats : dict
+        Dictionary with the following entries, each of which is indexed by
+        label value (from 0 to the maximum label):
+
+        - 'count' : numpy.ndarray with the number of voxels,
+        - 'sum' : numpy.ndarray with the sum of the intensities of the
+          reference image (only if `image` is given),
+        - 'sumsq' : numpy.ndarray with the sum of the squared intensities of
+          the reference image (only if `image` is given),
+        - 'centroid' : numpy.ndarray with the voxel coordinates of the
+          centroids, NaN for labels that are not present (only if
+          `centroids` is True),
+        - 'bbox' : list with the bounding boxes as tuples of slices, None for
+          label 0 and for labels that are not present (only if `bboxes` is
+          True).
+
+    Notes
+    -----
+    The volume is processed slice by slice with `numpy.bincount`, such that
+    no temporary arrays of the size of the volume are created. Centroids are
+    not weighted by intensities, and are identical to the ones obtained by
+    `scipy.ndimage.center_of_mass(labels, labels, index)`, which weights by
+    the (constant) label values.
+    """
+    import numpy as np
+    from scipy import ndimage
+
+    labels = np.asanyarray(labels)
+
+    if not np.issubdtype(labels.dtype, np.integer):
+        intLabels = labels.astype(np.int64)
+        if not np.array_equal(intLabels, labels):
+            raise ValueError("ERROR: labels must be integers.")
+        labels = intLabels
+
+    if labels.size == 0:
+        nLabels = 1
+    elif np.min(labels) < 0:
+        raise ValueError("ERROR: labels must be non-negative.")
+    else:
+        nLabels = int(np.max(labels)) + 1
+
+    if image is not None and np.shape(image) != labels.shape:
+        raise ValueError("ERROR: labels and image must have the same shape.")
+
+    # voxel coordinates within a slice, used as weights for the centroids
+    if centroids:
+        grids = [x.ravel().astype(np.float64) for x in np.indices(labels.shape[1:])]
+    else:
+        grids = list()
+
+    # counts per slice (for the coordinates along the first axis), sums of
+    # the coordinates along the remaining axes, and sums of intensities
+    sliceCounts = np.zeros((labels.shape[0], nLabels), dtype=np.int64)
+    coordSums = np.zeros((nLabels, labels.ndim))
+    if image is not None:
+        sums = np.zeros(nLabels)
+        sumsq = np.zeros(nLabels)
+
+    for i in range(labels.shape[0]):
+        sliceLabels = labels[i].ravel()
+        sliceCounts[i] = np.bincount(sliceLabels, minlength=nLabels)
+        for axis, grid in enumerate(grids):
+            coordSums[:, axis + 1] += np.bincount(
+                sliceLabels, weights=grid, minlength=nLabels
+            )
+        if image is not None:
+            sliceImage = np.asarray(image[i], dtype=np.float64).ravel()
+            sums += np.bincount(sliceLabels, weights=sliceImage, minlength=nLabels)
+            sumsq += np.bincount(sliceLabels, weights=sliceImage**2, minlength=nLabels)
+
+    counts = np.sum(sliceCounts, axis=0)
+    stats = {"count": counts}
+
+    if centroids:
+        coordSums[:, 0] = np.matmul(np.arange(labels.shape[0]), sliceCounts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stats["centroid"] = coordSums / counts[:, np.newaxis]
+
+    if bboxes:
+        stats["bbox"] = [None] + ndimage.find_objects(labels, max_label=nLabels - 1)
+
+    if image is not None:
+        stats["sum"] = sums
+        stats["sumsq"] = sumsq
+
+    return stats
+
+
+# ------------------------------------------------------------------------------
+
+
+def binarizeImage(img_file, out_file=None, match=None):
     """
     Binarize an image and saves the result.
 
     Parameters
     ----------
-    img_file : str
-        Path to the input image file.
-    out_file : str
-        Path to save the binarized image.
+    img_file : str or nibabel image
+        Path to the input image file, or an in-memory image.
+    out_file : str or None, optional
+        Path to save the binarized image. If None (default), the image is not
+        saved.
     match : array-like or None, optional
         Values to consider as True. If None, non-zero values are considered True.
 
     Returns
     -------
-    None
-        This function returns nothing.
+    img_bin : nibabel.MGHImage
+        The binarized image, with the same data and header as if it was
+        read back from an .mgz file.
 
     Notes
     -----
@@ -113,42 +378,71 @@ def binarizeImage(img_file, out_file, match=None):
     import numpy as np
 
     # get image
-    img = nb.load(img_file)
-    img_data = img.get_fdata()
+    img_data, img = importLabels(img_file, return_image=True)
 
     # binarize
     if match is None:
-        img_data_bin = img_data != 0.0
+        img_data_bin = img_data != 0
     else:
         img_data_bin = np.isin(img_data, match)
 
     # write output
-    img_bin = nb.nifti1.Nifti1Image(img_data_bin.astype(int), img.affine, dtype="uint8")
-    nb.save(img_bin, out_file)
+    img_bin = nb.nifti1.Nifti1Image(
+        img_data_bin.astype(np.uint8), img.affine, dtype="uint8"
+    )
+    if out_file is not None:
+        nb.save(img_bin, out_file)
+
+    return _toMGHImage(img_bin)
 
 
 # ------------------------------------------------------------------------------
 
 
-def applyTransform(img_file, out_file, mat_file, interp):
+def applyTransform(img_file, out_file, mat_file, interp, out_region=None, dtype=None):
     """
     Apply a transformation to an image.
 
     Parameters
     ----------
-    img_file : str
-        Input image file path.
-    out_file : str
-        Output transformed image file path.
+    img_file : str or nibabel image
+        Input image file path, or an in-memory image.
+    out_file : str or None
+        Output transformed image file path. If None, the image is not saved.
     mat_file : str
         Transformation matrix file path (must be in xfm or lta format).
     interp : {'nearest', 'cubic'}
         Interpolation method to use.
+    out_region : tuple of slice or None, optional
+        Region of the output image, given as one slice object (with a step
+        size of one) per dimension. If given, only voxels within this region
+        are interpolated, and all other voxels are set to zero. Default is
+        None, i.e. the whole image.
+    dtype : numpy dtype or None, optional
+        Data type of the interpolated image, e.g. numpy.float32. Default is
+        None, i.e. float64 for cubic interpolation and the data type of the
+        input image for nearest-neighbor interpolation.
 
     Returns
     -------
-    None
-        This function returns nothing.
+    img_interp : nibabel.MGHImage
+        The transformed image, with the same data and header as if it was
+        read back from an .mgz file.
+
+    Notes
+    -----
+    For cubic interpolation, the spline coefficients are computed for the
+    whole image in float64, such that the result within `out_region` does
+    not depend on the region. If `dtype` is numpy.float32 and `out_region` is
+    given, the spline coefficients are instead computed in float32, and only
+    for the part of the image that is mapped onto the region, extended by a
+    margin of `SPLINE_MARGIN` voxels. The influence of the boundary of that
+    part on the coefficients decays exponentially with the distance, and is
+    below the precision of float32 within the region.
+
+    If the cache directory is set, results for image files are kept there and
+    re-used as long as the contents of the image and the transformation file
+    do not change, see `fsqc.fsqcCache.importResampled`.
     """
     import os
 
@@ -156,9 +450,7 @@ def applyTransform(img_file, out_file, mat_file, interp):
     import numpy as np
     from scipy import ndimage
 
-    # get image
-    img = nb.load(img_file)
-    img_data = img.get_fdata()
+    from fsqc.fsqcCache import importResampled
 
     #
     _, mat_file_ext = os.path.splitext(mat_file)
@@ -185,17 +477,112 @@ def applyTransform(img_file, out_file, mat_file, interp):
     else:
         raise Exception("ERROR: matrices must be either xfm or lta format")
 
-    # apply transform
+    # get interpolation order
     if interp == "nearest":
-        img_data_interp = ndimage.affine_transform(img_data, np.linalg.inv(m), order=0)
+        order = 0
     elif interp == "cubic":
-        img_data_interp = ndimage.affine_transform(img_data, np.linalg.inv(m), order=3)
+        order = 3
     else:
         raise Exception("ERROR: interpolation must be either nearest or cubic")
 
+    # apply transform to the whole image or to the output region only
+    def resample():
+        # get image in its native data type; nearest-neighbor interpolation
+        # does not create new values (e.g. for label volumes), and the spline
+        # filter for cubic interpolation converts the data to float64 itself
+        img_data, img = importLabels(img_file, return_image=True)
+
+        if dtype is not None:
+            out_dtype = dtype
+        elif order == 0:
+            out_dtype = img_data.dtype
+        else:
+            out_dtype = np.float64
+
+        if out_region is None:
+            data = ndimage.affine_transform(
+                img_data, np.linalg.inv(m), order=order, output=out_dtype
+            )
+        elif order == 3 and np.dtype(out_dtype) == np.float32:
+            # shift the output grid to the first voxel of the region, and
+            # crop the input to the voxels that are mapped onto the region
+            shift = np.eye(4)
+            shift[0:3, 3] = [x.start for x in out_region]
+            matrix = np.matmul(np.linalg.inv(m), shift)
+            outShape = img_data[out_region].shape
+            corners = np.array(list(np.ndindex(2, 2, 2))) * (np.array(outShape) - 1)
+            corners = np.matmul(matrix[0:3, 0:3], corners.T).T + matrix[0:3, 3]
+            lo = np.floor(np.min(corners, axis=0)).astype(int) - SPLINE_MARGIN
+            hi = np.ceil(np.max(corners, axis=0)).astype(int) + SPLINE_MARGIN + 1
+            lo = np.clip(lo, 0, np.array(img_data.shape) - 1)
+            hi = np.maximum(np.minimum(hi, img_data.shape), lo + 1)
+            crop = tuple(slice(x, y) for x, y in zip(lo, hi))
+            crop_shift = np.eye(4)
+            crop_shift[0:3, 3] = -lo
+            coeffs = ndimage.spline_filter(
+                img_data[crop].astype(np.float32),
+                order=order,
+                output=np.float32,
+                mode="constant",
+            )
+            data = ndimage.affine_transform(
+                coeffs,
+                np.matmul(crop_shift, matrix),
+                output_shape=outShape,
+                order=order,
+                output=np.float32,
+                prefilter=False,
+            )
+        else:
+            # shift the output grid to the first voxel of the region
+            shift = np.eye(4)
+            shift[0:3, 3] = [x.start for x in out_region]
+            data = ndimage.affine_transform(
+                img_data,
+                np.matmul(np.linalg.inv(m), shift),
+                output_shape=img_data[out_region].shape,
+                order=order,
+                output=out_dtype,
+            )
+
+        return {"data": data, "affine": img.affine, "shape": np.array(img_data.shape)}
+
+    resampled = importResampled(
+        img_file,
+        mat_file,
+        (order, out_region, None if dtype is None else np.dtype(dtype).str),
+        resample,
+    )
+
+    if out_region is None:
+        img_data_interp = resampled["data"]
+    else:
+        img_data_interp = np.zeros(
+            tuple(resampled["shape"]), dtype=resampled["data"].dtype
+        )
+        img_data_interp[out_region] = resampled["data"]
+
     # write image
-    img_interp = nb.nifti1.Nifti1Image(img_data_interp, img.affine)
-    nb.save(img_interp, out_file)
+    img_interp = nb.nifti1.Nifti1Image(img_data_interp, resampled["affine"])
+    if out_file is not None:
+        nb.save(img_interp, out_file)
+
+    return _toMGHImage(img_interp)
+
+
+def _toMGHImage(img):
+    """
+    Convert an image to an MGH image, with the data type and header that the
+    image would have after saving it to and reading it from an .mgz file.
+    """
+    import nibabel as nb
+    import numpy as np
+
+    mgh = nb.MGHImage.from_image(img)
+    data = np.asanyarray(img.dataobj).astype(mgh.get_data_dtype().newbyteorder("="))
+    data.flags.writeable = False
+
+    return nb.MGHImage(data, mgh.affine, mgh.header)
 
 
 # ------------------------------------------------------------------------------
@@ -471,9 +858,14 @@ def levelsetsTria(v, t, p, levelsets):
         List of triangle indices corresponding to the interpolated vertices for each level set.
     iLVL : list
         List of triangle indices that intersect with the level set.
+
+    Notes
+    -----
+    All intersected triangles of a level set are processed at once. Points on
+    edges that are shared by two triangles are computed only once, and the
+    point indices in `lLVL` start at one.
     """
     import numpy as np
-    from scipy.sparse import lil_matrix
 
     vLVL = list()
     lLVL = list()
@@ -482,96 +874,374 @@ def levelsetsTria(v, t, p, levelsets):
     levelsets = np.array(levelsets, ndmin=2)
 
     for lidx in range(len(levelsets)):
-        A = lil_matrix((np.shape(v)[0], np.shape(v)[0]))
-
         lvl = levelsets[lidx]
 
         nlvl = p[t] > lvl
 
-        n = np.where(
-            np.logical_or(np.sum(nlvl, axis=1) == 1, np.sum(nlvl, axis=1) == 2)
-        )[0]
+        nsum = np.sum(nlvl, axis=1)
 
-        # interpolate points
+        n = np.where(np.logical_or(nsum == 1, nsum == 2))[0]
 
-        ti = list()
-        vi = list()
+        vi, ti = _interpolateLevelset(v, t, p, lvl, n)
 
-        for i in range(len(n)):
-            # which are the outlying points in the current tria?
-            oi = np.where(nlvl[n[i], :])[0]
+        # store
 
-            #  convert 2 --> 1
-            if len(oi) == 2:
-                oi = np.setdiff1d((0, 1, 2), oi)
+        vLVL.append(vi)
+        lLVL.append(ti)
+        iLVL.append(n)
 
-            # find the two non - outyling points
-            oix = np.setdiff1d((0, 1, 2), oi)
+    return vLVL, lLVL, iLVL
 
-            # check if we have interpolated for one or both of these points before
-            if np.count_nonzero(A[t[n[i], oi.item()], t[n[i], oix[0]]]) == 0:
-                # compute difference vectors between outlying point and other points
 
-                d10 = v[t[n[i], oix[0]], :] - v[t[n[i], oi], :]
+# ------------------------------------------------------------------------------
 
-                # compute differences of all points to lvl to get interpolation factors
 
-                s10 = (lvl - p[t[n[i], oi]]) / (p[t[n[i], oix[0]]] - p[t[n[i], oi]])
+def levelsetsTriaMulti(v, t, p, levelsets):
+    """
+    Generate intersections of triangles with several level sets at once.
 
-                # compute new points
+    Parameters
+    ----------
+    v : numpy.ndarray
+        Array of vertex coordinates with shape (n, 3).
+    t : numpy.ndarray
+        Array of triangles with vertex indices, shape (m, 3).
+    p : numpy.ndarray
+        Array of values corresponding to vertex points, shape (n,).
+    levelsets : list
+        List of level set values.
 
-                v10 = s10 * d10 + v[t[n[i], oi], :]
+    Returns
+    -------
+    LVL : list
+        List with one element per level set, which is identical to the output
+        of `levelsetsTria(v, t, p, levelset)`, i.e. a tuple of vLVL, lLVL, and
+        iLVL.
 
-                # update vi and index(order matters)
+    Notes
+    -----
+    The triangles are sorted by their minimum value of `p` once. For each
+    level set, only the triangles within a band around the level set, whose
+    width is given by the largest range of `p` within a triangle, are tested
+    for intersections.
+    """
+    import numpy as np
 
-                vi.append(v10.tolist()[0])
+    # sort triangles by their minimum value
+    pt = p[t]
+    ptMin = np.min(pt, axis=1)
+    ptOrder = np.argsort(ptMin, kind="stable")
+    ptMinSorted = ptMin[ptOrder]
+    ptRange = np.max(np.max(pt, axis=1) - ptMin) if len(t) > 0 else 0
 
-                ti10 = len(vi)
+    LVL = list()
 
-                # store between which two points we are interpolating (to avoid having duplicate points)
+    for levelset in levelsets:
+        lvl = np.array(levelset, ndmin=2)[0]
 
-                A[t[n[i], oi.item()], t[n[i], oix[0]]] = ti10
-                A[t[n[i], oix[0]], t[n[i], oi.item()]] = ti10
+        # intersected triangles have a minimum value within
+        # (lvl - ptRange, lvl]; the band is doubled to be safe against
+        # rounding errors
+        lo = np.searchsorted(ptMinSorted, np.min(lvl) - 2 * ptRange, side="left")
+        hi = np.searchsorted(ptMinSorted, np.max(lvl), side="right")
+        c = np.sort(ptOrder[lo:hi])
 
-            else:
-                ti10 = int(A[t[n[i], oi.item()], t[n[i], oix[0]]])
+        nlvl = pt[c, :] > lvl
 
-            # essentially the same as above, just for oix[1]
+        nsum = np.sum(nlvl, axis=1)
 
-            if np.count_nonzero(A[t[n[i], oi.item()], t[n[i], oix[1]]]) == 0:
-                d20 = v[t[n[i], oix[1]], :] - v[t[n[i], oi], :]
+        n = c[np.logical_or(nsum == 1, nsum == 2)]
 
-                s20 = (lvl - p[t[n[i], oi]]) / (p[t[n[i], oix[1]]] - p[t[n[i], oi]])
+        vi, ti = _interpolateLevelset(v, t, p, lvl, n)
 
-                v20 = s20 * d20 + v[t[n[i], oi], :]
+        LVL.append(([vi], [ti], [n]))
 
-                # update vi and index(order matters)
+    return LVL
 
-                vi.append(v20.tolist()[0])
 
-                ti20 = len(vi)
+# ------------------------------------------------------------------------------
 
-                A[t[n[i], oi.item()], t[n[i], oix[1]]] = ti20
-                A[t[n[i], oix[1]], t[n[i], oi.item()]] = ti20
 
-            else:
-                ti20 = int(A[t[n[i], oi.item()], t[n[i], oix[1]]])
+def _interpolateLevelset(v, t, p, lvl, n):
+    """
+    Interpolate the intersection points of a level set with the triangles `n`,
+    and return the points and the line segments (as pairs of one-based point
+    indices).
+    """
+    import numpy as np
 
-            # store new indices
+    # for each position of the outlying point within a triangle, the positions
+    # of the two other points
+    OTHERS = np.array([[1, 2], [0, 2], [0, 1]])
 
-            ti.append((ti10, ti20))
+    nlvl = p[t[n, :]] > lvl
 
-            # clean up
+    nsum = np.sum(nlvl, axis=1)
 
-            # clear oi oix d10 d20 s10 s20 v10 v20 t10 t20
+    # which are the outlying points in the intersected triangles? if two
+    # points are above the level set, the outlying point is the one below
+    oi = np.argmax(nlvl == (nsum == 1)[:, np.newaxis], axis=1)
 
-        # store
+    # get the two edges from the outlying point to the other two points,
+    # ordered as (tria 0 / edge 0, tria 0 / edge 1, tria 1 / edge 0, ...)
+    e0 = np.repeat(t[n, oi], 2)
+    e1 = t[n[:, np.newaxis], OTHERS[oi, :]].flatten()
 
-        vLVL.append(vi)
-        lLVL.append(ti)
-        iLVL.append(n)
+    # identify shared edges via unique (undirected) edge keys; points are
+    # numbered by the first occurrence of their edge, starting at one
+    key = np.minimum(e0, e1) * np.shape(v)[0] + np.maximum(e0, e1)
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(first), dtype=int)
+    rank[order] = np.arange(1, len(first) + 1)
 
-    return vLVL, lLVL, iLVL
+    # interpolate points along the first occurrence of each edge
+    a = e0[first[order]]
+    b = e1[first[order]]
+    s = (lvl - p[a]) / (p[b] - p[a])
+    vi = s[:, np.newaxis] * (v[b, :] - v[a, :]) + v[a, :]
+
+    # get new indices
+    ti = np.reshape(rank[inverse], (-1, 2))
+
+    return vi.tolist(), [tuple(x) for x in ti.tolist()]
+
+
+# ------------------------------------------------------------------------------
+
+
+def chainLevelsets(segments, points=None):
+    """
+    Chain line segments of a level set into polylines.
+
+    Parameters
+    ----------
+    segments : list
+        List of line segments, each given as a pair of point indices, e.g. an
+        element of `lLVL` as returned by `levelsetsTria`.
+    points : list or numpy.ndarray, optional
+        Coordinates of the points, e.g. the corresponding element of `vLVL`
+        as returned by `levelsetsTria`. If given, zero-length segments are
+        removed before chaining, default is None.
+
+    Returns
+    -------
+    chains : list
+        List of polylines, each given as a numpy.ndarray of point indices.
+        Closed polylines end with their first point.
+    diagnostics : dict
+        Dictionary with the number of 'segments', 'closed' and 'open'
+        polylines, and 'junctions', i.e. points that are shared by more than
+        two segments (which do not occur for level sets of closed, manifold
+        surfaces).
+
+    Notes
+    -----
+    Segments are connected through their shared point indices, which
+    `levelsetsTria` assigns per mesh edge. Chaining therefore does not depend
+    on comparing point coordinates, and runs in linear time.
+
+    If the level set passes exactly through a mesh vertex, `levelsetsTria`
+    creates one point per incident edge, all at the position of the vertex,
+    which are connected by zero-length segments. With `points`, these
+    segments are contracted, i.e. their end points are merged into the one
+    with the lowest index, before chaining. Unlike merging all coincident
+    points, this keeps the contours through a saddle vertex apart. The number
+    of 'segments' in the diagnostics refers to the remaining segments.
+    """
+    import numpy as np
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    # contract zero-length segments
+    if points is not None and len(segments) > 0:
+        points = np.asarray(points)
+        segments = np.array(segments) - 1
+        zero = np.all(points[segments[:, 0]] == points[segments[:, 1]], axis=1)
+        graph = coo_matrix(
+            (np.ones(np.sum(zero)), (segments[zero, 0], segments[zero, 1])),
+            shape=(len(points), len(points)),
+        )
+        _, component = connected_components(graph, directed=False)
+        merged = np.full(np.max(component) + 1, len(points))
+        np.minimum.at(merged, component, np.arange(len(points)))
+        segments = [tuple(x) for x in (merged[component[segments[~zero]]] + 1).tolist()]
+
+    # map each point to the segments that contain it
+    pointSegments = dict()
+    for i, (a, b) in enumerate(segments):
+        pointSegments.setdefault(a, list()).append(i)
+        pointSegments.setdefault(b, list()).append(i)
+
+    used = np.zeros(len(segments), dtype=bool)
+
+    def walk(start, segment):
+        chain = [start]
+        point = start
+        while segment is not None:
+            used[segment] = True
+            a, b = segments[segment]
+            point = b if a == point else a
+            chain.append(point)
+            segment = next((j for j in pointSegments[point] if not used[j]), None)
+        return np.array(chain)
+
+    # open polylines start at end points or junctions; afterwards, all
+    # remaining segments belong to closed polylines
+    chains = list()
+    starts = [x for x in pointSegments.keys() if len(pointSegments[x]) != 2]
+    for start in starts + [segments[i][0] for i in range(len(segments))]:
+        for segment in pointSegments[start]:
+            if not used[segment]:
+                chains.append(walk(start, segment))
+
+    diagnostics = dict()
+    diagnostics["segments"] = len(segments)
+    diagnostics["closed"] = int(sum([x[0] == x[-1] for x in chains]))
+    diagnostics["open"] = len(chains) - diagnostics["closed"]
+    diagnostics["junctions"] = sum([len(x) > 2 for x in pointSegments.values()])
+
+    return chains, diagnostics
+
+
+# ------------------------------------------------------------------------------
+
+
+def decimateMesh(v, t, n_faces, labels=None):
+    """
+    Decimate a triangle mesh by vertex clustering with quadric error metrics.
+
+    Parameters
+    ----------
+    v : numpy.ndarray
+        Vertex coordinates, shape (n_vertices, 3).
+    t : numpy.ndarray
+        Triangles, shape (n_triangles, 3).
+    n_faces : int
+        Target number of triangles. The decimated mesh has at most this
+        number of triangles, and usually not much less.
+    labels : numpy.ndarray, optional
+        Labels of the vertices, e.g. annotation indices, default is None.
+
+    Returns
+    -------
+    v : numpy.ndarray
+        Vertex coordinates of the decimated mesh.
+    t : numpy.ndarray
+        Triangles of the decimated mesh.
+    labels : numpy.ndarray
+        Labels of the vertices of the decimated mesh, i.e. the most frequent
+        label of each cluster. Only returned if `labels` is given.
+
+    Notes
+    -----
+    The vertices are clustered by a regular grid, whose cell size is adapted
+    to the target number of triangles. Each cluster is represented by the
+    point that minimizes the sum of squared distances to the (area-weighted)
+    planes of the triangles of its vertices (Lindstrom, 2000), regularized
+    towards the mean of its vertices. Triangles that collapse, and duplicate
+    triangles with the same orientation, are removed, which keeps closed
+    surfaces closed (though not necessarily manifold). Meshes with no more than `n_faces` triangles are
+    returned unchanged.
+    """
+    import numpy as np
+
+    v = np.asarray(v, dtype=np.float64)
+    t = np.asarray(t, dtype=np.int64)
+
+    if len(t) <= n_faces:
+        if labels is None:
+            return v, t
+        return v, t, np.asarray(labels)
+
+    # area-weighted quadrics of the triangle planes, as rows of 16 elements
+    normals = np.cross(v[t[:, 1]] - v[t[:, 0]], v[t[:, 2]] - v[t[:, 0]])
+    areas = np.linalg.norm(normals, axis=1) / 2
+    normals = normals / np.maximum(2 * areas, 1e-12)[:, np.newaxis]
+    planes = np.column_stack((normals, -np.sum(normals * v[t[:, 0]], axis=1)))
+    triaQuadrics = (areas[:, np.newaxis] * planes)[:, :, np.newaxis] * planes[
+        :, np.newaxis, :
+    ]
+    triaQuadrics = triaQuadrics.reshape(-1, 16)
+
+    def cluster(cellSize):
+        cells = np.floor((v - np.min(v, axis=0)) / cellSize).astype(np.int64)
+        cells = np.ravel_multi_index(cells.T, np.max(cells, axis=0) + 1)
+        clusters = np.unique(cells, return_inverse=True)[1].reshape(-1)
+        tc = clusters[t]
+        collapsed = (
+            (tc[:, 0] == tc[:, 1]) | (tc[:, 1] == tc[:, 2]) | (tc[:, 2] == tc[:, 0])
+        )
+        tc = tc[~collapsed]
+        # remove duplicates with the same orientation; rotate triangles such
+        # that their smallest index comes first
+        r = np.argmin(tc, axis=1)[:, np.newaxis]
+        tc = np.take_along_axis(tc, (r + np.arange(3)) % 3, axis=1)
+        # the flat index is bounded by the number of clusters rather than the
+        # number of vertices, such that it does not overflow for large meshes
+        nClusters = int(np.max(clusters)) + 1
+        first = np.unique(
+            np.ravel_multi_index(tc.T, (nClusters,) * 3), return_index=True
+        )[1]
+        return clusters, tc[np.sort(first)]
+
+    # choose the cell size: the number of triangles is about twice the number
+    # of clusters, i.e. inversely proportional to the squared cell size
+    cellSize = np.sqrt(2 * np.sum(areas) / n_faces)
+    clusters, tc = cluster(cellSize)
+    for _ in range(10):
+        if 0.9 * n_faces < len(tc) <= n_faces:
+            break
+        cellSize = cellSize * np.sqrt(len(tc) / n_faces)
+        clusters, tc = cluster(cellSize)
+    while len(tc) > n_faces:
+        cellSize = cellSize * 1.05
+        clusters, tc = cluster(cellSize)
+
+    # quadrics of the clusters, i.e. of the triangles of their vertices
+    nClusters = np.max(clusters) + 1
+    quadrics = np.zeros((nClusters, 16))
+    for i in range(16):
+        for j in range(3):
+            quadrics[:, i] += np.bincount(
+                clusters[t[:, j]], weights=triaQuadrics[:, i], minlength=nClusters
+            )
+    quadrics = quadrics.reshape(-1, 4, 4)
+
+    # representative points of the clusters, regularized towards the means
+    counts = np.bincount(clusters, minlength=nClusters)
+    means = np.column_stack(
+        [np.bincount(clusters, weights=v[:, i], minlength=nClusters) for i in range(3)]
+    )
+    means = means / counts[:, np.newaxis]
+
+    A = quadrics[:, 0:3, 0:3]
+    b = quadrics[:, 0:3, 3]
+    reg = 1e-3 * np.trace(A, axis1=1, axis2=2) / 3 + 1e-12
+    rhs = -(np.einsum("ijk,ik->ij", A, means) + b)
+    delta = np.linalg.solve(
+        A + reg[:, np.newaxis, np.newaxis] * np.eye(3), rhs[:, :, np.newaxis]
+    )
+    vd = means + delta[:, :, 0]
+
+    # remove clusters that are not part of any triangle
+    used = np.zeros(nClusters, dtype=bool)
+    used[tc] = True
+    vd = vd[used]
+    td = (np.cumsum(used) - 1)[tc]
+
+    if labels is None:
+        return vd, td
+
+    # most frequent label of each cluster
+    labelValues, labelIndex = np.unique(labels, return_inverse=True)
+    labelCounts = np.bincount(
+        clusters * len(labelValues) + labelIndex.reshape(-1),
+        minlength=nClusters * len(labelValues),
+    ).reshape(nClusters, len(labelValues))
+    labelsd = labelValues[np.argmax(labelCounts, axis=1)][used]
+
+    return vd, td, labelsd
 
 
 # ------------------------------------------------------------------------------
@@ -2030,3 +2700,106 @@ def returnFreeSurferColorLUT():
         ),
         dtype="object",
     )
+
+
+# ------------------------------------------------------------------------------
+
+
+@functools.cache
+def returnColorLUT():
+    """
+    Provide the FreeSurfer color look-up table as numeric arrays.
+
+    The table is built once and shared by all callers; its arrays are
+    read-only. Labels of the FreeSurfer 7 hippocampal subfield and
+    hypothalamic segmentations are added if not present.
+
+    Returns
+    -------
+    dict
+        Dictionary with the structured array 'table' with fields 'id' (label
+        value) and 'rgba' (colors in the range 0..1, fully opaque), and the
+        array 'index' with the row of the table for each label value up to the
+        largest one, or -1 for label values that are not in the table.
+    """
+
+    import numpy as np
+
+    lut = returnFreeSurferColorLUT()
+
+    # some fs7 labels are not present in fs6 LUT, check and add if necessary
+
+    if not (
+        np.isin(
+            list(range(231, 247)) + [801, 802, 803, 804, 805, 806, 807, 808, 809, 810],
+            lut[:, 0],
+        ).all()
+    ):
+        lutAdd = np.array(
+            (
+                [801, "L_hypothalamus_anterior_inferior", 250, 255, 50, 0],
+                [802, "L_hypothalamus_anterior_superior", 80, 200, 255, 0],
+                [803, "L_hypothalamus_posterior", 255, 160, 0, 0],
+                [804, "L_hypothalamus_tubular_inferior", 255, 160, 200, 0],
+                [805, "L_hypothalamus_tubular_superior", 20, 180, 130, 0],
+                [806, "R_hypothalamus_anterior_inferior", 250, 255, 50, 0],
+                [807, "R_hypothalamus_anterior_superior", 80, 200, 255, 0],
+                [808, "R_hypothalamus_posterior", 255, 160, 0, 0],
+                [809, "R_hypothalamus_tubular_inferior", 255, 160, 200, 0],
+                [810, "R_hypothalamus_tubular_superior", 20, 180, 130, 0],
+                [231, "HP_body", 0, 255, 0, 0],
+                [232, "HP_head", 255, 0, 0, 0],
+                [233, "presubiculum-head", 32, 0, 32, 0],
+                [234, "presubiculum-body", 64, 0, 64, 0],
+                [235, "subiculum-head", 0, 0, 175, 0],
+                [236, "subiculum-body", 0, 0, 255, 0],
+                [237, "CA1-head", 175, 75, 75, 0],
+                [238, "CA1-body", 255, 0, 0, 0],
+                [239, "CA3-head", 0, 80, 0, 0],
+                [240, "CA3-body", 0, 128, 0, 0],
+                [241, "CA4-head", 120, 90, 50, 0],
+                [242, "CA4-body", 196, 160, 128, 0],
+                [243, "GC-ML-DG-head", 75, 125, 175, 0],
+                [244, "GC-ML-DG-body", 32, 200, 255, 0],
+                [245, "molecular_layer_HP-head", 100, 25, 25, 0],
+                [246, "molecular_layer_HP-body", 128, 0, 0, 0],
+            ),
+            dtype=object,
+        )
+
+        lut = np.concatenate((lut, lutAdd), axis=0)
+
+    table = np.zeros(len(lut), dtype=[("id", np.int64), ("rgba", np.float32, (4,))])
+    table["id"] = lut[:, 0].astype(np.int64)
+    table["rgba"][:, 0:3] = lut[:, 2:5].astype(np.float32) / 255
+    table["rgba"][:, 3] = 1
+
+    index = np.full(np.max(table["id"]) + 1, -1, dtype=np.int64)
+    index[table["id"]] = np.arange(len(table))
+
+    table.setflags(write=False)
+    index.setflags(write=False)
+
+    return {"table": table, "index": index}
+
+
+# ------------------------------------------------------------------------------
+
+
+@functools.cache
+def returnColorLUTColormap():
+    """
+    Provide the FreeSurfer color look-up table as a matplotlib colormap.
+
+    The colormap is built once from `returnColorLUT` and shared by all
+    callers.
+
+    Returns
+    -------
+    matplotlib.colors.ListedColormap
+        Colormap with one color per row of the color look-up table.
+    """
+
+    from matplotlib.colors import ListedColormap
+
+    return ListedColormap(returnColorLUT()["table"]["rgba"])
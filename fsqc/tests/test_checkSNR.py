@@ -0,0 +1,45 @@
+"""Test checkSNR.py"""
+
+import nibabel as nb
+import numpy as np
+import pytest
+
+from ..checkSNR import checkSNR
+
+
+@pytest.fixture
+def subjects_dir(tmp_path):
+    """Create a small subject with aseg, aparc+aseg, orig and norm images."""
+    rng = np.random.default_rng(0)
+    shape = (24, 24, 24)
+    aseg = np.zeros(shape, dtype=np.int32)
+    aseg[4:20, 4:20, 4:20] = 3
+    aseg[7:17, 6:18, 8:16] = 2
+    aseg[12:17, 6:18, 8:16] = 41
+    aparc = aseg.copy()
+    aparc[aseg == 3] = 1000
+    aparc[9:11, 9:11, 9:11] = 251
+    (tmp_path / "subject" / "mri").mkdir(parents=True)
+    for name, data in [
+        ("aseg.mgz", aseg),
+        ("aparc+aseg.mgz", aparc),
+        ("orig.mgz", rng.integers(50, 150, shape).astype(np.uint8)),
+        ("norm.mgz", rng.integers(80, 120, shape).astype(np.uint8)),
+    ]:
+        nb.save(nb.MGHImage(data, np.eye(4)), str(tmp_path / "subject" / "mri" / name))
+    return str(tmp_path)
+
+
+def test_checkSNR_ref_images(subjects_dir):
+    """Test that multiple reference images give the same results as single ones."""
+    snr = checkSNR(subjects_dir, "subject", ref_images=["orig.mgz", "norm.mgz"])
+    assert len(snr) == 2
+    assert snr[0] == checkSNR(subjects_dir, "subject", ref_image="orig.mgz")
+    assert snr[1] == checkSNR(subjects_dir, "subject", ref_image="norm.mgz")
+    assert np.all(np.isfinite(snr))
+
+    # missing reference images only affect their own results
+    with pytest.warns(UserWarning, match="could not open"):
+        snr = checkSNR(subjects_dir, "subject", ref_images=["none.mgz", "norm.mgz"])
+    assert np.all(np.isnan(snr[0]))
+    assert snr[1] == checkSNR(subjects_dir, "subject", ref_image="norm.mgz")
@@ -0,0 +1,166 @@
+"""Test createScreenshots.py"""
+
+import nibabel as nb
+import numpy as np
+import pytest
+from PIL import Image
+
+from .. import createScreenshots as createScreenshotsModule
+from ..createScreenshots import createScreenshots
+
+
+@pytest.fixture
+def subjects_dir(tmp_path):
+    """Create a small subject with norm and aseg images."""
+    rng = np.random.default_rng(0)
+    shape = (32, 32, 32)
+    norm = rng.integers(20, 120, shape).astype(np.uint8)
+    aseg = np.zeros(shape, dtype=np.int32)
+    aseg[8:24, 8:24, 8:24] = 3
+    aseg[12:20, 10:22, 12:20] = 2
+    aseg[14:18, 14:18, 14:18] = 17
+    (tmp_path / "subject" / "mri").mkdir(parents=True)
+    for name, data in [("norm.mgz", norm), ("aseg.mgz", aseg)]:
+        nb.save(nb.MGHImage(data, np.eye(4)), str(tmp_path / "subject" / "mri" / name))
+    return str(tmp_path)
+
+
+def _screenshot(subjects_dir, outfile, **kwargs):
+    """Create a non-interactive screenshot without surfaces and load it."""
+    createScreenshots(
+        SUBJECT="subject",
+        SUBJECTS_DIR=subjects_dir,
+        OUTFILE=str(outfile),
+        INTERACTIVE=False,
+        SURF=None,
+        **kwargs,
+    )
+    return np.asarray(Image.open(outfile))
+
+
+def test_figureTemplates(subjects_dir, tmp_path, monkeypatch):
+    """Test that re-used figure templates give the same images as new ones."""
+    monkeypatch.setattr(createScreenshotsModule, "_FIGURE_TEMPLATES", dict())
+    views4 = [("x", -2), ("x", 2), ("y", 0), ("z", 0)]
+    views3 = [("x", 2), ("y", -3), ("z", 1)]
+
+    _screenshot(subjects_dir, tmp_path / "a.png", LAYOUT=(2, 2), VIEWS=views4)
+    reused = _screenshot(subjects_dir, tmp_path / "b.png", LAYOUT=(2, 2), VIEWS=views3)
+
+    monkeypatch.setattr(createScreenshotsModule, "_FIGURE_TEMPLATES", dict())
+    fresh = _screenshot(subjects_dir, tmp_path / "c.png", LAYOUT=(2, 2), VIEWS=views3)
+
+    np.testing.assert_array_equal(reused, fresh)
+
+    # the same holds for templates that are re-used with the same views
+    reused = _screenshot(subjects_dir, tmp_path / "d.png", LAYOUT=(2, 2), VIEWS=views3)
+    np.testing.assert_array_equal(reused, fresh)
+
+
+def _enginePanels(subjects_dir, tmp_path, monkeypatch, **kwargs):
+    """Create screenshots with both engines and record the panels of each."""
+    panels = {"matplotlib": list(), "raster": list()}
+    compositePanels = createScreenshotsModule._compositePanels
+    updatePanel = createScreenshotsModule._updatePanel
+
+    def recordComposite(p, *args):
+        panels["raster"].extend(p)
+        return compositePanels(p, *args)
+
+    def recordUpdate(template, axsx, axsy, base, overlay, extent, xlim, ylim, *args):
+        panels["matplotlib"].append(
+            {
+                "base": base,
+                "overlay": overlay - 0.5 if overlay is not None else None,
+                "extent": extent,
+                "xlim": xlim,
+                "ylim": ylim,
+            }
+        )
+        return updatePanel(
+            template, axsx, axsy, base, overlay, extent, xlim, ylim, *args
+        )
+
+    monkeypatch.setattr(createScreenshotsModule, "_compositePanels", recordComposite)
+    monkeypatch.setattr(createScreenshotsModule, "_updatePanel", recordUpdate)
+
+    images = dict()
+    for engine in panels.keys():
+        images[engine] = _screenshot(
+            subjects_dir, tmp_path / (engine + ".png"), ENGINE=engine, **kwargs
+        )
+
+    return panels, images
+
+
+def test_engines(subjects_dir, tmp_path, monkeypatch):
+    """Test that both engines show the same slices in the same layout."""
+    views = [("x", 2), ("y", -3.4), ("z", 1)]
+    panels, images = _enginePanels(
+        subjects_dir, tmp_path, monkeypatch, VIEWS=list(views)
+    )
+
+    assert images["raster"].shape[0:2] == images["matplotlib"].shape[0:2]
+    assert len(panels["raster"]) == len(panels["matplotlib"]) == len(views)
+    for raster, mpl in zip(panels["raster"], panels["matplotlib"]):
+        np.testing.assert_array_equal(raster["base"], mpl["base"])
+        np.testing.assert_array_equal(raster["overlay"], mpl["overlay"])
+        for key in ["extent", "xlim", "ylim"]:
+            np.testing.assert_allclose(raster[key], mpl[key])
+
+
+def test_unknownLabels(subjects_dir, tmp_path):
+    """Test that overlay values that are not in the colortable are rejected."""
+    aseg = np.zeros((32, 32, 32), dtype=np.int32)
+    aseg[10:20, 10:20, 10:20] = 75
+    overlay = str(tmp_path / "overlay.mgz")
+    nb.save(nb.MGHImage(aseg, np.eye(4)), overlay)
+
+    for engine in ["matplotlib", "raster"]:
+        with pytest.raises(ValueError, match="colortable: \\[75\\]"):
+            _screenshot(
+                subjects_dir, tmp_path / "a.png", OVERLAY=overlay, ENGINE=engine
+            )
+
+
+def test_sliceIndices(tmp_path, monkeypatch):
+    """Test slice selection and overlay colors for a non-cubic image."""
+    from ..fsqcUtils import returnColorLUT
+
+    rng = np.random.default_rng(1)
+    shape = (24, 32, 16)
+    norm = rng.integers(20, 120, shape).astype(np.uint8)
+    aseg = np.zeros(shape, dtype=np.int32)
+    aseg[4:20, 8:24, 2:14] = 17
+    aseg[8:16, 12:20, 4:12] = 2035
+    affine = np.array([[0, -1, 0, 5], [0, 0, 2, -3], [-1, 0, 0, 7], [0, 0, 0, 1]])
+    (tmp_path / "subject" / "mri").mkdir(parents=True)
+    for name, data in [("norm.mgz", norm), ("aseg.mgz", aseg)]:
+        nb.save(nb.MGHImage(data, affine), str(tmp_path / "subject" / "mri" / name))
+
+    # the tkr RAS coordinates are x = 12 - i, y = 2 * k - 16, z = 16 - j
+    views = [("x", 3), ("y", -5.2), ("z", 10)]
+    panels, _ = _enginePanels(str(tmp_path), tmp_path, monkeypatch, VIEWS=views)
+    # the given views are not modified
+    assert views == [("x", 3), ("y", -5.2), ("z", 10)]
+    regions = [
+        (slice(9, 10), slice(None), slice(None)),
+        (slice(None), slice(None), slice(5, 6)),
+        (slice(None), slice(6, 7), slice(None)),
+    ]
+
+    lut = returnColorLUT()
+    for engine in ["matplotlib", "raster"]:
+        for panel, region, transpose in zip(panels[engine], regions, [0, 1, 1]):
+            base = np.squeeze(norm[region])
+            labels = np.squeeze(aseg[region])
+            if transpose:
+                base = base.transpose()
+                labels = labels.transpose()
+            np.testing.assert_array_equal(panel["base"], base)
+            # overlays are given as rows of the colortable
+            np.testing.assert_array_equal(panel["overlay"], lut["index"][labels])
+            np.testing.assert_array_equal(
+                lut["table"]["id"][panel["overlay"].astype(int)], labels
+            )
+        np.testing.assert_allclose(panels[engine][0]["extent"], (-16, 14, 16, -15))
@@ -0,0 +1,135 @@
+"""Test createSurfacePlots.py"""
+
+import nibabel as nb
+import numpy as np
+import pytest
+from PIL import Image
+
+from .. import createSurfacePlots as createSurfacePlotsModule
+from ..createSurfacePlots import (
+    _createSurfaceFigure,
+    _exportSurfaceFigures,
+    _rasterizeSurface,
+    _setSurfaceCamera,
+    createSurfacePlots,
+)
+from .test_fsqcUtils import _sphere
+
+
+def _cube():
+    """Create a triangle mesh of the unit cube, with red vertices at x=1."""
+    v = np.array(
+        [[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=float
+    )
+    t = np.array(
+        [
+            [0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5],
+            [0, 4, 5], [0, 5, 1], [2, 3, 7], [2, 7, 6],
+            [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3],
+        ]
+    )  # fmt: skip
+    vcolor = np.where(v[:, [0]] > 0, [[255, 0, 0]], [[0, 0, 255]])
+    return v, t, vcolor
+
+
+def test_rasterizeSurface(tmp_path):
+    """Test that the closest faces are rendered within the projected extent."""
+    v, t, vcolor = _cube()
+    size = 100
+
+    for eye, color in [((2, 0, 0), 0), ((-2, 0, 0), 2), ((0, 0, 2), None)]:
+        outfile = str(tmp_path / "cube.png")
+        _rasterizeSurface(v, t, vcolor, eye, (0, 0, 1), size, outfile)
+        image = np.asarray(Image.open(outfile))
+
+        assert image.shape == (size, size, 3)
+
+        # the cube covers the central 90 percent of the image
+        covered = np.any(image > 0, axis=2)
+        assert covered[6:94, 6:94].all()
+        assert not covered[:4, :].any() and not covered[96:, :].any()
+        assert not covered[:, :4].any() and not covered[:, 96:].any()
+
+        # looking along the x axis, only the face closest to the eye is visible
+        if color is not None:
+            center = image[10:90, 10:90].reshape(-1, 3)
+            assert np.all(center[:, color] > 0)
+            assert np.all(center[:, 2 - color] == 0)
+
+
+def test_createSurfacePlots_n_jobs(tmp_path):
+    """Test that rendering in worker processes creates the same images."""
+    v, t = _sphere()
+    ctab = np.array([[255, 0, 0, 0, 255], [0, 0, 255, 0, 16711680]])
+    for d in ["surf", "label"]:
+        (tmp_path / "subject" / d).mkdir(parents=True)
+    for hemi in ["lh", "rh"]:
+        for surf in ["pial", "inflated"]:
+            nb.freesurfer.write_geometry(
+                str(tmp_path / "subject" / "surf" / (hemi + "." + surf)), v, t
+            )
+        nb.freesurfer.write_annot(
+            str(tmp_path / "subject" / "label" / (hemi + ".aparc.annot")),
+            (v[:, 2] > 0).astype(int),
+            ctab,
+            ["inferior", "superior"],
+        )
+
+    views = ["left"]
+    images = dict()
+    for n_jobs in [1, 3]:
+        outdir = tmp_path / ("out" + str(n_jobs))
+        outdir.mkdir()
+        # images of views that are not requested are removed
+        stale = outdir / "lh.pial.anterior.png"
+        stale.touch()
+
+        createSurfacePlots(
+            "subject", str(tmp_path), str(outdir), views, False, "raster", None, n_jobs
+        )
+
+        assert not stale.exists()
+        images[n_jobs] = {
+            f.name: np.asarray(Image.open(f)) for f in sorted(outdir.glob("*.png"))
+        }
+
+    assert len(images[1]) == 4
+    assert images[1].keys() == images[3].keys()
+    for name in images[1]:
+        np.testing.assert_array_equal(images[1][name], images[3][name])
+
+
+def test_exportSurfaceFigures(tmp_path, monkeypatch):
+    """Test that figures are exported in a single batch with kaleido >= 1."""
+    pytest.importorskip("kaleido")
+    import plotly.io as pio
+
+    v, t, vcolor = _cube()
+    fig = _createSurfaceFigure(v, t, vcolor, 64)
+    figures = [_setSurfaceCamera(fig, dict(eye=dict(x=x, y=0, z=0))) for x in (2, -2)]
+    files = [str(tmp_path / (str(i) + ".png")) for i in range(len(figures))]
+
+    calls = list()
+    if hasattr(pio, "write_images"):
+        writeImages = pio.write_images
+
+        def recordWriteImages(*args, **kwargs):
+            calls.append(args)
+            return writeImages(*args, **kwargs)
+
+        monkeypatch.setattr(pio, "write_images", recordWriteImages)
+
+    _exportSurfaceFigures(figures, files, 2, 64)
+
+    if (
+        hasattr(pio, "write_images")
+        and createSurfacePlotsModule._kaleidoMajorVersion() >= 1
+    ):
+        assert len(calls) == 1
+
+    # each file shows its own view: the red face at x=1, or the blue one
+    for file, color in zip(files, [0, 2]):
+        image = np.asarray(Image.open(file).convert("RGB")).astype(int)
+        assert image.shape == (128, 128, 3)
+        center = image[32:96, 32:96].reshape(-1, 3)
+        assert np.mean(center[:, color]) > np.mean(center[:, 2 - color])
@@ -0,0 +1,277 @@
+"""Test fsqcCache.py"""
+
+import shutil
+
+import nibabel as nb
+import numpy as np
+import pytest
+
+from .. import fsqcCache
+from ..fsqcCache import (
+    _cache,
+    importDecimatedSurface,
+    importHeader,
+    importImage,
+    importRegion,
+    importResampled,
+    volumeCache,
+)
+
+
+@pytest.fixture
+def mgz_file(tmp_path):
+    """Create a small MGZ image."""
+    data = np.arange(4 * 5 * 6, dtype=np.int32).reshape((4, 5, 6))
+    filename = str(tmp_path / "test.mgz")
+    nb.save(nb.MGHImage(data, np.eye(4)), filename)
+    return filename, data
+
+
+def test_importImage(mgz_file):
+    """Test loading of an image without active cache."""
+    filename, data = mgz_file
+    img = importImage(filename)
+    assert isinstance(img, nb.MGHImage)
+    assert img.dataobj.dtype.isnative
+    assert not img.dataobj.flags.writeable
+    np.testing.assert_array_equal(img.get_fdata(), data)
+    assert len(_cache) == 0
+
+
+def test_volumeCache(mgz_file):
+    """Test that cached volumes are shared and evicted."""
+    filename, data = mgz_file
+    with volumeCache(10 * data.nbytes):
+        img1 = importImage(filename)
+        img2 = importImage(filename)
+        assert img1 is not img2
+        assert img1.dataobj is img2.dataobj
+        assert len(_cache) == 1
+    assert len(_cache) == 0
+
+    # volumes that exceed the size of the cache are not kept
+    with volumeCache(data.nbytes - 1):
+        importImage(filename)
+        assert len(_cache) == 0
+
+
+def test_volumeCache_cache_dir(mgz_file, tmp_path):
+    """Test that volumes are stored in and memory-mapped from the cache dir."""
+    filename, data = mgz_file
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+
+    with volumeCache(10 * data.nbytes, cache_dir=str(cache_dir)):
+        img = importImage(filename)
+        np.testing.assert_array_equal(img.get_fdata(), data)
+    assert len(list(cache_dir.glob("*.npy"))) == 1
+
+    # subsequent loads use the on-disk cache
+    with volumeCache(10 * data.nbytes, cache_dir=str(cache_dir)):
+        img = importImage(filename)
+        assert isinstance(img, nb.MGHImage)
+        assert isinstance(img.dataobj, np.memmap)
+        assert img.dataobj.dtype.isnative
+        np.testing.assert_array_equal(img.get_fdata(), data)
+        np.testing.assert_array_equal(img.affine, np.eye(4))
+
+    # modified files are re-read
+    nb.save(nb.MGHImage(data + 1, np.eye(4)), filename)
+    with volumeCache(10 * data.nbytes, cache_dir=str(cache_dir)):
+        np.testing.assert_array_equal(importImage(filename).get_fdata(), data + 1)
+    assert len(list(cache_dir.glob("*.npy"))) == 2
+
+
+def test_volumeCache_eviction(tmp_path, monkeypatch):
+    """Test that headers are stored without pickle and volumes are evicted."""
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    files = list()
+    for i in range(4):
+        data = np.full((4, 5, 6), i, dtype=np.int32)
+        files.append(str(tmp_path / ("test" + str(i) + ".mgz")))
+        nb.save(nb.MGHImage(data, np.diag([2, 1, 1, 1])), files[-1])
+
+    scans = list()
+    evictVolumes = fsqcCache._evictVolumes
+
+    def countScans(*args):
+        scans.append(args)
+        return evictVolumes(*args)
+
+    monkeypatch.setattr(fsqcCache, "_evictVolumes", countScans)
+
+    with volumeCache(0, cache_dir=str(cache_dir)):
+        importImage(files[0])
+        assert len(list(cache_dir.glob("*.header.npz"))) == 1
+        for file in cache_dir.glob("*.header.npz"):
+            with np.load(file, allow_pickle=False) as cached:
+                assert str(cached["img_class"]) == "MGHImage"
+        header = importHeader(files[0])
+        assert isinstance(header, nb.freesurfer.mghformat.MGHHeader)
+        assert header.get_zooms() == (2, 1, 1)
+
+        # the cache directory is only scanned when the size limit is crossed
+        importRegion(files[1], (slice(0, 1), slice(0, 5), slice(0, 6)))
+        importImage(files[2])
+        assert len(scans) == 1
+
+        # recently used volumes are kept, also if the cache directory is full
+        monkeypatch.setattr(fsqcCache, "VOLUME_CACHE_SIZE", 1)
+        importImage(files[3])
+        assert len(scans) == 2
+        assert len(list(cache_dir.glob("*.header.npz"))) == 4
+
+        # least recently used volumes are removed
+        monkeypatch.setattr(fsqcCache, "EVICTION_GRACE_PERIOD", 0)
+        importImage(files[0])
+        size = sum(f.stat().st_size for f in cache_dir.iterdir())
+        assert fsqcCache._evictVolumes(str(cache_dir), size - 1) < size
+        assert len(list(cache_dir.glob("*.header.npz"))) == 3
+        assert len(list(cache_dir.glob("*.zidx.npz"))) == 0
+        assert len(list(cache_dir.glob("*.zbricks"))) == 0
+        assert len(list(cache_dir.glob("*.npy"))) == 3
+
+
+def test_evictVolumes_lock(mgz_file, tmp_path, monkeypatch):
+    """Test that volumes are only evicted by one process at a time."""
+    fcntl = pytest.importorskip("fcntl")
+    filename, data = mgz_file
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    monkeypatch.setattr(fsqcCache, "EVICTION_GRACE_PERIOD", 0)
+    with volumeCache(0, cache_dir=str(cache_dir)):
+        importImage(filename)
+
+    with open(cache_dir / "evict.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        assert fsqcCache._evictVolumes(str(cache_dir), 0) is None
+        assert len(list(cache_dir.glob("*.npy"))) == 1
+    assert fsqcCache._evictVolumes(str(cache_dir), 0) == 0
+    assert len(list(cache_dir.glob("*.npy"))) == 0
+
+
+def test_importRegion(tmp_path):
+    """Test reading of image regions from the brick index."""
+    data = np.random.default_rng(0).random((40, 37, 33)).astype(np.float32)
+    filename = str(tmp_path / "test.mgz")
+    nb.save(nb.MGHImage(data, np.eye(4)), filename)
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+
+    regions = [
+        (slice(20, 21), slice(0, 37), slice(0, 33)),
+        (slice(0, 40), slice(36, 37), slice(0, 33)),
+        (slice(5, 35), slice(3, 20), slice(16, 33)),
+    ]
+
+    # without cache
+    for region in regions:
+        np.testing.assert_array_equal(importRegion(filename, region), data[region])
+
+    # the first call creates the brick index, the following calls use it
+    with volumeCache(0, cache_dir=str(cache_dir)):
+        for region in regions:
+            np.testing.assert_array_equal(importRegion(filename, region), data[region])
+        assert len(list(cache_dir.glob("*.zidx.npz"))) == 1
+        assert len(list(cache_dir.glob("*.npy"))) == 0
+        header = importHeader(filename)
+        assert header.get_data_shape() == data.shape
+
+    # loaded volumes are kept in memory, and the brick index is the only copy
+    # of the data on disk
+    shutil.rmtree(str(cache_dir))
+    cache_dir.mkdir()
+    with volumeCache(10 * data.nbytes, cache_dir=str(cache_dir)):
+        importRegion(filename, regions[0])
+        assert len(_cache) == 1
+    with volumeCache(10 * data.nbytes, cache_dir=str(cache_dir)):
+        img = importImage(filename)
+        np.testing.assert_array_equal(img.get_fdata(), data)
+        assert not img.dataobj.flags.writeable
+    assert len(list(cache_dir.glob("*.zidx.npz"))) == 1
+    assert len(list(cache_dir.glob("*.npy"))) == 0
+
+
+def test_importDecimatedSurface(tmp_path):
+    """Test that decimated surfaces are stored in and read from the cache dir."""
+    from .test_fsqcUtils import _sphere
+
+    v, t = _sphere(40)
+    surf_file = str(tmp_path / "lh.pial")
+    nb.freesurfer.write_geometry(surf_file, v, t)
+    annot_file = str(tmp_path / "lh.aparc.annot")
+    ctab = np.array([[255, 0, 0, 0, 255], [0, 0, 255, 0, 16711680]])
+    nb.freesurfer.write_annot(
+        annot_file, (v[:, 2] > 0).astype(int), ctab, ["inferior", "superior"]
+    )
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+
+    # without cache
+    vd, td, labels = importDecimatedSurface(surf_file, annot_file, 500)
+    assert len(td) <= 500 and len(vd) == len(labels)
+    assert set(np.unique(labels)) == {0, 1}
+
+    with volumeCache(0, cache_dir=str(cache_dir)):
+        result = importDecimatedSurface(surf_file, annot_file, 500)
+        assert len(list(cache_dir.glob("*.mesh.npz"))) == 1
+        cached = importDecimatedSurface(surf_file, annot_file, 500)
+        importDecimatedSurface(surf_file, annot_file, 300)
+        assert len(list(cache_dir.glob("*.mesh.npz"))) == 2
+    for a, b, c in zip(result, cached, (vd, td, labels)):
+        np.testing.assert_array_equal(a, b)
+        np.testing.assert_array_equal(a, c)
+
+
+def test_importResampled(mgz_file, tmp_path, monkeypatch):
+    """Test that resampled images are keyed by file contents and evicted."""
+    filename, data = mgz_file
+    mat_file = str(tmp_path / "cc_up.lta")
+    with open(mat_file, "w") as f:
+        f.write("type = 0\n")
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+
+    calls = list()
+
+    def resample(value):
+        calls.append(value)
+        return {"data": data + value}
+
+    def load(filename, params):
+        result = importResampled(
+            filename, mat_file, params, lambda: resample(params[0])
+        )
+        return result["data"]
+
+    # without cache
+    np.testing.assert_array_equal(load(filename, (1,)), data + 1)
+    np.testing.assert_array_equal(load(filename, (1,)), data + 1)
+    assert calls == [1, 1]
+
+    calls.clear()
+    with volumeCache(0, cache_dir=str(cache_dir)):
+        load(filename, (1,))
+        # identical copies of the files are found in the cache
+        copy = str(tmp_path / "copy.mgz")
+        shutil.copy(filename, copy)
+        np.testing.assert_array_equal(load(copy, (1,)), data + 1)
+        assert calls == [1]
+
+        # other parameters or transforms are not
+        load(filename, (2,))
+        with open(mat_file, "a") as f:
+            f.write("nxforms = 1\n")
+        load(filename, (2,))
+        assert calls == [1, 2, 2]
+        assert len(list(cache_dir.glob("*.resampled.npz"))) == 3
+
+        # least recently used files are removed
+        size = max(f.stat().st_size for f in cache_dir.glob("*.resampled.npz"))
+        monkeypatch.setattr(fsqcCache, "RESAMPLED_CACHE_SIZE", 2 * size)
+        load(filename, (3,))
+        assert len(list(cache_dir.glob("*.resampled.npz"))) == 2
+        load(filename, (3,))
+        load(filename, (2,))
+        assert calls == [1, 2, 2, 3]
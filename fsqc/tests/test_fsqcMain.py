@@ -0,0 +1,178 @@
+"""Test fsqcMain.py"""
+
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from ..fsqcMain import _run_tasks, run_fsqc
+
+# files that need to exist for a subject to be processed
+SUBJECT_FILES = [
+    "stats/aseg.stats",
+    "surf/lh.w-g.pct.mgh",
+    "surf/rh.w-g.pct.mgh",
+    "label/lh.cortex.label",
+    "label/rh.cortex.label",
+    "mri/transforms/talairach.lta",
+    "mri/norm.mgz",
+    "mri/aseg.mgz",
+    "mri/aparc+aseg.mgz",
+    "scripts/recon-all.log",
+]
+
+METRICS = [
+    "wm_snr_orig",
+    "gm_snr_orig",
+    "wm_snr_norm",
+    "gm_snr_norm",
+    "cc_size",
+    "holes_lh",
+    "holes_rh",
+    "defects_lh",
+    "defects_rh",
+    "topo_lh",
+    "topo_rh",
+    "con_snr_lh",
+    "con_snr_rh",
+    "rot_tal_x",
+    "rot_tal_y",
+    "rot_tal_z",
+]
+
+
+@pytest.fixture
+def group_dirs(tmp_path):
+    """Create subjects and the outputs of the metrics and shape modules."""
+    subjects_dir = tmp_path / "subjects"
+    output_dir = tmp_path / "output"
+    shape = {"subject1": {"lh.a": 0.5}, "subject2": {"rh.b": 0.25}}
+    for subject in shape.keys():
+        for file in SUBJECT_FILES:
+            (subjects_dir / subject / file).parent.mkdir(parents=True, exist_ok=True)
+            (subjects_dir / subject / file).touch()
+        (output_dir / "metrics" / subject).mkdir(parents=True)
+        (output_dir / "brainprint" / subject).mkdir(parents=True)
+        pd.DataFrame(
+            {"subject": subject} | {x: 1.0 for x in METRICS}, index=[subject]
+        ).to_csv(output_dir / "metrics" / subject / "metrics.csv")
+        pd.DataFrame({x: [y] for x, y in shape[subject].items()}).to_csv(
+            output_dir
+            / "brainprint"
+            / subject
+            / (subject + ".brainprint.asymmetry.csv"),
+            index=False,
+        )
+    return str(subjects_dir), str(output_dir)
+
+
+def _tasks(log, lock, active):
+    """Create tasks that log their start and end, and track shared resources."""
+
+    def run(name, resources):
+        with lock:
+            log.append(("start", name))
+            for resource in resources:
+                active[resource] = active.get(resource, 0) + 1
+                assert active[resource] == 1, "resource used concurrently"
+        time.sleep(0.05)
+        with lock:
+            for resource in resources:
+                active[resource] -= 1
+            log.append(("end", name))
+        return name
+
+    specs = [("a", ["mpl"]), ("b", []), ("c", ["mpl"]), ("d", []), ("e", ["mpl"])]
+    return [
+        {
+            "name": name,
+            "function": run,
+            "args": (name, resources),
+            "resources": resources,
+        }
+        for name, resources in specs
+    ]
+
+
+@pytest.mark.parametrize("n_threads", [1, 3])
+def test_run_tasks(n_threads):
+    """Test that tasks are run in order and respect their shared resources."""
+    log = list()
+    lock = threading.Lock()
+    active = dict()
+
+    results = _run_tasks(_tasks(log, lock, active), n_threads=n_threads)
+    assert results == {x: x for x in "abcde"}
+
+    # tasks that share a resource are run one after another, in order
+    for before, after in [("a", "c"), ("c", "e")]:
+        assert log.index(("end", before)) < log.index(("start", after))
+
+    # tasks are run sequentially in the given order with a single thread
+    if n_threads == 1:
+        assert log == [(x, y) for y in "abcde" for x in ("start", "end")]
+
+    # otherwise, tasks without shared resources are run concurrently
+    else:
+        assert log.index(("start", "b")) < log.index(("end", "a"))
+        assert log.index(("start", "d")) < log.index(("end", "a"))
+
+
+def test_group_only(group_dirs):
+    """Test that group-only runs collect the shape results of all subjects."""
+    subjects_dir, output_dir = group_dirs
+    run_fsqc(
+        subjects_dir=subjects_dir, output_dir=output_dir, shape=True, group_only=True
+    )
+
+    results = pd.read_csv(output_dir + "/fsqc-results.csv", index_col="subject")
+    assert results.loc["subject1", "lh.a"] == 0.5
+    assert results.loc["subject2", "rh.b"] == 0.25
+    assert results[["lh.a", "rh.b"]].isna().sum().sum() == 2
+
+
+def test_argsDict_previous_version(group_dirs):
+    """Test that an argsDict without the arguments of later versions works."""
+    subjects_dir, output_dir = group_dirs
+    argsDict = {
+        "subjects_dir": subjects_dir,
+        "output_dir": output_dir,
+        "subjects": None,
+        "subjects_file": None,
+        "shape": True,
+        "screenshots": False,
+        "screenshots_html": False,
+        "screenshots_base": "default",
+        "screenshots_overlay": "default",
+        "screenshots_surf": "default",
+        "screenshots_views": "default",
+        "screenshots_layout": "default",
+        "screenshots_orientation": "radiological",
+        "surfaces": False,
+        "surfaces_html": False,
+        "surfaces_views": ["left", "right", "superior", "inferior"],
+        "skullstrip": False,
+        "skullstrip_html": False,
+        "fornix": False,
+        "fornix_html": False,
+        "hypothalamus": False,
+        "hypothalamus_html": False,
+        "hippocampus": False,
+        "hippocampus_html": False,
+        "hippocampus_label": None,
+        "outlier": False,
+        "outlier_table": None,
+        "fastsurfer": False,
+        "no_group": False,
+        "group_only": True,
+        "exit_on_error": False,
+        "skip_existing": False,
+        "logfile": None,
+    }
+
+    argsDict = run_fsqc(subjects_dir=None, output_dir=None, argsDict=argsDict)
+    assert argsDict["n_jobs"] == 1 and argsDict["n_threads"] == 1
+    assert argsDict["screenshots_engine"] == "matplotlib"
+    results = pd.read_csv(output_dir + "/fsqc-results.csv", index_col="subject")
+    assert list(results.index) == ["subject1", "subject2"]
@@ -0,0 +1,399 @@
+"""Test fsqcUtils.py"""
+
+import nibabel as nb
+import numpy as np
+import pytest
+
+from ..fsqcUtils import (
+    applyTransform,
+    binarizeImage,
+    binaryErosion,
+    chainLevelsets,
+    decimateMesh,
+    importLabels,
+    importMGH,
+    labelStats,
+    levelsetsTria,
+    levelsetsTriaMulti,
+    returnColorLUT,
+    returnFreeSurferColorLUT,
+)
+
+
+def test_importLabels(tmp_path):
+    """Test that label volumes keep their native data type."""
+    data = np.zeros((4, 5, 6), dtype=np.int32)
+    data[1:3, 1:4, 2:5] = 17
+    filename = str(tmp_path / "aseg.mgz")
+    nb.save(nb.MGHImage(data, np.eye(4)), filename)
+
+    labels = importLabels(filename)
+    assert labels.dtype == np.int32
+    np.testing.assert_array_equal(labels, data)
+
+    labels, img = importLabels(filename, return_image=True)
+    assert isinstance(img, nb.MGHImage)
+    assert img.shape == data.shape
+
+
+@pytest.mark.parametrize("interp", ["nearest", "cubic"])
+def test_applyTransform(tmp_path, interp):
+    """Test that transforming a region equals the region of the whole image."""
+    data = np.random.default_rng(0).integers(0, 255, (60, 22, 24)).astype(np.uint8)
+    filename = str(tmp_path / "norm.mgz")
+    nb.save(nb.MGHImage(data, np.eye(4)), filename)
+    mat_file = str(tmp_path / "cc_up.lta")
+    with open(mat_file, "w") as f:
+        f.write(
+            "type      = 0 # LINEAR_VOX_TO_VOX\n"
+            "nxforms   = 1\n"
+            "1 4 4\n"
+            "9.998e-01 -1.745e-02 0.000e+00 2.2e+00\n"
+            "1.745e-02 9.998e-01 0.000e+00 -2.1e+00\n"
+            "0.000e+00 0.000e+00 1.000e+00 0.5e+00\n"
+            "0.000e+00 0.000e+00 0.000e+00 1.000e+00\n"
+        )
+        for volume in ["src", "dst"]:
+            f.write(
+                volume + " volume info\n"
+                "valid = 1  # volume info valid\n"
+                "filename = norm.mgz\n"
+                "volume = 60 22 24\n"
+                "voxelsize = 1.0e+00 1.0e+00 1.0e+00\n"
+                "xras   = 1.0e+00 0.0e+00 0.0e+00\n"
+                "yras   = 0.0e+00 1.0e+00 0.0e+00\n"
+                "zras   = 0.0e+00 0.0e+00 1.0e+00\n"
+                "cras   = 0.0e+00 0.0e+00 0.0e+00\n"
+            )
+
+    full = np.asanyarray(applyTransform(filename, None, mat_file, interp).dataobj)
+
+    # cubic interpolation of a region in float32 uses only a part of the
+    # image, which is cropped along the first axis here
+    region = (slice(28, 31), slice(0, 22), slice(0, 24))
+    img = applyTransform(
+        filename, None, mat_file, interp, out_region=region, dtype=np.float32
+    )
+    result = np.asanyarray(img.dataobj)
+    assert result.shape == data.shape
+    if interp == "nearest":
+        np.testing.assert_array_equal(result[region], full[region])
+    else:
+        assert result.dtype == np.float32
+        np.testing.assert_allclose(result[region], full[region], rtol=0, atol=1e-3)
+    assert not result[:28].any() and not result[31:].any()
+
+
+def test_binarizeImage(tmp_path):
+    """Test that in-memory images match images that are written and re-read."""
+    from ..fsqcCache import importHeader, importRegion
+
+    data = np.zeros((4, 5, 6), dtype=np.int32)
+    data[1:3, 1:4, 2:5] = 17
+    data[0, 0, 0] = 251
+    filename = str(tmp_path / "aseg.mgz")
+    affine = np.array([[-1.0, 0, 0, 2], [0, 0, 1, -3], [0, -1, 0, 4], [0, 0, 0, 1]])
+    nb.save(nb.MGHImage(data, affine), filename)
+
+    out_file = str(tmp_path / "cc.mgz")
+    img = binarizeImage(filename, out_file, match=[251, 252])
+    written = nb.load(out_file)
+    assert isinstance(img, nb.MGHImage)
+    np.testing.assert_array_equal(np.asanyarray(img.dataobj), written.dataobj)
+    assert img.dataobj.dtype == written.get_data_dtype().newbyteorder("=")
+    np.testing.assert_allclose(
+        img.header.get_vox2ras_tkr(), written.header.get_vox2ras_tkr()
+    )
+
+    # in-memory images can be used as input, without writing the output
+    img = binarizeImage(nb.load(filename))
+    np.testing.assert_array_equal(img.dataobj, data != 0)
+    assert len(list(tmp_path.glob("*.mgz"))) == 2
+    assert importHeader(img) is img.header
+    region = (slice(1, 2), slice(0, 5), slice(0, 6))
+    np.testing.assert_array_equal(importRegion(img, region), data[region] != 0)
+
+
+@pytest.mark.filterwarnings("ignore::FutureWarning")
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5])
+def test_binaryErosion(size):
+    """Test that binaryErosion matches skimage's binary_erosion."""
+    morphology = pytest.importorskip("skimage.morphology")
+
+    rng = np.random.default_rng(0)
+    mask = np.zeros((20, 22, 24), dtype=bool)
+    mask[3:15, 4:20, 2:22] = rng.random((12, 16, 20)) > 0.1
+    # mask touching the border of the image
+    mask[:6, :5, 18:] = True
+
+    expected = morphology.binary_erosion(mask, np.ones((size, size, size)))
+    np.testing.assert_array_equal(binaryErosion(mask, size), expected)
+
+    # empty mask
+    assert not binaryErosion(np.zeros_like(mask), size).any()
+
+
+def test_labelStats():
+    """Test that labelStats matches the measurements of scipy.ndimage."""
+    from scipy import ndimage
+
+    rng = np.random.default_rng(0)
+    labels = np.zeros((20, 22, 24), dtype=np.int32)
+    labels[2:12, 3:15, 4:20] = rng.choice([1, 2, 17], size=(10, 12, 16))
+    labels[15:18, 0:5, 20:24] = 5
+    image = rng.integers(0, 255, labels.shape).astype(np.uint8)
+    index = [1, 2, 5, 17]
+
+    stats = labelStats(labels, image)
+    assert len(stats["count"]) == 18
+    np.testing.assert_array_equal(stats["count"], np.bincount(labels.ravel()))
+    np.testing.assert_array_equal(
+        stats["centroid"][index], ndimage.center_of_mass(labels, labels, index)
+    )
+    assert np.all(np.isnan(stats["centroid"][[3, 4, 16]]))
+    np.testing.assert_array_equal(
+        stats["sum"][index], ndimage.sum(image, labels, index)
+    )
+    np.testing.assert_array_equal(
+        stats["sumsq"][index], ndimage.sum(image.astype(float) ** 2, labels, index)
+    )
+    assert stats["bbox"][0] is None and stats["bbox"][3] is None
+    assert stats["bbox"][5] == (slice(15, 18), slice(0, 5), slice(20, 24))
+    assert stats["bbox"][1:] == ndimage.find_objects(labels)
+
+    # centroids and bounding boxes can be omitted
+    reduced = labelStats(labels, image, centroids=False, bboxes=False)
+    assert sorted(reduced.keys()) == ["count", "sum", "sumsq"]
+    for key in reduced.keys():
+        np.testing.assert_array_equal(reduced[key], stats[key])
+
+    # integer-valued float labels are accepted, others are not
+    assert "sum" not in labelStats(labels.astype(np.float32))
+    with pytest.raises(ValueError, match="integers"):
+        labelStats(labels + 0.5)
+    with pytest.raises(ValueError, match="non-negative"):
+        labelStats(labels - 1)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.int32, np.float32, np.int16, np.uint16])
+@pytest.mark.parametrize("ext", [".mgh", ".mgz"])
+def test_importMGH(tmp_path, dtype, ext):
+    """Test that importMGH matches nibabel for all MGH data types."""
+    data = np.arange(4 * 5 * 6 * 2).reshape((4, 5, 6, 2)).astype(dtype)
+    affine = np.array(
+        [[-2.0, 0, 0, 10], [0, 0, 1.5, -20], [0, -1, 0, 30], [0, 0, 0, 1]]
+    )
+    filename = str(tmp_path / ("test" + ext))
+    nb.save(nb.MGHImage(data, affine), filename)
+
+    vol, header = importMGH(filename, return_header=True)
+    np.testing.assert_array_equal(vol, data)
+    np.testing.assert_allclose(header["vox2ras"], nb.load(filename).affine)
+    assert header["nframes"] == 2
+
+    # single frame volumes are squeezed
+    nb.save(nb.MGHImage(data[..., 0], affine), filename)
+    np.testing.assert_array_equal(importMGH(filename), data[..., 0])
+
+
+def _levelsetsTriaLoop(v, t, p, levelsets):
+    """Reference implementation of levelsetsTria with a loop over triangles."""
+    from scipy.sparse import lil_matrix
+
+    vLVL = list()
+    lLVL = list()
+    iLVL = list()
+
+    levelsets = np.array(levelsets, ndmin=2)
+
+    for lidx in range(len(levelsets)):
+        A = lil_matrix((np.shape(v)[0], np.shape(v)[0]))
+        lvl = levelsets[lidx]
+        nlvl = p[t] > lvl
+        n = np.where(
+            np.logical_or(np.sum(nlvl, axis=1) == 1, np.sum(nlvl, axis=1) == 2)
+        )[0]
+
+        ti = list()
+        vi = list()
+
+        for i in range(len(n)):
+            oi = np.where(nlvl[n[i], :])[0]
+            if len(oi) == 2:
+                oi = np.setdiff1d((0, 1, 2), oi)
+            oix = np.setdiff1d((0, 1, 2), oi)
+
+            tij = list()
+            for j in range(2):
+                if np.count_nonzero(A[t[n[i], oi.item()], t[n[i], oix[j]]]) == 0:
+                    d = v[t[n[i], oix[j]], :] - v[t[n[i], oi], :]
+                    s = (lvl - p[t[n[i], oi]]) / (p[t[n[i], oix[j]]] - p[t[n[i], oi]])
+                    vi.append((s * d + v[t[n[i], oi], :]).tolist()[0])
+                    A[t[n[i], oi.item()], t[n[i], oix[j]]] = len(vi)
+                    A[t[n[i], oix[j]], t[n[i], oi.item()]] = len(vi)
+                tij.append(int(A[t[n[i], oi.item()], t[n[i], oix[j]]]))
+
+            ti.append(tuple(tij))
+
+        vLVL.append(vi)
+        lLVL.append(ti)
+        iLVL.append(n)
+
+    return vLVL, lLVL, iLVL
+
+
+def _sphere(n=20):
+    """Create a closed triangle mesh of a (perturbed) UV sphere."""
+    rng = np.random.default_rng(0)
+    theta, phi = np.meshgrid(
+        np.linspace(0, np.pi, n + 2)[1:-1], np.linspace(0, 2 * np.pi, 2 * n + 1)[:-1]
+    )
+    theta, phi = theta.T.flatten(), phi.T.flatten()
+    r = 50 + rng.random(len(theta))
+    v = np.stack(
+        (
+            r * np.sin(theta) * np.cos(phi),
+            r * np.sin(theta) * np.sin(phi),
+            r * np.cos(theta),
+        ),
+        axis=1,
+    )
+    v = np.vstack((v, [[0, 0, 51], [0, 0, -51]]))
+    t = list()
+    for i in range(n - 1):
+        for j in range(2 * n):
+            a, b = i * 2 * n + j, i * 2 * n + (j + 1) % (2 * n)
+            t.extend([(a, b, a + 2 * n), (b, b + 2 * n, a + 2 * n)])
+    for j in range(2 * n):
+        t.append((len(v) - 2, (j + 1) % (2 * n), j))
+        t.append((len(v) - 1, (n - 1) * 2 * n + j, (n - 1) * 2 * n + (j + 1) % (2 * n)))
+    return v, np.array(t)
+
+
+@pytest.mark.parametrize("lvl", [-30.5, 0, 12.25, 60])
+def test_levelsetsTria(lvl):
+    """Test that levelsetsTria is equivalent to the loop-based implementation."""
+    v, t = _sphere()
+    for dim in range(3):
+        expected = _levelsetsTriaLoop(v, t, v[:, dim], lvl)
+        result = levelsetsTria(v, t, v[:, dim], lvl)
+        assert result[0] == expected[0]
+        assert result[1] == expected[1]
+        np.testing.assert_array_equal(result[2][0], expected[2][0])
+
+
+def test_chainLevelsets():
+    """Test chaining of level set segments into polylines."""
+    v, t = _sphere()
+    vLVL, lLVL, _ = levelsetsTria(v, t, v[:, 2], 12.25)
+    chains, diagnostics = chainLevelsets(lLVL[0])
+
+    # a closed manifold surface results in a single closed contour
+    assert len(chains) == 1
+    assert chains[0][0] == chains[0][-1]
+    assert len(chains[0]) == len(lLVL[0]) + 1
+    assert set(chains[0]) == set(range(1, len(vLVL[0]) + 1))
+    assert diagnostics == {
+        "segments": len(lLVL[0]),
+        "closed": 1,
+        "open": 0,
+        "junctions": 0,
+    }
+
+    # open polylines and junctions are reported
+    chains, diagnostics = chainLevelsets([(1, 2), (2, 3), (2, 4), (5, 6)])
+    assert sum([len(x) - 1 for x in chains]) == 4
+    assert diagnostics == {"segments": 4, "closed": 0, "open": 3, "junctions": 1}
+
+
+def test_chainLevelsets_vertices():
+    """Test chaining of a level set that passes exactly through vertices."""
+    v, t = _sphere()
+
+    # the vertices at phi = 0 and the poles lie exactly on the level set, which
+    # results in duplicate points connected by zero-length segments
+    assert np.sum(v[:, 1] == 0) == 22
+    vLVL, lLVL, _ = levelsetsTria(v, t, v[:, 1], 0)
+    points = np.array(vLVL[0])
+    assert len(np.unique(points, axis=0)) < len(points)
+
+    # zero-length segments are contracted into a single closed contour
+    chains, diagnostics = chainLevelsets(lLVL[0], points=vLVL[0])
+    assert len(chains) == 1
+    assert diagnostics == {
+        "segments": len(chains[0]) - 1,
+        "closed": 1,
+        "open": 0,
+        "junctions": 0,
+    }
+    contour = points[chains[0] - 1, :]
+    assert len(np.unique(contour, axis=0)) == len(contour) - 1
+    assert len(contour) - 1 == len(np.unique(points, axis=0))
+
+    # a level set that only touches the surface at a vertex results in no
+    # contour, rather than a degenerate one
+    vLVL, lLVL, _ = levelsetsTria(v, t, v[:, 2], v[-1, 2])
+    assert len(lLVL[0]) > 0
+    chains, diagnostics = chainLevelsets(lLVL[0], points=vLVL[0])
+    assert chains == [] and diagnostics["segments"] == 0
+
+
+def test_levelsetsTriaMulti():
+    """Test that levelsetsTriaMulti is equivalent to levelsetsTria."""
+    v, t = _sphere()
+    levelsets = [-60, -30.5, 0, 12.25, 12.25, 49.9, 60]
+    for dim in range(3):
+        result = levelsetsTriaMulti(v, t, v[:, dim], levelsets)
+        assert len(result) == len(levelsets)
+        for lvl, lvlResult in zip(levelsets, result):
+            expected = levelsetsTria(v, t, v[:, dim], lvl)
+            assert lvlResult[0] == expected[0]
+            assert lvlResult[1] == expected[1]
+            np.testing.assert_array_equal(lvlResult[2][0], expected[2][0])
+
+
+def test_returnColorLUT():
+    """Test the numeric color look-up table."""
+    lut = returnColorLUT()
+    assert lut is returnColorLUT()
+
+    reference = returnFreeSurferColorLUT()
+    np.testing.assert_array_equal(lut["table"]["id"], reference[:, 0].astype(int))
+    np.testing.assert_allclose(
+        lut["table"]["rgba"][:, 0:3] * 255, reference[:, 2:5].astype(float), atol=1e-4
+    )
+    np.testing.assert_array_equal(
+        lut["index"][lut["table"]["id"]], range(len(lut["table"]))
+    )
+    assert np.sum(lut["index"] >= 0) == len(lut["table"])
+    assert not lut["index"].flags.writeable
+
+
+def test_decimateMesh():
+    """Test decimation of a closed mesh with vertex labels."""
+    v, t = _sphere(60)
+    labels = (v[:, 2] > 0).astype(int)
+
+    vd, td, labelsd = decimateMesh(v, t, 1000, labels=labels)
+    assert 500 < len(td) <= 1000
+    assert len(vd) == len(labelsd)
+    assert set(np.unique(td)) == set(range(len(vd)))
+
+    # the decimated mesh has no boundary edges and keeps its orientation
+    edges = np.concatenate((td[:, [0, 1]], td[:, [1, 2]], td[:, [2, 0]]))
+    assert {tuple(e) for e in edges} == {tuple(e) for e in edges[:, ::-1]}
+
+    # vertices stay close to the surface, labels to their hemisphere
+    r = np.linalg.norm(vd, axis=1)
+    assert np.all((r > 45) & (r < 55))
+    assert np.all(labelsd[vd[:, 2] > 10] == 1) and np.all(labelsd[vd[:, 2] < -10] == 0)
+
+    # the number of vertices does not limit the size of the mesh, e.g. due to
+    # an overflow of flat triangle indices
+    extra = np.repeat(v[:1], 2100000, axis=0)
+    vd, td = decimateMesh(np.concatenate((v, extra)), t, 1000)
+    assert 500 < len(td) <= 1000
+
+    # meshes that are small enough are returned unchanged
+    vd, td = decimateMesh(v, t, len(t))
+    assert vd is v and td is t